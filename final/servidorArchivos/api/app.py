@@ -4,10 +4,13 @@ import ssl
 import socket
 import json
 import logging
-import select
-from flask import Flask, request, jsonify, session, send_file
+import mimetypes
+import re
+from contextlib import contextmanager, ExitStack
+from flask import Flask, Response, request, jsonify, session
 from flask_cors import CORS
 from werkzeug.utils import secure_filename
+from werkzeug.http import http_date
 from dotenv import load_dotenv
 
 # Configuración básica
@@ -16,7 +19,9 @@ load_dotenv()
 
 # Importaciones de módulos propios
 from utils.ssl_utils import establecer_conexion_ssl
+from utils.protocolo import ClienteProtocolo
 from utils.config import verificar_configuracion_env
+from api.pool_sesiones import crear_pool
 
 # Verificar configuración del archivo .env
 verificar_configuracion_env()
@@ -42,11 +47,7 @@ CORS(app, supports_credentials=True, origins=["*"], allow_headers=["Content-Type
 # Configuración de conexión al servidor
 SERVER_HOST = os.getenv("SERVER_HOST", "127.0.0.1")
 SERVER_PORT = int(os.getenv("SERVER_PORT", 1608))
-UPLOAD_FOLDER = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "temp_uploads")
-
-# Crear directorio de uploads si no existe
-if not os.path.exists(UPLOAD_FOLDER):
-    os.makedirs(UPLOAD_FOLDER)
+MAX_RANGOS = 16  # Un Range con más rangos se ignora y se envía el archivo completo
 
 # Función para establecer conexión con el servidor de sockets
 def conectar_servidor():
@@ -65,83 +66,62 @@ def conectar_servidor():
         print(error_msg)
         raise
 
-# Función para enviar comando al servidor y recibir respuesta
-def enviar_comando(comando, conexion=None):
-    conexion_propia = conexion is None
-
+# Función para abrir una sesión con el servidor (negocia frames v2 si están disponibles)
+def abrir_sesion_servidor(usuario=None, password=None, token=None):
+    cliente = ClienteProtocolo(conectar_servidor())
     try:
-        if conexion_propia:
-            conexion = conectar_servidor()
-
-            # Autenticar si hay sesión activa
-            if 'usuario' in session and 'password' in session:
-                # Descartar mensaje de bienvenida
-                conexion.recv(1024)
-
-                # Enviar usuario
-                conexion.recv(1024)  # Descartar prompt
-                conexion.sendall(session['usuario'].encode('utf-8'))
+        cliente.negociar()
+        if token:
+            # Token del login: el servidor lo valida sin bcrypt; si venció, usar la contraseña
+            ok, _ = cliente.autenticar_token(token)
+            if ok:
+                return cliente
+        if usuario is not None:
+            ok, respuesta_auth = cliente.autenticar(usuario, password)
+            if not ok:
+                raise Exception(f"Error de autenticación: {respuesta_auth}")
+        return cliente
+    except Exception:
+        cliente.cerrar()
+        raise
 
-                # Enviar contraseña
-                conexion.recv(1024)  # Descartar prompt
-                conexion.sendall(session['password'].encode('utf-8'))
+# Sesiones autenticadas reutilizables, por usuario (ver api/pool_sesiones.py)
+pool_sesiones = crear_pool(abrir_sesion_servidor)
 
-                # Verificar autenticación
-                respuesta_auth = conexion.recv(1024).decode('utf-8')
-                if "✅ Autenticación exitosa" not in respuesta_auth:
-                    raise Exception("Error de autenticación")
+@contextmanager
+def sesion_servidor():
+    """Sesión del pool autenticada con las credenciales de la sesión Flask."""
+    with pool_sesiones.sesion(session['usuario'], session['password'], session.get('token')) as conexion:
+        if conexion.token:
+            session['token'] = conexion.token
+        yield conexion
 
-                # Descartar prompt de comando
-                conexion.recv(1024)
-            else:
-                # Si no hay sesión, solo descartar el mensaje de bienvenida
-                conexion.recv(1024)
-
-        # Enviar comando
-        conexion.sendall(comando.encode('utf-8'))
-
-        # Recibir respuesta (descartar prompt si es necesario)
-        if comando.upper() != "SALIR":
-            # Aumentar el tamaño del buffer y manejar respuestas grandes
-            buffer_size = 32768  # 32KB buffer
-            respuesta_completa = ""
-            while True:
-                parte = conexion.recv(buffer_size).decode('utf-8')
-                respuesta_completa += parte
-                
-                # Si la respuesta es más pequeña que el buffer, hemos terminado
-                if len(parte) < buffer_size:
-                    break
-                
-                # Verificar si hay más datos disponibles
-                # (Opcional: puedes agregar un pequeño timeout aquí)
-                conexion.settimeout(0.5)
-                try:
-                    if not select.select([conexion], [], [], 0.1)[0]:
-                        break
-                except:
-                    break
-                finally:
-                    # Restaurar timeout normal
-                    conexion.settimeout(None)
+# Función para enviar comando al servidor y recibir respuesta
+def enviar_comando(comando, conexion=None):
+    """
+    `conexion` puede ser una sesión ya abierta (ClienteProtocolo); si no se pasa,
+    se toma una del pool autenticada con las credenciales de la sesión Flask.
+    """
+    try:
+        if conexion is not None:
+            return conexion.comando(comando)
 
-            return respuesta_completa
+        if 'usuario' in session and 'password' in session:
+            with sesion_servidor() as conexion:
+                # La respuesta llega delimitada (frame v2 o prompt siguiente en texto)
+                return conexion.comando(comando)
 
-        return "Comando enviado"
+        # Sin sesión (p. ej. REGISTRAR): conexión propia, no se reutiliza
+        conexion = abrir_sesion_servidor()
+        try:
+            return conexion.comando(comando)
+        finally:
+            conexion.cerrar()
     except Exception as e:
         error_msg = f"Error al enviar comando '{comando}': {e}"
         logging.error(error_msg)
         print(error_msg)
         raise
-    finally:
-        if conexion_propia and conexion:
-            # Enviar SALIR para cerrar la conexión limpiamente
-            try:
-                conexion.sendall("SALIR".encode('utf-8'))
-                conexion.recv(1024)  # Descartar respuesta
-            except:
-                pass
-            conexion.close()
 
 # Rutas de la API
 
@@ -181,33 +161,26 @@ def login():
         user_id, permisos = auth_result
 
         # Luego autenticar con el servidor de sockets
-        conexion = conectar_servidor()
-
-        # Descartar mensaje de bienvenida
-        conexion.recv(1024)
-
-        # Enviar usuario
-        conexion.recv(1024)  # Descartar prompt
-        conexion.sendall(username.encode('utf-8'))
-
-        # Enviar contraseña
-        conexion.recv(1024)  # Descartar prompt
-        conexion.sendall(password.encode('utf-8'))
-
-        # Verificar autenticación
-        respuesta_auth = conexion.recv(1024).decode('utf-8')
+        cliente = ClienteProtocolo(conectar_servidor())
+        try:
+            cliente.negociar()
+            ok, respuesta_auth = cliente.autenticar(username, password)
+        except Exception:
+            cliente.cerrar()
+            raise
+        if ok:
+            # La sesión ya autenticada queda en el pool para las próximas solicitudes
+            pool_sesiones.devolver(username, password, cliente)
+        else:
+            cliente.cerrar()
 
-        if "✅ Autenticación exitosa" in respuesta_auth:
+        if ok:
             # Guardar en sesión
             session['usuario'] = username
             session['password'] = password  # Necesario para reautenticar en cada comando
+            session['token'] = cliente.token  # Reautenticación sin bcrypt (AUTH TOKEN)
             session['permisos'] = permisos  # Guardar permisos en la sesión
 
-            # Cerrar conexión limpiamente
-            conexion.recv(1024)  # Descartar prompt de comando
-            conexion.sendall("SALIR".encode('utf-8'))
-            conexion.close()
-
             return jsonify({
                 'success': True, 
                 'usuario': username,
@@ -246,280 +219,304 @@ def logout():
     session.clear()
     return jsonify({'success': True})
 
+# Listado: campos que puede pedir el cliente y criterios de orden (API -> LISTAR)
+CAMPOS_ARCHIVO = ('name', 'size', 'modified', 'type')
+ORDENES_LISTADO = {'name': 'nombre', 'size': 'tamaño', 'modified': 'fecha'}
+PAGINA_LISTADO_COMPLETO = 1000  # Sin limit, el listado completo se pide al servidor en páginas de este tamaño
+
 @app.route('/api/files', methods=['GET'])
 def list_files():
+    """
+    Parámetros opcionales: limit, cursor (next_cursor de la respuesta anterior),
+    prefix, sort (name, size o modified; con "-" adelante, descendente) y fields
+    (p. ej. "name,size"). Sin limit se devuelven todos los archivos.
+
+    El JSON se arma a medida que llegan las páginas del servidor: el primer
+    archivo sale sin esperar a que se lea todo el directorio.
+    """
     if 'usuario' not in session:
         logging.warning(f"Intento de listar archivos sin sesión activa")
         return jsonify({'error': 'No autenticado'}), 401
 
+    limit = request.args.get('limit')
+    if limit is not None and (not limit.isdigit() or int(limit) < 1):
+        return jsonify({'error': 'limit debe ser un entero positivo'}), 400
+    limit = int(limit) if limit else None
+    cursor = request.args.get('cursor') or None
+    prefix = request.args.get('prefix') or None
+    sort = request.args.get('sort', 'name')
+    if sort.lstrip('-') not in ORDENES_LISTADO:
+        return jsonify({'error': f"sort debe ser uno de {', '.join(ORDENES_LISTADO)} (con - adelante para descendente)"}), 400
+    orden = ('-' if sort.startswith('-') else '') + ORDENES_LISTADO[sort.lstrip('-')]
+    campos = request.args.get('fields', ','.join(CAMPOS_ARCHIVO)).split(',')
+    if not campos or any(campo not in CAMPOS_ARCHIVO for campo in campos):
+        return jsonify({'error': f"fields admite: {', '.join(CAMPOS_ARCHIVO)}"}), 400
+
+    pila = ExitStack()
     try:
         logging.info(f"Listando archivos para usuario: {session.get('usuario')}")
-        respuesta = enviar_comando("LISTAR")
-
-        # Log de la respuesta para debugging
-        logging.debug(f"Respuesta del servidor para LISTAR: {respuesta}")
-        print(f"Respuesta LISTAR: {respuesta}")
-
-        # Parsear la respuesta para extraer los archivos
-        files = []
-        if not respuesta or respuesta.strip() == "":
-            logging.warning("Respuesta vacía del servidor al listar archivos")
-            return jsonify({'files': [], 'warning': 'No se encontraron archivos'})
-
-        for line in respuesta.strip().split('\n'):
-            if line:
-                try:
-                    # Si la línea comienza con el emoji, quitar el emoji
-                    if line.startswith('📄 '):
-                        line = line[2:].strip()
-
-                    parts = line.strip().split()
-                    if len(parts) >= 1:  # Al menos debe tener un nombre de archivo
-                        name = parts[0]
-                        # Valores predeterminados en caso de que no haya información completa
-                        size = int(parts[1]) if len(parts) > 1 else 0
-                        date = ' '.join(parts[2:4]) if len(parts) > 3 else ''
-
-                        files.append({
-                            'name': name,
-                            'size': size,
-                            'modified': date,
-                            'type': 'file'
-                        })
-                except Exception as parse_error:
-                    logging.error(f"Error al parsear línea '{line}': {parse_error}")
-                    continue
-
-        logging.info(f"Se encontraron {len(files)} archivos")
-        return jsonify({'files': files})
+        conexion = pila.enter_context(sesion_servidor())
+        archivos, siguiente = conexion.listar_pagina(cursor, limit or PAGINA_LISTADO_COMPLETO, prefix, orden)
     except Exception as e:
+        pila.close()
         logging.error(f"Error al listar archivos: {e}")
-        print(f"Error al listar archivos: {e}")
         return jsonify({'error': f'Error al obtener archivos: {str(e)}'}), 500
+    if archivos is None:
+        # Cursor, límite u orden rechazados por el servidor
+        pila.close()
+        return jsonify({'error': siguiente}), 400
+
+    def _json(nombre, tamaño, fecha):
+        archivo = {'name': nombre, 'size': tamaño, 'modified': fecha, 'type': 'file'}
+        return json.dumps({campo: archivo[campo] for campo in campos}, ensure_ascii=False)
+
+    def generar(archivos, siguiente):
+        yield '{"files": ['
+        separador = ''
+        while True:
+            if archivos:
+                yield separador + ', '.join(_json(*archivo) for archivo in archivos)
+                separador = ', '
+            if limit or not siguiente:
+                break
+            archivos, siguiente = conexion.listar_pagina(siguiente, PAGINA_LISTADO_COMPLETO, prefix, orden)
+            if archivos is None:
+                raise RuntimeError(siguiente)
+        yield f'], "next_cursor": {json.dumps(siguiente if limit else None)}}}'
+
+    return _respuesta_en_streaming(pila, generar(archivos, siguiente), 200, {}, 'application/json')
 
 @app.route('/api/files/upload', methods=['POST'])
 def upload_file():
+    """
+    Acepta el archivo como cuerpo crudo (nombre en ?name=) o como multipart con
+    el campo 'file'. El contenido se reenvía al servidor a medida que se lee,
+    calculando el SHA-256 en el camino: sin archivo temporal ni segunda lectura.
+    """
     if 'usuario' not in session:
         return jsonify({'error': 'No autenticado'}), 401
 
-    if 'file' not in request.files:
-        return jsonify({'error': 'No se envió ningún archivo'}), 400
-
-    file = request.files['file']
-    if file.filename == '':
+    if request.mimetype == 'multipart/form-data':
+        # FormData: werkzeug ya separó el archivo del resto del formulario
+        if 'file' not in request.files:
+            return jsonify({'error': 'No se envió ningún archivo'}), 400
+        file = request.files['file']
+        nombre = file.filename
+        origen = file.stream
+        origen.seek(0, os.SEEK_END)
+        file_size = origen.tell()
+        origen.seek(0)
+    else:
+        # Cuerpo crudo: se lee directo del socket HTTP, sin tocar el disco
+        nombre = request.args.get('name', '')
+        file_size = request.content_length
+        origen = request.stream
+        if file_size is None:
+            return jsonify({'error': 'Falta el encabezado Content-Length'}), 411
+
+    if not nombre:
         return jsonify({'error': 'Nombre de archivo vacío'}), 400
+    filename = secure_filename(nombre)
+    if not filename:
+        return jsonify({'error': 'Nombre de archivo inválido'}), 400
 
-    filename = secure_filename(file.filename)
-    filepath = os.path.join(UPLOAD_FOLDER, filename)
+    # SHA-256 opcional del cliente: si el servidor ya tiene ese contenido, no se envía nada
+    sha256 = (request.args.get('sha256') or request.headers.get('X-Content-SHA256') or '').strip().lower()
+    if sha256 and not re.fullmatch(r'[0-9a-f]{64}', sha256):
+        return jsonify({'error': 'El SHA-256 debe tener 64 caracteres hexadecimales'}), 400
 
-    conexion = None
-    try:
-        # Guardar archivo temporalmente
-        file.save(filepath)
-        logging.info(f"Archivo guardado temporalmente en {filepath}")
-
-        # Calcular hash SHA-256
-        import hashlib
-        with open(filepath, 'rb') as f:
-            file_hash = hashlib.sha256(f.read()).hexdigest()
-            logging.info(f"Hash calculado para {filename}: {file_hash}")
-
-        # Obtener tamaño del archivo
-        file_size = os.path.getsize(filepath)
-        logging.info(f"Tamaño del archivo {filename}: {file_size} bytes")
-
-        # Verificar que el archivo no sea demasiado grande
-        max_size = 100 * 1024 * 1024  # 100 MB
-        if file_size > max_size:
-            return jsonify({'error': f'El archivo es demasiado grande. Tamaño máximo: {max_size/1024/1024} MB'}), 413
-
-        # Enviar comando de subida con hash
-        comando = f"SUBIR {filename} {file_hash}"
-        logging.info(f"Comando de subida: {comando}")
-
-        # Establecer conexión con timeout aumentado
-        try:
-            conexion = conectar_servidor()
-            # Configurar timeout más largo para archivos grandes
-            conexion.settimeout(300)  # 5 minutos
-        except Exception as e:
-            logging.error(f"Error al conectar con el servidor: {e}")
-            return jsonify({'error': f'Error al conectar con el servidor: {str(e)}'}), 500
+    # Verificar que el archivo no sea demasiado grande
+    max_size = 100 * 1024 * 1024  # 100 MB
+    if file_size > max_size:
+        return jsonify({'error': f'El archivo es demasiado grande. Tamaño máximo: {max_size/1024/1024} MB'}), 413
 
-        try:
-            # Autenticar
-            conexion.recv(1024)  # Descartar mensaje de bienvenida
-            conexion.recv(1024)  # Descartar prompt de usuario
-            conexion.sendall(session['usuario'].encode('utf-8'))
-            conexion.recv(1024)  # Descartar prompt de contraseña
-            conexion.sendall(session['password'].encode('utf-8'))
-            respuesta_auth = conexion.recv(1024).decode('utf-8')
-
-            if "✅ Autenticación exitosa" not in respuesta_auth:
-                logging.error(f"Error de autenticación: {respuesta_auth}")
-                return jsonify({'error': 'Error de autenticación'}), 401
-
-            # Descartar prompt de comando
-            conexion.recv(1024)
-
-            # Enviar comando de subida
-            conexion.sendall(comando.encode('utf-8'))
-            logging.info(f"Comando enviado: {comando}")
-
-            # Leer respuesta inicial (confirmación para enviar archivo)
-            respuesta = conexion.recv(1024).decode('utf-8')
-            logging.info(f"Respuesta del servidor: {respuesta}")
-        except socket.timeout as e:
-            logging.error(f"Timeout durante la autenticación o envío de comando: {e}")
-            return jsonify({'error': f'Tiempo de espera agotado durante la comunicación con el servidor: {str(e)}'}), 504
-        except Exception as e:
-            logging.error(f"Error durante la autenticación o envío de comando: {e}")
-            return jsonify({'error': f'Error durante la comunicación con el servidor: {str(e)}'}), 500
-
-        if "Listo para recibir" in respuesta:
-            try:
-                # Enviar archivo
-                with open(filepath, 'rb') as f:
-                    # Obtener tamaño del archivo
-                    f.seek(0, os.SEEK_END)
-                    tamaño = f.tell()
-                    f.seek(0)  # Volver al inicio del archivo
-                    
-                    logging.info(f"Iniciando transferencia de archivo {filename} ({tamaño} bytes)")
-                    
-                    # Enviar primero el tamaño del archivo
-                    conexion.sendall(str(tamaño).encode('utf-8') + b'\n')
-                    
-                    # Enviar el archivo en chunks para evitar problemas de memoria
-                    chunk_size = 8192  # 8KB chunks
-                    bytes_enviados = 0
-                    
-                    try:
-                        while bytes_enviados < tamaño:
-                            chunk = f.read(min(chunk_size, tamaño - bytes_enviados))
-                            if not chunk:
-                                break
-                            conexion.sendall(chunk)
-                            bytes_enviados += len(chunk)
-                            
-                            # Registrar progreso cada 1MB
-                            if bytes_enviados % (1024 * 1024) == 0:
-                                logging.info(f"Progreso: {bytes_enviados}/{tamaño} bytes ({bytes_enviados/tamaño*100:.1f}%)")
-                        
-                        logging.info(f"Transferencia completada: {bytes_enviados}/{tamaño} bytes para {filename}")
-                    except socket.timeout as e:
-                        logging.error(f"Timeout durante la transferencia del archivo: {e}")
-                        return jsonify({'error': f'Tiempo de espera agotado durante la transferencia del archivo. Intente con un archivo más pequeño o cuando la red esté menos congestionada.'}), 504
-                    except ConnectionError as e:
-                        logging.error(f"Error de conexión durante la transferencia: {e}")
-                        return jsonify({'error': f'La conexión se cerró durante la transferencia del archivo: {str(e)}'}), 500
-                
-                # Leer respuesta final
-                try:
-                    respuesta_final = conexion.recv(1024).decode('utf-8')
-                    logging.info(f"Respuesta final del servidor: {respuesta_final}")
-                except socket.timeout:
-                    logging.warning("Timeout al esperar respuesta final, pero el archivo podría haberse subido correctamente")
-                    return jsonify({'warning': 'No se recibió confirmación del servidor, pero el archivo podría haberse subido correctamente. Verifique en la lista de archivos.'}), 202
-                
-                if "✅" in respuesta_final:
-                    return jsonify({'success': True, 'message': 'Archivo subido correctamente'})
-                else:
-                    logging.error(f"Error en respuesta final: {respuesta_final}")
-                    return jsonify({'error': respuesta_final}), 500
-            except Exception as e:
-                logging.error(f"Error durante la transferencia del archivo: {e}")
-                return jsonify({'error': f'Error durante la transferencia del archivo: {str(e)}'}), 500
-        else:
-            logging.error(f"El servidor no está listo para recibir: {respuesta}")
-            return jsonify({'error': respuesta}), 500
+    try:
+        logging.info(f"Subiendo {filename} ({file_size} bytes)")
+        with sesion_servidor() as conexion:
+            # Timeout más largo para archivos grandes
+            timeout_anterior = conexion.conexion.gettimeout()
+            conexion.conexion.settimeout(300)  # 5 minutos
+            ok, respuesta = conexion.subir(filename, origen, file_size, sha256=sha256 or None)
+            conexion.conexion.settimeout(timeout_anterior)
+
+        if ok:
+            logging.info(f"Archivo {filename} subido: {respuesta}")
+            return jsonify({'success': True, 'message': 'Archivo subido correctamente',
+                            'transferido': 'sin transferir' not in respuesta})
+        logging.error(f"El servidor rechazó la subida de {filename}: {respuesta}")
+        return jsonify({'error': respuesta}), 500
+    except socket.timeout as e:
+        logging.error(f"Timeout durante la subida de {filename}: {e}")
+        return jsonify({'error': f'Tiempo de espera agotado durante la comunicación con el servidor: {str(e)}'}), 504
     except Exception as e:
         logging.error(f"Error al subir archivo: {e}")
         return jsonify({'error': f'Error al subir archivo: {str(e)}'}), 500
-    finally:
-        # Limpiar recursos
-        if conexion:
-            try:
-                conexion.sendall("SALIR".encode('utf-8'))
-                conexion.close()
-                logging.info("Conexión cerrada correctamente")
-            except:
-                logging.warning("No se pudo cerrar la conexión limpiamente")
-        
-        # Eliminar archivo temporal
-        if os.path.exists(filepath):
-            try:
-                os.remove(filepath)
-                logging.info(f"Archivo temporal eliminado: {filepath}")
-            except Exception as e:
-                logging.warning(f"No se pudo eliminar el archivo temporal {filepath}: {e}")
+
+def _etag(info):
+    """Versión del archivo según el servidor (mtime y tamaño), o None si no la informa."""
+    if info['mtime_ns'] is None:
+        return None
+    return f"{info['mtime_ns']:x}-{info['total']:x}"
+
+def _cabeceras_descarga(filename, info):
+    cabeceras = {'Accept-Ranges': 'bytes', 'Content-Disposition': f'attachment; filename="{filename}"'}
+    if info['mtime_ns'] is not None:
+        cabeceras['ETag'] = f'"{_etag(info)}"'
+        cabeceras['Last-Modified'] = http_date(info['mtime_ns'] // 1_000_000_000)
+    return cabeceras
+
+def _if_range_vigente(info):
+    """If-Range: los rangos valen solo si el archivo sigue siendo la versión que tiene el cliente."""
+    if_range = request.if_range
+    if if_range.etag:
+        return if_range.etag == _etag(info)
+    if if_range.date:
+        return info['mtime_ns'] is not None and info['mtime_ns'] // 1_000_000_000 == int(if_range.date.timestamp())
+    return True
+
+def _resolver_rangos(rangos, total):
+    """Segmentos [(inicio, fin exclusivo)] satisfacibles para un archivo de `total` bytes."""
+    segmentos = []
+    for inicio, fin in rangos:
+        if inicio < 0:
+            inicio, fin = max(0, total + inicio), total
+        else:
+            fin = total if fin is None else min(fin, total)
+        if inicio < fin:
+            segmentos.append((inicio, fin))
+    return segmentos
+
+def _leer_segmento(conexion, filename, inicio, fin, mtime_ns):
+    """Bloques de [inicio, fin) siempre que el archivo siga siendo la versión `mtime_ns`."""
+    canal, info = conexion.abrir_descarga(filename, inicio, fin - inicio)
+    if canal is None:
+        raise ConnectionError(info)
+    if info['mtime_ns'] != mtime_ns or info['bytes'] != fin - inicio:
+        # Cortar la respuesta: la sesión queda a mitad de la transferencia y se cierra
+        raise ConnectionError(f"'{filename}' cambió durante la descarga")
+    return conexion.leer_descarga(canal, info['bytes'])
+
+def _multipart_rangos(conexion, filename, segmentos, info, mimetype):
+    """Cuerpo multipart/byteranges y su longitud, sin leer todavía ningún segmento."""
+    separador = os.urandom(12).hex()
+    cabeceras = [
+        f"\r\n--{separador}\r\nContent-Type: {mimetype}\r\n"
+        f"Content-Range: bytes {inicio}-{fin - 1}/{info['total']}\r\n\r\n".encode('utf-8')
+        for inicio, fin in segmentos
+    ]
+    cierre = f"\r\n--{separador}--\r\n".encode('utf-8')
+
+    def cuerpo():
+        for cabecera, (inicio, fin) in zip(cabeceras, segmentos):
+            yield cabecera
+            yield from _leer_segmento(conexion, filename, inicio, fin, info['mtime_ns'])
+        yield cierre
+
+    longitud = sum(map(len, cabeceras)) + sum(fin - inicio for inicio, fin in segmentos) + len(cierre)
+    return cuerpo(), longitud, f"multipart/byteranges; boundary={separador}"
+
+def _respuesta_en_streaming(pila, bloques, status, cabeceras, mimetype):
+    """La sesión del pool (en `pila`) se devuelve cuando termina la respuesta, no al salir de la vista."""
+    def generar():
+        try:
+            yield from bloques
+        except BaseException as e:
+            # Incluye el cliente HTTP que corta: la sesión quedó a mitad de la transferencia
+            if not isinstance(e, GeneratorExit):
+                logging.error(f"Error al reenviar la respuesta: {e}")
+            pila.__exit__(type(e), e, e.__traceback__)
+            raise
+        pila.close()
+
+    return Response(generar(), status=status, mimetype=mimetype, headers=cabeceras)
+
+def _rango_no_satisfacible(total):
+    return Response(status=416, headers={'Content-Range': f'bytes */{total}', 'Accept-Ranges': 'bytes'})
 
 @app.route('/api/files/download/<filename>', methods=['GET'])
 def download_file(filename):
+    """
+    Reenvía el archivo al cliente HTTP a medida que llega del servidor, sin
+    copia local: el primer byte sale en cuanto el servidor empieza a enviar.
+    Respeta Range (uno o varios rangos) e If-Range para reanudar o bajar
+    segmentos en paralelo.
+    """
     if 'usuario' not in session:
         return jsonify({'error': 'No autenticado'}), 401
 
     filename = secure_filename(filename)
-    download_path = os.path.join(UPLOAD_FOLDER, filename)
+    mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    rangos = request.range
+    if rangos is not None and (rangos.units != 'bytes' or len(rangos.ranges) > MAX_RANGOS):
+        rangos = None  # Un Range que no se atiende se ignora: va el archivo completo
+    rangos = rangos.ranges if rangos is not None else None
 
+    pila = ExitStack()
     try:
-        # Establecer conexión
-        conexion = conectar_servidor()
-
-        # Autenticar
-        conexion.recv(1024)  # Descartar mensaje de bienvenida
-        conexion.recv(1024)  # Descartar prompt de usuario
-        conexion.sendall(session['usuario'].encode('utf-8'))
-        conexion.recv(1024)  # Descartar prompt de contraseña
-        conexion.sendall(session['password'].encode('utf-8'))
-        respuesta_auth = conexion.recv(1024).decode('utf-8')
-
-        if "✅ Autenticación exitosa" not in respuesta_auth:
-            return jsonify({'error': 'Error de autenticación'}), 401
-
-        # Descartar prompt de comando
-        conexion.recv(1024)
-
-        # Enviar comando de descarga
-        comando = f"DESCARGAR {filename}"
-        conexion.sendall(comando.encode('utf-8'))
-
-        # Leer respuesta inicial
-        respuesta = conexion.recv(1024).decode('utf-8')
-
-        if "Listo para enviar" in respuesta:
-            # Enviar confirmación "LISTO" al servidor
-            conexion.sendall("LISTO".encode('utf-8'))
-            # Recibir y guardar archivo
-            with open(download_path, 'wb') as f:
-                while True:
-                    data = conexion.recv(8192)
-                    if not data:
-                        break
-                    f.write(data)
-
-            # Cerrar conexión
-            conexion.close()
-
-            # Enviar archivo al cliente y luego eliminarlo
-            response = send_file(download_path, as_attachment=True, download_name=filename)
-
-            # Eliminar archivo después de enviarlo
-            @response.call_on_close
-            def on_close():
-                if os.path.exists(download_path):
-                    os.remove(download_path)
-
-            return response
+        conexion = pila.enter_context(sesion_servidor())
+
+        if rangos and len(rangos) == 1 and not (request.if_range.etag or request.if_range.date):
+            # Un solo rango: el servidor lo resuelve, sin consultar antes el tamaño
+            inicio, fin = rangos[0]
+            if inicio < 0:
+                canal, info = conexion.abrir_descarga(filename, inicio)
+            else:
+                canal, info = conexion.abrir_descarga(filename, inicio, None if fin is None else fin - inicio)
+            if canal is not None and info['bytes'] == 0:
+                for _ in conexion.leer_descarga(canal, 0):
+                    pass
+                pila.close()
+                return _rango_no_satisfacible(info['total'])
+        elif rangos:
+            # Varios rangos o If-Range: hacen falta el tamaño y la versión antes de pedir los segmentos
+            canal, info = conexion.abrir_descarga(filename, 0, 0)
+            if canal is not None:
+                for _ in conexion.leer_descarga(canal, 0):
+                    pass
+                if not _if_range_vigente(info):
+                    rangos = None
+                    canal, info = conexion.abrir_descarga(filename)
         else:
-            return jsonify({'error': respuesta}), 500
+            canal, info = conexion.abrir_descarga(filename)
     except Exception as e:
+        pila.__exit__(*sys.exc_info())
         logging.error(f"Error al descargar archivo: {e}")
-        # Asegurarse de eliminar el archivo temporal si existe
-        if os.path.exists(download_path):
-            os.remove(download_path)
         return jsonify({'error': f'Error al descargar archivo: {str(e)}'}), 500
 
+    if canal is None:
+        pila.close()
+        total = re.search(r"Rango fuera del archivo .* total=(\d+)", info)
+        if total:
+            return _rango_no_satisfacible(int(total.group(1)))
+        return jsonify({'error': info}), 500
+
+    cabeceras = _cabeceras_descarga(filename, info)
+    if not rangos:
+        cabeceras['Content-Length'] = str(info['bytes'])
+        return _respuesta_en_streaming(pila, conexion.leer_descarga(canal, info['bytes']), 200, cabeceras, mimetype)
+
+    if info['bytes'] > 0:
+        # Rango único ya abierto
+        cabeceras['Content-Length'] = str(info['bytes'])
+        cabeceras['Content-Range'] = f"bytes {info['desde']}-{info['desde'] + info['bytes'] - 1}/{info['total']}"
+        return _respuesta_en_streaming(pila, conexion.leer_descarga(canal, info['bytes']), 206, cabeceras, mimetype)
+
+    segmentos = _resolver_rangos(rangos, info['total'])
+    if not segmentos:
+        pila.close()
+        return _rango_no_satisfacible(info['total'])
+
+    if len(segmentos) == 1:
+        inicio, fin = segmentos[0]
+        bloques = _leer_segmento(conexion, filename, inicio, fin, info['mtime_ns'])
+        cabeceras['Content-Length'] = str(fin - inicio)
+        cabeceras['Content-Range'] = f"bytes {inicio}-{fin - 1}/{info['total']}"
+        return _respuesta_en_streaming(pila, bloques, 206, cabeceras, mimetype)
+
+    bloques, longitud, tipo = _multipart_rangos(conexion, filename, segmentos, info, mimetype)
+    cabeceras['Content-Length'] = str(longitud)
+    return _respuesta_en_streaming(pila, bloques, 206, cabeceras, tipo)
+
 @app.route('/api/files/<filename>', methods=['DELETE'])
 def delete_file(filename):
     if 'usuario' not in session:
@@ -575,86 +572,55 @@ def verify_file(filename):
     filename = secure_filename(filename)
 
     try:
-        comando = f"VERIFICAR {filename}"
-        respuesta = enviar_comando(comando)
-
-        # Extraer información relevante de la respuesta
-        estado = "desconocido"
-        detalles = ""
+        # Ambos comandos comparten una sesión del pool
+        with sesion_servidor() as conexion:
+            comando = f"VERIFICAR {filename}"
+            respuesta = enviar_comando(comando, conexion)
+
+            # Extraer información relevante de la respuesta
+            estado = "desconocido"
+            detalles = ""
         
-        # Verificar si hay información de verificación
-        if "No hay información de verificación" in respuesta:
-            estado = "sin_info"
-            detalles = "No se encontró información de verificación para este archivo. Intente subir el archivo nuevamente."
-        # Verificar estado basado en el contenido de la respuesta
-        elif "OK -" in respuesta or "ok" in respuesta.lower():
-            estado = "ok"
-            detalles = "El archivo ha sido verificado y está en buen estado."
-        elif "CORRUPTO" in respuesta:
-            estado = "corrupto"
-            detalles = "El archivo está corrupto o ha sido modificado."
-        elif "INFECTADO" in respuesta:
-            estado = "infectado"
-            detalles = "El archivo podría contener malware."
+            # Verificar si hay información de verificación
+            if "No hay información de verificación" in respuesta:
+                estado = "sin_info"
+                detalles = "No se encontró información de verificación para este archivo. Intente subir el archivo nuevamente."
+            # Verificar estado basado en el contenido de la respuesta
+            elif "OK -" in respuesta or "ok" in respuesta.lower():
+                estado = "ok"
+                detalles = "El archivo ha sido verificado y está en buen estado."
+            elif "CORRUPTO" in respuesta:
+                estado = "corrupto"
+                detalles = "El archivo está corrupto o ha sido modificado."
+            elif "INFECTADO" in respuesta:
+                estado = "infectado"
+                detalles = "El archivo podría contener malware."
         
-        # Extraer información adicional si está disponible
-        info_integridad = None
-        info_virus = None
+            # Extraer información adicional si está disponible
+            info_integridad = None
+            info_virus = None
         
-        if "Integridad: " in respuesta:
-            try:
-                info_integridad = respuesta.split("Integridad: ")[1].split(" -")[0].strip()
-            except:
-                pass
+            if "Integridad: " in respuesta:
+                try:
+                    info_integridad = respuesta.split("Integridad: ")[1].split(" -")[0].strip()
+                except:
+                    pass
                 
-        if "Antivirus: " in respuesta:
-            try:
-                info_virus = respuesta.split("Antivirus: ")[1].split(" -")[0].strip()
-            except:
-                pass
-        
-        # Obtener el hash del archivo .hash si existe
-        hash_value = None
-        hash_file_path = os.path.join(os.getenv("SERVIDOR_DIR"), f"{filename}.hash")
+            if "Antivirus: " in respuesta:
+                try:
+                    info_virus = respuesta.split("Antivirus: ")[1].split(" -")[0].strip()
+                except:
+                    pass
         
-        # Verificar si existe el archivo de hash en el servidor
-        try:
-            # Enviar comando para verificar si existe el archivo hash
-            hash_check = enviar_comando(f"LISTAR {filename}.hash")
-            logging.info(f"Resultado de verificación de existencia del hash: {hash_check}")
-            
-            if "No hay archivos" not in hash_check and "no encontrado" not in hash_check:
-                # El archivo hash existe, obtener su contenido
-                hash_response = enviar_comando(f"DESCARGAR {filename}.hash")
-                logging.info(f"Respuesta completa al descargar hash: {hash_response}")
-                
-                # Limpiar el hash (eliminar mensajes adicionales)
-                if hash_response:
-                    # Método 1: Extraer después del checkmark
-                    if "✅" in hash_response:
-                        hash_value = hash_response.split("✅")[1].strip()
-                        logging.info(f"Hash después de split por ✅: {hash_value}")
-                        
-                        # Limpiar cualquier texto adicional después del hash
-                        if "enviado correctamente" in hash_value:
-                            hash_value = hash_value.split("enviado correctamente")[0].strip()
-                        
-                        # Eliminar cualquier texto que no sea parte del hash (64 caracteres hexadecimales)
-                        import re
-                        hash_match = re.search(r'[0-9a-f]{64}', hash_value)
-                        if hash_match:
-                            hash_value = hash_match.group(0)
-                    
-                    # Método 2: Si el método 1 falló, intentar extraer directamente el patrón de hash
-                    if not hash_value or len(hash_value) != 64:
-                        import re
-                        hash_match = re.search(r'[0-9a-f]{64}', hash_response)
-                        if hash_match:
-                            hash_value = hash_match.group(0)
-                
-                logging.info(f"Hash final extraído: {hash_value}")
-        except Exception as e:
-            logging.warning(f"No se pudo obtener el hash para {filename}: {e}")
+            # Hashes y autor desde los metadatos del servidor (INFO), sin descargar archivos .hash
+            hash_value = None
+            info = None
+            try:
+                info = conexion.info_archivo(filename)
+                if info:
+                    hash_value = info.get('sha256_esperado')
+            except Exception as e:
+                logging.warning(f"No se pudo obtener el hash para {filename}: {e}")
 
         return jsonify({
             'success': True, 
@@ -664,6 +630,8 @@ def verify_file(filename):
             'integrity': info_integridad,
             'antivirus': info_virus,
             'hash': hash_value,  # Añadir el hash a la respuesta
+            'computed_hash': info.get('sha256_calculado') if info else None,
+            'uploaded_by': info.get('usuario') if info else None,
             'message': respuesta
         })
     except Exception as e:
@@ -0,0 +1,191 @@
+import os
+import hmac
+import time
+import atexit
+import select
+import logging
+import hashlib
+import threading
+from contextlib import contextmanager
+
+# Pool de sesiones autenticadas con el servidor de archivos, por usuario. Cada
+# solicitud HTTP toma una sesión ya negociada y autenticada, ejecuta sus
+# comandos y la devuelve: el costo pasa a ser un ida y vuelta por comando en
+# lugar de handshake TLS + login + SALIR.
+#
+# Las sesiones inactivas ocupan un lugar en el servidor (un hilo en el motor de
+# hilos y una entrada en el límite por IP), por eso el pool es acotado y las
+# que no se usan por API_POOL_INACTIVIDAD segundos se cierran.
+
+# ⚙️ Configuración (variables de entorno)
+MAX_POR_USUARIO = int(os.getenv("API_POOL_MAX_POR_USUARIO", 4))   # Sesiones inactivas por usuario
+MAX_TOTAL = int(os.getenv("API_POOL_MAX_TOTAL", 16))               # Sesiones inactivas en total (0: sin pool)
+INACTIVIDAD = float(os.getenv("API_POOL_INACTIVIDAD", 60))         # Segundos antes de cerrar una inactiva
+
+logger = logging.getLogger(__name__)
+
+
+class PoolSesiones:
+    """
+    Sesiones inactivas por (usuario, huella de la contraseña). `fabrica(usuario,
+    password, token)` abre una sesión nueva ya autenticada (ClienteProtocolo).
+    """
+
+    def __init__(self, fabrica, max_por_usuario=MAX_POR_USUARIO, max_total=MAX_TOTAL, inactividad=INACTIVIDAD):
+        self._fabrica = fabrica
+        self.max_por_usuario = max_por_usuario
+        self.max_total = max_total
+        self.inactividad = inactividad
+        self._lock = threading.Lock()
+        self._inactivas = {}   # clave -> [(cliente, último uso)], la más reciente al final
+        self._total = 0
+        self._secreto = os.urandom(32)  # La contraseña no se guarda, solo su huella
+        self._limpiador = None
+        self._contadores = {'reutilizadas': 0, 'creadas': 0, 'descartadas': 0, 'expiradas': 0}
+
+    # --- API ---
+
+    @contextmanager
+    def sesion(self, usuario, password, token=None):
+        """
+        Presta una sesión autenticada como `usuario`. Vuelve al pool si el bloque
+        termina sin error; si falla, se cierra (puede haber quedado a mitad de
+        una respuesta).
+        """
+        clave = self._clave(usuario, password)
+        cliente = self._tomar(clave) or self._crear(usuario, password, token)
+        try:
+            yield cliente
+        except BaseException:
+            self._cerrar([cliente])
+            raise
+        self.devolver(usuario, password, cliente)
+
+    def devolver(self, usuario, password, cliente):
+        """Deja en el pool una sesión autenticada como `usuario` que ya no se usa."""
+        clave = self._clave(usuario, password)
+        sobrantes = []
+        with self._lock:
+            if self.max_total <= 0:
+                sobrantes.append(cliente)
+            else:
+                lista = self._inactivas.setdefault(clave, [])
+                lista.append((cliente, time.monotonic()))
+                self._total += 1
+                if len(lista) > self.max_por_usuario:
+                    sobrantes.append(lista.pop(0)[0])
+                    self._total -= 1
+                while self._total > self.max_total:
+                    sobrantes.append(self._quitar_mas_antigua())
+                self._iniciar_limpiador()
+        self._cerrar(sobrantes)
+
+    def purgar(self):
+        """Cierra las sesiones inactivas por más de `inactividad` segundos."""
+        limite = time.monotonic() - self.inactividad
+        vencidas = []
+        with self._lock:
+            for clave in list(self._inactivas):
+                lista = self._inactivas[clave]
+                while lista and lista[0][1] < limite:
+                    vencidas.append(lista.pop(0)[0])
+                    self._total -= 1
+                if not lista:
+                    del self._inactivas[clave]
+            self._contadores['expiradas'] += len(vencidas)
+        self._cerrar(vencidas)
+
+    def cerrar_todas(self):
+        with self._lock:
+            clientes = [cliente for lista in self._inactivas.values() for cliente, _ in lista]
+            self._inactivas.clear()
+            self._total = 0
+        self._cerrar(clientes)
+
+    def estadisticas(self):
+        with self._lock:
+            return {**self._contadores, 'inactivas': self._total, 'usuarios': len(self._inactivas)}
+
+    # --- internos ---
+
+    def _clave(self, usuario, password):
+        huella = hmac.new(self._secreto, (password or "").encode('utf-8'), hashlib.sha256).hexdigest()
+        return usuario, huella
+
+    def _tomar(self, clave):
+        while True:
+            with self._lock:
+                lista = self._inactivas.get(clave)
+                if not lista:
+                    return None
+                cliente, ultimo_uso = lista.pop()
+                self._total -= 1
+                if not lista:
+                    del self._inactivas[clave]
+            if time.monotonic() - ultimo_uso <= self.inactividad and _sana(cliente):
+                with self._lock:
+                    self._contadores['reutilizadas'] += 1
+                return cliente
+            with self._lock:
+                self._contadores['descartadas'] += 1
+            self._cerrar([cliente])
+
+    def _crear(self, usuario, password, token):
+        cliente = self._fabrica(usuario, password, token)
+        with self._lock:
+            self._contadores['creadas'] += 1
+        return cliente
+
+    def _quitar_mas_antigua(self):
+        clave = min(self._inactivas, key=lambda c: self._inactivas[c][0][1])
+        lista = self._inactivas[clave]
+        cliente = lista.pop(0)[0]
+        if not lista:
+            del self._inactivas[clave]
+        self._total -= 1
+        return cliente
+
+    def _iniciar_limpiador(self):
+        if self._limpiador is None:
+            self._limpiador = threading.Thread(target=self._limpiar, name="pool-sesiones", daemon=True)
+            self._limpiador.start()
+
+    def _limpiar(self):
+        while True:
+            time.sleep(max(self.inactividad / 2, 1))
+            try:
+                self.purgar()
+            except Exception as error:
+                logger.error(f"❌ Error al purgar el pool de sesiones: {error}")
+
+    @staticmethod
+    def _cerrar(clientes):
+        for cliente in clientes:
+            try:
+                cliente.cerrar()
+            except Exception:
+                pass
+
+
+def _sana(cliente):
+    """
+    Una sesión inactiva no debería tener nada para leer: si el socket está
+    legible, el servidor la cerró (EOF) o quedó una respuesta sin consumir.
+    """
+    conexion = cliente.conexion
+    try:
+        if conexion.fileno() < 0:
+            return False
+        if hasattr(conexion, 'pending') and conexion.pending():
+            return False
+        legibles, _, _ = select.select([conexion], [], [], 0)
+        return not legibles
+    except (OSError, ValueError):
+        return False
+
+
+def crear_pool(fabrica):
+    """Pool con la configuración del entorno; sus sesiones se cierran al salir."""
+    pool = PoolSesiones(fabrica)
+    atexit.register(pool.cerrar_todas)
+    return pool
@@ -1,8 +1,12 @@
 
 import os
+import time
+import atexit
+import queue
 import sqlite3
 import logging
-from datetime import datetime
+import threading
+from datetime import datetime, timezone
 from dotenv import load_dotenv
 
 # 📦 Cargar variables de entorno
@@ -14,6 +18,19 @@ logger = logging.getLogger(__name__)
 # 🔧 Constantes para la base de datos
 DEFAULT_DB_FILENAME = 'servidor_archivos.db'
 
+# ⚙️ Configuración (variables de entorno)
+DB_POOL_CONEXIONES = int(os.getenv("DB_POOL_CONEXIONES", 8))          # Conexiones reutilizables por proceso
+DB_POOL_ESPERA = float(os.getenv("DB_POOL_ESPERA", 5))                # Segundos esperando una libre antes de abrir una extra
+DB_CACHE_SENTENCIAS = int(os.getenv("DB_CACHE_SENTENCIAS", 256))      # Sentencias preparadas por conexión
+DB_CACHE_KB = int(os.getenv("DB_CACHE_KB", 16 * 1024))                # Caché de páginas por conexión
+DB_MMAP_BYTES = int(os.getenv("DB_MMAP_BYTES", 128 * 1024 * 1024))    # Lecturas por mmap (0: desactivado)
+DB_BUSY_TIMEOUT_MS = int(os.getenv("DB_BUSY_TIMEOUT_MS", 5000))
+DB_LOG_COLA = int(os.getenv("DB_LOG_COLA", 10000))                    # Eventos pendientes de escribir
+DB_LOG_LOTE = int(os.getenv("DB_LOG_LOTE", 500))                      # Eventos por transacción
+DB_LOG_INTERVALO = float(os.getenv("DB_LOG_INTERVALO", 0.2))          # Segundos máximos antes de escribir un lote
+DB_LOG_POLITICA = os.getenv("DB_LOG_POLITICA", "bloquear")            # Cola llena: bloquear | descartar
+DB_LOG_ESPERA = float(os.getenv("DB_LOG_ESPERA", 1))                  # Con "bloquear": segundos antes de escribir directo
+
 # 📋 Definiciones de tablas
 TABLA_USUARIOS = '''
 CREATE TABLE IF NOT EXISTS usuarios (
@@ -46,10 +63,263 @@ CREATE TABLE IF NOT EXISTS log_eventos (
 )
 '''
 
-def obtener_conexion():
-    db_path = os.getenv('DB_PATH', os.path.join(os.path.dirname(__file__), DEFAULT_DB_FILENAME))
+TABLA_METADATOS_ARCHIVOS = '''
+CREATE TABLE IF NOT EXISTS metadatos_archivos (
+    directorio TEXT NOT NULL,
+    nombre TEXT NOT NULL,
+    bytes INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    inode INTEGER NOT NULL,
+    sha256 TEXT,
+    PRIMARY KEY (directorio, nombre)
+)
+'''
+
+# Listado paginado por tamaño o fecha: recorre el índice desde el cursor sin ordenar todo el directorio
+INDICES_ORDEN_METADATOS = (
+    "CREATE INDEX IF NOT EXISTS idx_metadatos_bytes ON metadatos_archivos (directorio, bytes, nombre)",
+    "CREATE INDEX IF NOT EXISTS idx_metadatos_mtime ON metadatos_archivos (directorio, mtime_ns, nombre)",
+)
+
+TABLA_DIRECTORIOS_INDEXADOS = '''
+CREATE TABLE IF NOT EXISTS directorios_indexados (
+    directorio TEXT PRIMARY KEY,
+    mtime_ns INTEGER NOT NULL
+)
+'''
+
+TABLA_VERIFICACIONES = '''
+CREATE TABLE IF NOT EXISTS verificaciones (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    directorio TEXT NOT NULL,
+    nombre TEXT NOT NULL,
+    sha256 TEXT,
+    estado TEXT NOT NULL,
+    integridad TEXT,
+    virus TEXT,
+    mensaje TEXT,
+    fecha TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+)
+'''
+
+# Última verificación de un archivo: (directorio, nombre) y el id más alto
+INDICE_VERIFICACIONES_ARCHIVO = '''
+CREATE INDEX IF NOT EXISTS idx_verificaciones_archivo ON verificaciones (directorio, nombre, id)
+'''
+
+TABLA_SUBIDAS = '''
+CREATE TABLE IF NOT EXISTS subidas (
+    id TEXT PRIMARY KEY,
+    usuario_id INTEGER,
+    directorio TEXT NOT NULL,
+    nombre TEXT NOT NULL,
+    bytes INTEGER NOT NULL,
+    bloque INTEGER NOT NULL,
+    sha256 TEXT,
+    actualizada REAL NOT NULL
+)
+'''
+
+TABLA_SUBIDAS_BLOQUES = '''
+CREATE TABLE IF NOT EXISTS subidas_bloques (
+    subida_id TEXT NOT NULL,
+    numero INTEGER NOT NULL,
+    PRIMARY KEY (subida_id, numero)
+) WITHOUT ROWID
+'''
+
+TABLA_INFO_ARCHIVOS = '''
+CREATE TABLE IF NOT EXISTS info_archivos (
+    directorio TEXT NOT NULL,
+    nombre TEXT NOT NULL,
+    sha256_esperado TEXT,
+    usuario_id INTEGER,
+    creado REAL NOT NULL,
+    actualizado REAL NOT NULL,
+    PRIMARY KEY (directorio, nombre)
+)
+'''
+
+# 🔌 Pool de conexiones: cada proceso reutiliza hasta DB_POOL_CONEXIONES conexiones
+# ya abiertas y configuradas (WAL, synchronous=NORMAL, mmap, caché de páginas y de
+# sentencias) en lugar de abrir una por consulta. obtener_conexion() entrega una
+# conexión en uso exclusivo; close() la devuelve al pool con la transacción cerrada.
+
+def _ruta_db():
+    return os.getenv('DB_PATH', os.path.join(os.path.dirname(__file__), DEFAULT_DB_FILENAME))
+
+
+def _abrir_conexion(db_path):
     logger.debug(f"🔌 Conectando a la base de datos: {db_path}")
-    return sqlite3.connect(db_path)
+    conn = sqlite3.connect(db_path, timeout=DB_BUSY_TIMEOUT_MS / 1000, check_same_thread=False,
+                           cached_statements=DB_CACHE_SENTENCIAS)
+    # WAL: los lectores no bloquean al escritor; con WAL, NORMAL sigue siendo consistente ante caídas
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(f"PRAGMA cache_size=-{DB_CACHE_KB}")
+    conn.execute(f"PRAGMA mmap_size={DB_MMAP_BYTES}")
+    conn.execute(f"PRAGMA busy_timeout={DB_BUSY_TIMEOUT_MS}")
+    return conn
+
+
+class _PoolConexiones:
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.pid = os.getpid()
+        self._libres = queue.LifoQueue()  # La más reciente tiene la caché más caliente
+        self._lock = threading.Lock()
+        self._abiertas = 0
+        self._contadores = {
+            'db_pool_aciertos': 0, 'db_pool_creadas': 0, 'db_pool_esperas': 0,
+            'db_pool_extra': 0, 'db_pool_espera_ms': 0.0,
+        }
+
+    def _contar(self, clave, delta=1):
+        with self._lock:
+            self._contadores[clave] += delta
+
+    def tomar(self):
+        try:
+            conn = self._libres.get_nowait()
+            self._contar('db_pool_aciertos')
+            return _ConexionDelPool(self, conn)
+        except queue.Empty:
+            pass
+
+        with self._lock:
+            crear = self._abiertas < DB_POOL_CONEXIONES
+            if crear:
+                self._abiertas += 1
+        if crear:
+            try:
+                conn = _abrir_conexion(self.db_path)
+            except Exception:
+                with self._lock:
+                    self._abiertas -= 1
+                raise
+            self._contar('db_pool_creadas')
+            return _ConexionDelPool(self, conn)
+
+        # Pool agotado: esperar a que se libere una
+        inicio = time.perf_counter()
+        try:
+            conn = self._libres.get(timeout=DB_POOL_ESPERA)
+        except queue.Empty:
+            conn = None
+        with self._lock:
+            self._contadores['db_pool_esperas'] += 1
+            self._contadores['db_pool_espera_ms'] += (time.perf_counter() - inicio) * 1000
+        if conn is not None:
+            return _ConexionDelPool(self, conn)
+
+        # Nadie la liberó a tiempo: una conexión extra que se cierra al devolverla
+        logger.warning(f"⚠️ Pool de SQLite agotado ({DB_POOL_CONEXIONES} conexiones); abriendo una extra")
+        self._contar('db_pool_extra')
+        return _ConexionDelPool(self, _abrir_conexion(self.db_path), extra=True)
+
+    def devolver(self, conn, extra):
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            extra = True  # Conexión inutilizable
+        if extra or os.getpid() != self.pid:
+            conn.close()
+            if not extra:
+                with self._lock:
+                    self._abiertas -= 1
+            return
+        self._libres.put(conn)
+
+    def estadisticas(self):
+        with self._lock:
+            datos = dict(self._contadores)
+            datos['db_pool_abiertas'] = self._abiertas
+        datos['db_pool_libres'] = self._libres.qsize()
+        esperas = datos.pop('db_pool_espera_ms')
+        datos['db_pool_espera_promedio_ms'] = round(esperas / datos['db_pool_esperas'], 2) \
+            if datos['db_pool_esperas'] else 0
+        return datos
+
+
+class _ConexionDelPool:
+    """Conexión prestada por el pool: delega en sqlite3.Connection y close() la devuelve."""
+
+    def __init__(self, pool, conn, extra=False):
+        self._pool = pool
+        self._conn = conn
+        self._extra = extra
+
+    def __getattr__(self, nombre):
+        conn = self.__dict__.get('_conn')
+        if conn is None:
+            raise sqlite3.ProgrammingError("Cannot operate on a closed database.")
+        return getattr(conn, nombre)
+
+    def __enter__(self):
+        self._conn.__enter__()
+        return self
+
+    def __exit__(self, *excepcion):
+        return self._conn.__exit__(*excepcion)
+
+    def close(self):
+        conn, self._conn = self._conn, None
+        if conn is not None:
+            self._pool.devolver(conn, self._extra)
+
+    def __del__(self):
+        # Un camino de error que no llamó a close() no debe dejar la conexión fuera del pool
+        try:
+            self.close()
+        except Exception:
+            pass
+
+
+_pools = {}
+_lock_pools = threading.Lock()
+
+
+def _obtener_pool():
+    db_path = _ruta_db()
+    with _lock_pools:
+        pool = _pools.get(db_path)
+        if pool is None or pool.pid != os.getpid():
+            # Proceso hijo (fork): las conexiones del padre no se comparten
+            pool = _pools[db_path] = _PoolConexiones(db_path)
+        return pool
+
+
+def obtener_conexion():
+    return _obtener_pool().tomar()
+
+
+def estadisticas_pool():
+    return _obtener_pool().estadisticas()
+
+
+# Sentencias CREATE ... IF NOT EXISTS ya ejecutadas en este proceso
+_ddl_ejecutado = set()
+_lock_ddl = threading.Lock()
+
+
+def asegurar_tablas(conn, *ddl):
+    """
+    Ejecuta las sentencias de `ddl` que este proceso todavía no ejecutó. Es
+    para los módulos que crean sus tablas al primer uso, en procesos que no
+    pasan por crear_tablas() (worker de Celery, API).
+    """
+    if _ddl_ejecutado.issuperset(ddl):
+        return
+    with _lock_ddl:
+        # Otro hilo pudo ejecutarlas mientras se esperaba el lock
+        pendientes = [sentencia for sentencia in ddl if sentencia not in _ddl_ejecutado]
+        if not pendientes:
+            return
+        for sentencia in pendientes:
+            conn.execute(sentencia)
+        conn.commit()
+        _ddl_ejecutado.update(pendientes)
 
 def crear_tablas():
     try:
@@ -68,6 +338,27 @@ def crear_tablas():
         logger.debug("🗃️ Creando tabla de log_eventos...")
         cursor.execute(TABLA_LOG_EVENTOS)
 
+        # Crear tablas del índice de metadatos de archivos
+        logger.debug("🗃️ Creando tablas de metadatos de archivos...")
+        cursor.execute(TABLA_METADATOS_ARCHIVOS)
+        for indice in INDICES_ORDEN_METADATOS:
+            cursor.execute(indice)
+        cursor.execute(TABLA_DIRECTORIOS_INDEXADOS)
+
+        # Crear tabla de resultados de verificación
+        logger.debug("🗃️ Creando tabla de verificaciones...")
+        cursor.execute(TABLA_VERIFICACIONES)
+        cursor.execute(INDICE_VERIFICACIONES_ARCHIVO)
+
+        # Crear tablas de las subidas por bloques
+        logger.debug("🗃️ Creando tablas de subidas por bloques...")
+        cursor.execute(TABLA_SUBIDAS)
+        cursor.execute(TABLA_SUBIDAS_BLOQUES)
+
+        # Crear tabla de metadatos por archivo (antes archivos .hash/.sha256)
+        logger.debug("🗃️ Creando tabla de información de archivos...")
+        cursor.execute(TABLA_INFO_ARCHIVOS)
+
         conn.commit()
         conn.close()
 
@@ -151,41 +442,187 @@ def autenticar_usuario(username, password):
         logger.error(f"❌ Error en autenticación de {username}: {error}")
         return None
 
-def registrar_log(usuario_id, accion, archivo=None):
-    try:
-        # 🔌 Obtener conexión y registrar el log
+# 📝 Escritor de logs en segundo plano: registrar_log y log_evento encolan el
+# evento y un hilo lo escribe junto con los demás en una sola transacción (un
+# commit por lote en lugar de uno por evento). Un lote se escribe al juntar
+# DB_LOG_LOTE eventos o DB_LOG_INTERVALO segundos después del primero. Con la
+# cola llena, la política "bloquear" espera DB_LOG_ESPERA segundos y después
+# escribe el evento en el hilo que lo generó; "descartar" lo descarta y lo
+# cuenta. Al terminar el proceso se escribe todo lo pendiente.
+
+SQL_INSERTAR_LOG = "INSERT INTO logs (usuario_id, accion, archivo, fecha) VALUES (?, ?, ?, ?)"
+SQL_INSERTAR_EVENTO = "INSERT INTO log_eventos (usuario, ip, accion, mensaje, fecha) VALUES (?, ?, ?, ?, ?)"
+
+
+class _EscritorLogs:
+    def __init__(self):
+        self.pid = os.getpid()
+        self._cola = queue.Queue(maxsize=DB_LOG_COLA)
+        self._pendientes = 0
+        self._condicion = threading.Condition()
+        self._contadores = {
+            'logs_encolados': 0, 'logs_escritos': 0, 'logs_lotes': 0,
+            'logs_directos': 0, 'logs_descartados': 0, 'logs_errores': 0,
+        }
+        self._hilo = threading.Thread(target=self._bucle, daemon=True, name="escritor-logs")
+        self._hilo.start()
+
+    def _contar(self, clave, delta=1):
+        with self._condicion:
+            self._contadores[clave] += delta
+
+    def encolar(self, sql, parametros):
+        evento = (sql, parametros)
+        with self._condicion:
+            self._pendientes += 1
+        try:
+            if DB_LOG_POLITICA == "descartar":
+                self._cola.put_nowait(evento)
+            else:
+                self._cola.put(evento, timeout=DB_LOG_ESPERA)
+        except queue.Full:
+            self._terminados(1)
+            if DB_LOG_POLITICA == "descartar":
+                self._contar('logs_descartados')
+                return False
+            # El escritor no da abasto: escribir en este hilo antes que perder el evento
+            self._contar('logs_directos')
+            self._escribir([evento])
+            return True
+        self._contar('logs_encolados')
+        return True
+
+    def _bucle(self):
+        while True:
+            evento = self._cola.get()
+            if evento is None:
+                return
+            lote = [evento]
+            limite = time.monotonic() + DB_LOG_INTERVALO
+            fin = False
+            while len(lote) < DB_LOG_LOTE:
+                restante = limite - time.monotonic()
+                try:
+                    evento = self._cola.get(timeout=restante) if restante > 0 else self._cola.get_nowait()
+                except queue.Empty:
+                    break
+                if evento is None:
+                    fin = True
+                    break
+                lote.append(evento)
+            try:
+                self._escribir(lote)
+            except Exception as error:
+                logger.error(f"❌ No se pudo escribir un lote de {len(lote)} logs: {error}")
+                self._contar('logs_errores', len(lote))
+            finally:
+                self._terminados(len(lote))
+            if fin:
+                return
+
+    def _escribir(self, lote):
         conn = obtener_conexion()
-        cursor = conn.cursor()
+        try:
+            try:
+                with conn:
+                    for sql, parametros in lote:
+                        conn.execute(sql, parametros)
+                escritos = len(lote)
+            except sqlite3.Error as error:
+                # Reintentar de a uno para no perder el lote entero por un evento
+                logger.error(f"❌ Error al escribir un lote de {len(lote)} logs: {error}")
+                escritos = 0
+                for sql, parametros in lote:
+                    try:
+                        with conn:
+                            conn.execute(sql, parametros)
+                        escritos += 1
+                    except sqlite3.Error as error_evento:
+                        logger.error(f"❌ Error al registrar log: {error_evento}")
+                        self._contar('logs_errores')
+        finally:
+            conn.close()
+        with self._condicion:
+            self._contadores['logs_escritos'] += escritos
+            self._contadores['logs_lotes'] += 1
+
+    def _terminados(self, cantidad):
+        with self._condicion:
+            self._pendientes -= cantidad
+            if self._pendientes <= 0:
+                self._condicion.notify_all()
+
+    def vaciar(self, timeout=None):
+        """Espera a que se escriba todo lo encolado. Retorna False si se agotó el tiempo."""
+        with self._condicion:
+            return self._condicion.wait_for(lambda: self._pendientes <= 0, timeout)
+
+    def detener(self, timeout=None):
+        vaciado = self.vaciar(timeout)
+        try:
+            self._cola.put(None, timeout=timeout)
+        except queue.Full:
+            return False
+        self._hilo.join(timeout)
+        return vaciado
+
+    def estadisticas(self):
+        with self._condicion:
+            datos = dict(self._contadores)
+        datos['logs_en_cola'] = self._cola.qsize()
+        return datos
+
+
+_escritor = None
+_lock_escritor = threading.Lock()
+
+
+def _obtener_escritor():
+    global _escritor
+    with _lock_escritor:
+        if _escritor is None or _escritor.pid != os.getpid():
+            # Tras un fork el hilo escritor del padre no existe en el hijo
+            _escritor = _EscritorLogs()
+        return _escritor
+
+
+def vaciar_logs(timeout=10):
+    """Escribe los logs pendientes y detiene el escritor (se llama también al salir)."""
+    global _escritor
+    with _lock_escritor:
+        escritor, _escritor = _escritor, None
+    if escritor is None or escritor.pid != os.getpid():
+        return True
+    if not escritor.detener(timeout):
+        logger.warning("⚠️ Quedaron logs sin escribir al detener el escritor")
+        return False
+    return True
 
-        cursor.execute(
-            "INSERT INTO logs (usuario_id, accion, archivo) VALUES (?, ?, ?)",
-            (usuario_id, accion, archivo)
-        )
 
-        conn.commit()
-        conn.close()
+atexit.register(vaciar_logs)
+
+
+def estadisticas_logs():
+    return _obtener_escritor().estadisticas()
+
+
+def registrar_log(usuario_id, accion, archivo=None):
+    try:
+        # 📝 Encolar el log (misma fecha que daría CURRENT_TIMESTAMP al insertarlo)
+        fecha = datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+        encolado = _obtener_escritor().encolar(SQL_INSERTAR_LOG, (usuario_id, accion, archivo, fecha))
 
         logger.debug(f"📝 Log registrado: Usuario {usuario_id}, Acción: {accion}, Archivo: {archivo}")
-        return True
+        return encolado
     except Exception as error:
         logger.error(f"❌ Error al registrar log: {error}")
         return False
 
 def log_evento(usuario, ip, accion, mensaje):
     try:
-        # 🔌 Obtener conexión y registrar el evento
-        conn = obtener_conexion()
-        cursor = conn.cursor()
-
+        # 📝 Encolar el evento; el escritor lo inserta en el próximo lote
         fecha_actual = datetime.now()
-
-        cursor.execute("""
-            INSERT INTO log_eventos (usuario, ip, accion, mensaje, fecha)
-            VALUES (?, ?, ?, ?, ?)
-        """, (usuario, ip, accion, mensaje, fecha_actual))
-
-        conn.commit()
-        conn.close()
+        _obtener_escritor().encolar(SQL_INSERTAR_EVENTO, (usuario, ip, accion, mensaje, fecha_actual))
 
         logger.debug(f"📊 Evento registrado: {accion} por {usuario} desde {ip}: {mensaje}")
     except Exception as error:
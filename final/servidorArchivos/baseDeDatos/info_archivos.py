@@ -0,0 +1,250 @@
+import os
+import time
+import logging
+
+from baseDeDatos.db import (asegurar_tablas, TABLA_INFO_ARCHIVOS, TABLA_USUARIOS, TABLA_VERIFICACIONES,
+                            INDICE_VERIFICACIONES_ARCHIVO)
+from baseDeDatos import metadatos
+
+# 🧾 Metadatos de cada archivo subido: hash esperado, usuario que lo subió y
+# fechas, en una fila por (directorio, nombre). Reemplaza a los archivos
+# "<archivo>.hash" y "<archivo>.sha256" que se escribían junto a cada subida:
+# dos inodes más por archivo y un stat/rename/unlink extra por cada uno al
+# eliminar o renombrar. El hash calculado por el servidor sigue en el índice de
+# metadatos (con la identidad del archivo) y el estado de verificación en la
+# tabla verificaciones; `obtener` junta las tres en una consulta.
+#
+# Los sidecars de subidas anteriores se importan una sola vez con:
+#   python -m baseDeDatos.info_archivos <directorio> [--borrar]
+
+logger = logging.getLogger(__name__)
+
+EXTENSION_HASH_ESPERADO = ".hash"
+EXTENSION_HASH_CALCULADO = ".sha256"
+
+def _conectar():
+    conn = metadatos.conectar()
+    # `obtener` consulta también el usuario y la última verificación
+    asegurar_tablas(conn, TABLA_INFO_ARCHIVOS, TABLA_USUARIOS, TABLA_VERIFICACIONES, INDICE_VERIFICACIONES_ARCHIVO)
+    return conn
+
+
+def _clave(ruta):
+    directorio, nombre = os.path.split(ruta)
+    return metadatos.clave_directorio(directorio), nombre
+
+
+def _es_sha256(texto):
+    return len(texto) == 64 and all(c in '0123456789abcdef' for c in texto)
+
+
+def registrar(ruta, sha256_esperado, usuario_id=None, creado=None):
+    """Alta (o reemplazo) de los metadatos de un archivo recién publicado."""
+    ahora = time.time()
+    conn = _conectar()
+    try:
+        with conn:
+            conn.execute("""
+                INSERT OR REPLACE INTO info_archivos
+                    (directorio, nombre, sha256_esperado, usuario_id, creado, actualizado)
+                VALUES (?, ?, ?, ?, ?, ?)
+            """, (*_clave(ruta), sha256_esperado, usuario_id, creado or ahora, ahora))
+    finally:
+        conn.close()
+
+
+def hash_esperado(ruta):
+    """SHA-256 esperado de `ruta`, o None si no hay uno registrado."""
+    conn = _conectar()
+    try:
+        fila = conn.execute(
+            "SELECT sha256_esperado FROM info_archivos WHERE directorio = ? AND nombre = ?", _clave(ruta)
+        ).fetchone()
+    finally:
+        conn.close()
+    return fila[0] if fila else None
+
+
+def obtener(ruta):
+    """
+    Retorna {sha256_esperado, sha256_calculado, usuario, creado, actualizado,
+    estado, verificado} de `ruta`, o None si el archivo no tiene metadatos.
+    El hash calculado solo se informa si el archivo no cambió desde que se
+    calculó; `usuario` es el nombre del usuario (o None).
+    """
+    try:
+        estado_archivo = os.stat(ruta)
+    except OSError:
+        return None
+    clave = _clave(ruta)
+    conn = _conectar()
+    try:
+        fila = conn.execute("""
+            SELECT i.sha256_esperado, u.username, i.creado, i.actualizado,
+                   m.bytes, m.mtime_ns, m.inode, m.sha256,
+                   (SELECT v.estado || '|' || v.fecha FROM verificaciones v
+                    WHERE v.directorio = k.directorio AND v.nombre = k.nombre ORDER BY v.id DESC LIMIT 1)
+            FROM (SELECT ? AS directorio, ? AS nombre) k
+            LEFT JOIN info_archivos i ON i.directorio = k.directorio AND i.nombre = k.nombre
+            LEFT JOIN usuarios u ON u.id = i.usuario_id
+            LEFT JOIN metadatos_archivos m ON m.directorio = k.directorio AND m.nombre = k.nombre
+        """, clave).fetchone()
+    finally:
+        conn.close()
+
+    esperado, usuario, creado, actualizado, tamaño, mtime_ns, inode, sha256, verificacion = fila
+    vigente = (tamaño, mtime_ns, inode) == (estado_archivo.st_size, estado_archivo.st_mtime_ns,
+                                            estado_archivo.st_ino)
+    calculado = sha256 if vigente else None
+    if esperado is None and calculado is None and verificacion is None:
+        return None
+    estado, _, verificado = (verificacion or "").partition("|")
+    return {
+        'sha256_esperado': esperado,
+        'sha256_calculado': calculado,
+        'usuario': usuario,
+        'creado': creado,
+        'actualizado': actualizado,
+        'estado': estado or None,
+        'verificado': verificado or None,
+    }
+
+
+def renombrar(directorio, nombre_viejo, nombre_nuevo):
+    """Mueve los metadatos al nuevo nombre. Retorna True si había una fila."""
+    clave = metadatos.clave_directorio(directorio)
+    conn = _conectar()
+    try:
+        with conn:
+            conn.execute("DELETE FROM info_archivos WHERE directorio = ? AND nombre = ?", (clave, nombre_nuevo))
+            cursor = conn.execute(
+                "UPDATE info_archivos SET nombre = ?, actualizado = ? WHERE directorio = ? AND nombre = ?",
+                (nombre_nuevo, time.time(), clave, nombre_viejo)
+            )
+        return cursor.rowcount > 0
+    finally:
+        conn.close()
+
+
+def eliminar(ruta):
+    """Borra los metadatos de `ruta`. Retorna True si había una fila."""
+    conn = _conectar()
+    try:
+        with conn:
+            cursor = conn.execute("DELETE FROM info_archivos WHERE directorio = ? AND nombre = ?", _clave(ruta))
+        return cursor.rowcount > 0
+    finally:
+        conn.close()
+
+
+# --- Migración: python -m baseDeDatos.info_archivos <directorio> [--borrar] ---
+
+def importar_sidecars(directorio, borrar=False):
+    """
+    Importa los "<archivo>.hash" y "<archivo>.sha256" del directorio. Un
+    archivo que ya tiene metadatos conserva los suyos, así que se puede volver
+    a ejecutar sin pisar nada. Con `borrar`, elimina los sidecars importados y
+    los huérfanos (sin su archivo). Un archivo que no tiene el formato de los
+    sidecars del servidor se cuenta como inválido y nunca se borra. Retorna
+    los contadores.
+    """
+    # Import diferido: utils.integridad usa este módulo
+    from utils.integridad import _parsear_archivo_hash, _identidad
+
+    contadores = {'esperados': 0, 'calculados': 0, 'existentes': 0, 'invalidos': 0, 'huerfanos': 0,
+                  'borrados': 0}
+    clave = metadatos.clave_directorio(directorio)
+    with os.scandir(directorio) as iterador:
+        sidecars = [entrada.name for entrada in iterador
+                    if entrada.name.endswith((EXTENSION_HASH_ESPERADO, EXTENSION_HASH_CALCULADO))
+                    and entrada.is_file()]
+
+    filas, procesados = [], []
+    conn = _conectar()
+    try:
+        registrados = {nombre for (nombre,) in conn.execute(
+            "SELECT nombre FROM info_archivos WHERE directorio = ?", (clave,)
+        )}
+    finally:
+        conn.close()
+
+    for sidecar in sidecars:
+        nombre, extension = os.path.splitext(sidecar)
+        ruta = os.path.join(directorio, nombre)
+        ruta_sidecar = os.path.join(directorio, sidecar)
+
+        # Solo se toca lo que tiene el formato que escribía el servidor: un
+        # checksum subido por un usuario (p. ej. "release.tar.gz.sha256") se deja
+        # en disco, igual que un .hash ilegible, para revisarlo a mano
+        if extension == EXTENSION_HASH_CALCULADO:
+            leido = _parsear_archivo_hash(ruta)
+            valido = leido is not None
+        else:
+            try:
+                with open(ruta_sidecar, 'r') as f:
+                    hash_hex = f.read().strip().lower()
+                creado = os.stat(ruta_sidecar).st_mtime
+            except (OSError, UnicodeDecodeError):
+                hash_hex = ""
+            valido = _es_sha256(hash_hex)
+        if not valido:
+            contadores['invalidos'] += 1
+            continue
+
+        if not os.path.isfile(ruta):
+            contadores['huerfanos'] += 1
+            procesados.append(sidecar)
+            continue
+
+        if extension == EXTENSION_HASH_CALCULADO:
+            # Vigente: pasa al índice; si el archivo cambió, se recalculará cuando haga falta
+            hash_hex, guardada = leido
+            if guardada == _identidad(ruta):
+                metadatos.guardar_hash(ruta, hash_hex)
+                contadores['calculados'] += 1
+            procesados.append(sidecar)
+            continue
+
+        if nombre in registrados:
+            contadores['existentes'] += 1
+            procesados.append(sidecar)
+            continue
+        filas.append((clave, nombre, hash_hex, None, creado, time.time()))
+        registrados.add(nombre)
+        contadores['esperados'] += 1
+        procesados.append(sidecar)
+
+    conn = _conectar()
+    try:
+        with conn:
+            conn.executemany("""
+                INSERT OR IGNORE INTO info_archivos
+                    (directorio, nombre, sha256_esperado, usuario_id, creado, actualizado)
+                VALUES (?, ?, ?, ?, ?, ?)
+            """, filas)
+    finally:
+        conn.close()
+
+    if borrar:
+        for sidecar in procesados:
+            try:
+                os.remove(os.path.join(directorio, sidecar))
+                contadores['borrados'] += 1
+            except FileNotFoundError:
+                pass
+        metadatos.registrar_cambios(directorio, procesados)
+    return contadores
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Importa los archivos .hash/.sha256 a la base de metadatos")
+    parser.add_argument("directorio", help="Directorio de archivos del servidor (SERVIDOR_DIR)")
+    parser.add_argument("--borrar", action="store_true", help="Eliminar los sidecars ya importados y los huérfanos")
+    args = parser.parse_args()
+
+    resultado = importar_sidecars(args.directorio, args.borrar)
+    print(f"✅ Sidecars importados de {args.directorio}:")
+    for clave_contador, valor in resultado.items():
+        print(f"  • {clave_contador}: {valor}")
@@ -0,0 +1,275 @@
+import os
+import logging
+
+from baseDeDatos.db import (obtener_conexion, asegurar_tablas, TABLA_METADATOS_ARCHIVOS,
+                            TABLA_DIRECTORIOS_INDEXADOS, INDICES_ORDEN_METADATOS)
+
+# 🗂️ Índice persistente de metadatos de los archivos almacenados: tamaño,
+# mtime_ns, inode y SHA-256 por archivo, más el mtime del directorio cuando se
+# indexó. Si el directorio no cambió desde entonces, los nombres salen del
+# índice sin recorrerlo; las operaciones del servidor (SUBIR, ELIMINAR,
+# RENOMBRAR) actualizan el índice en el momento. Un cambio hecho por fuera del
+# servidor que agrega, quita o renombra archivos modifica el mtime del
+# directorio y provoca un reescaneo. Editar un archivo en su lugar no lo
+# modifica, así que las filas que se devuelven se comparan con un stat y se
+# corrigen si cambiaron; los hashes se invalidan por archivo cuando su inode,
+# mtime o tamaño ya no coinciden.
+
+logger = logging.getLogger(__name__)
+
+def conectar():
+    conn = obtener_conexion()
+    asegurar_tablas(conn, TABLA_METADATOS_ARCHIVOS, *INDICES_ORDEN_METADATOS, TABLA_DIRECTORIOS_INDEXADOS)
+    return conn
+
+
+def clave_directorio(directorio):
+    return os.path.realpath(directorio)
+
+
+def _identidad(estado):
+    return estado.st_size, estado.st_mtime_ns, estado.st_ino
+
+
+def asegurar_indice(conn, directorio):
+    """Reescanea el directorio si cambió desde que se indexó. Retorna su clave."""
+    clave = clave_directorio(directorio)
+    mtime_dir = os.stat(directorio).st_mtime_ns
+    fila = conn.execute(
+        "SELECT mtime_ns FROM directorios_indexados WHERE directorio = ?", (clave,)
+    ).fetchone()
+    if not fila or fila[0] != mtime_dir:
+        _reindexar(conn, directorio, clave, mtime_dir)
+    return clave
+
+
+def listar(directorio):
+    """
+    Retorna [(nombre, tamaño, mtime_ns)] de los archivos regulares del directorio,
+    ordenados por nombre. Reescanea solo si el directorio cambió desde la última vez.
+    """
+    conn = conectar()
+    try:
+        clave = asegurar_indice(conn, directorio)
+        filas = conn.execute(
+            "SELECT nombre, bytes, mtime_ns, inode FROM metadatos_archivos WHERE directorio = ? ORDER BY nombre",
+            (clave,)
+        ).fetchall()
+        return _refrescar(conn, directorio, clave, filas)
+    finally:
+        conn.close()
+
+
+# Criterios de orden del listado paginado -> columna (None: solo el nombre)
+ORDENES = {'nombre': None, 'tamaño': 'bytes', 'fecha': 'mtime_ns'}
+
+
+def listar_pagina(directorio, despues_de=None, limite=100, prefijo=None, orden='nombre'):
+    """
+    Como `listar`, pero solo los `limite` primeros archivos posteriores a
+    `despues_de` que empiezan con `prefijo`. `orden` es una clave de ORDENES,
+    con "-" adelante para orden descendente. `despues_de` es el nombre (orden
+    por nombre) o (valor, nombre) para tamaño y fecha, tomado de la última fila
+    de la página anterior. Recorre la clave primaria o el índice del orden desde
+    ese punto: el costo (incluido el stat de cada fila devuelta) depende del
+    tamaño de la página, no de la cantidad de archivos.
+    """
+    descendente = orden.startswith("-")
+    columna = ORDENES[orden.lstrip("-")]
+    comparador, sentido = ("<", " DESC") if descendente else (">", "")
+
+    condiciones, parametros = ["directorio = ?"], []
+    if despues_de is not None:
+        if columna:
+            condiciones.append(f"({columna}, nombre) {comparador} (?, ?)")
+            parametros += list(despues_de)
+        else:
+            condiciones.append(f"nombre {comparador} ?")
+            parametros.append(despues_de)
+    if prefijo:
+        # Rango en lugar de LIKE: usa el índice y no interpreta % ni _
+        condiciones.append("nombre >= ? AND nombre < ?")
+        parametros += [prefijo, prefijo + "\U0010ffff"]
+    criterio = f"{columna}{sentido}, nombre{sentido}" if columna else f"nombre{sentido}"
+
+    conn = conectar()
+    try:
+        clave = asegurar_indice(conn, directorio)
+        filas = conn.execute(
+            f"SELECT nombre, bytes, mtime_ns, inode FROM metadatos_archivos WHERE {' AND '.join(condiciones)} "
+            f"ORDER BY {criterio} LIMIT ?",
+            (clave, *parametros, limite)
+        ).fetchall()
+        return _refrescar(conn, directorio, clave, filas)
+    finally:
+        conn.close()
+
+
+def _refrescar(conn, directorio, clave, filas):
+    """
+    Compara con el disco las filas [(nombre, tamaño, mtime_ns, inode)] que se van
+    a devolver: un archivo editado en su lugar no cambia el mtime del directorio.
+    Corrige en el índice las que cambiaron (su hash deja de valer) y quita las que
+    ya no existen. Retorna [(nombre, tamaño, mtime_ns)] con los valores actuales.
+    """
+    vigentes, cambiadas, eliminadas = [], [], []
+    for nombre, tamaño, mtime_ns, inode in filas:
+        try:
+            identidad = _identidad(os.stat(os.path.join(directorio, nombre)))
+        except FileNotFoundError:
+            eliminadas.append(nombre)
+            continue
+        if identidad != (tamaño, mtime_ns, inode):
+            cambiadas.append((nombre, identidad))
+        vigentes.append((nombre, identidad[0], identidad[1]))
+
+    if cambiadas or eliminadas:
+        try:
+            with conn:
+                for nombre, identidad in cambiadas:
+                    _guardar(conn, clave, nombre, identidad)
+                conn.executemany("DELETE FROM metadatos_archivos WHERE directorio = ? AND nombre = ?",
+                                 [(clave, nombre) for nombre in eliminadas])
+        except Exception as error:
+            # Lo devuelto ya es correcto; el índice se corrige en el próximo listado
+            logger.error(f"❌ Error al actualizar el índice de {directorio}: {error}")
+    return vigentes
+
+
+def _reindexar(conn, directorio, clave, mtime_dir):
+    anteriores = {
+        nombre: ((tamaño, mtime_ns, inode), sha256)
+        for nombre, tamaño, mtime_ns, inode, sha256 in conn.execute(
+            "SELECT nombre, bytes, mtime_ns, inode, sha256 FROM metadatos_archivos WHERE directorio = ?", (clave,)
+        )
+    }
+    filas = []
+    with os.scandir(directorio) as entradas:
+        for entrada in entradas:
+            try:
+                if not entrada.is_file():
+                    continue
+                identidad = _identidad(entrada.stat())
+            except OSError:
+                continue  # Eliminado mientras se recorría
+            # El hash se conserva solo si el archivo no cambió
+            anterior = anteriores.get(entrada.name)
+            sha256 = anterior[1] if anterior and anterior[0] == identidad else None
+            filas.append((clave, entrada.name, *identidad, sha256))
+
+    with conn:
+        conn.execute("DELETE FROM metadatos_archivos WHERE directorio = ?", (clave,))
+        conn.executemany(
+            "INSERT INTO metadatos_archivos (directorio, nombre, bytes, mtime_ns, inode, sha256) "
+            "VALUES (?, ?, ?, ?, ?, ?)", filas
+        )
+        conn.execute(
+            "INSERT OR REPLACE INTO directorios_indexados (directorio, mtime_ns) VALUES (?, ?)", (clave, mtime_dir)
+        )
+    logger.info(f"🗂️ Directorio indexado: {directorio} ({len(filas)} archivos)")
+
+
+def registrar_cambios(directorio, nombres):
+    """
+    Actualiza el índice tras una operación del servidor sobre `nombres` (creados,
+    modificados o eliminados). Si el directorio ya estaba indexado, registra su
+    nuevo mtime para que el próximo listado no lo reescanee.
+    """
+    clave = clave_directorio(directorio)
+    conn = conectar()
+    try:
+        with conn:
+            for nombre in nombres:
+                try:
+                    estado = os.stat(os.path.join(directorio, nombre))
+                except FileNotFoundError:
+                    conn.execute("DELETE FROM metadatos_archivos WHERE directorio = ? AND nombre = ?", (clave, nombre))
+                    continue
+                _guardar(conn, clave, nombre, _identidad(estado))
+            conn.execute(
+                "UPDATE directorios_indexados SET mtime_ns = ? WHERE directorio = ?",
+                (os.stat(directorio).st_mtime_ns, clave)
+            )
+    except Exception as error:
+        # El índice es una caché: si falla, el próximo listado reescanea
+        logger.error(f"❌ Error al actualizar el índice de {directorio}: {error}")
+        _invalidar(conn, clave)
+    finally:
+        conn.close()
+
+
+def renombrar(directorio, nombre_viejo, nombre_nuevo):
+    """Mueve la entrada (y su hash) al nuevo nombre; el rename conserva la identidad."""
+    clave = clave_directorio(directorio)
+    conn = conectar()
+    try:
+        with conn:
+            conn.execute("DELETE FROM metadatos_archivos WHERE directorio = ? AND nombre = ?", (clave, nombre_nuevo))
+            conn.execute(
+                "UPDATE metadatos_archivos SET nombre = ? WHERE directorio = ? AND nombre = ?",
+                (nombre_nuevo, clave, nombre_viejo)
+            )
+    except Exception as error:
+        logger.error(f"❌ Error al actualizar el índice de {directorio}: {error}")
+        _invalidar(conn, clave)
+    finally:
+        conn.close()
+
+
+def _guardar(conn, clave, nombre, identidad, sha256=None):
+    tamaño, mtime_ns, inode = identidad
+    if sha256 is None:
+        # Conservar el hash si la identidad no cambió
+        conn.execute("""
+            INSERT INTO metadatos_archivos (directorio, nombre, bytes, mtime_ns, inode, sha256)
+            VALUES (?, ?, ?, ?, ?, NULL)
+            ON CONFLICT (directorio, nombre) DO UPDATE SET
+                sha256 = CASE WHEN bytes = excluded.bytes AND mtime_ns = excluded.mtime_ns
+                              AND inode = excluded.inode THEN sha256 END,
+                bytes = excluded.bytes, mtime_ns = excluded.mtime_ns, inode = excluded.inode
+        """, (clave, nombre, tamaño, mtime_ns, inode))
+    else:
+        conn.execute("""
+            INSERT OR REPLACE INTO metadatos_archivos (directorio, nombre, bytes, mtime_ns, inode, sha256)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, (clave, nombre, tamaño, mtime_ns, inode, sha256))
+
+
+def _invalidar(conn, clave):
+    try:
+        with conn:
+            conn.execute("DELETE FROM directorios_indexados WHERE directorio = ?", (clave,))
+    except Exception:
+        pass
+
+
+def guardar_hash(ruta, sha256):
+    """Guarda el SHA-256 de `ruta` con su identidad actual."""
+    directorio, nombre = os.path.split(ruta)
+    estado = os.stat(ruta)
+    conn = conectar()
+    try:
+        with conn:
+            _guardar(conn, clave_directorio(directorio), nombre, _identidad(estado), sha256)
+    finally:
+        conn.close()
+
+
+def obtener_hash(ruta):
+    """Retorna el SHA-256 indexado si el archivo no cambió desde que se calculó, o None."""
+    directorio, nombre = os.path.split(ruta)
+    try:
+        identidad = _identidad(os.stat(ruta))
+    except OSError:
+        return None
+    conn = conectar()
+    try:
+        fila = conn.execute(
+            "SELECT bytes, mtime_ns, inode, sha256 FROM metadatos_archivos WHERE directorio = ? AND nombre = ?",
+            (clave_directorio(directorio), nombre)
+        ).fetchone()
+    finally:
+        conn.close()
+    if not fila or fila[3] is None or tuple(fila[:3]) != identidad:
+        return None
+    return fila[3]
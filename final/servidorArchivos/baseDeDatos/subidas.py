@@ -0,0 +1,89 @@
+import time
+import logging
+
+from baseDeDatos.db import asegurar_tablas, TABLA_SUBIDAS, TABLA_SUBIDAS_BLOQUES
+from baseDeDatos import metadatos
+
+# 📦 Estado de las subidas por bloques: la sesión (archivo destino, tamaño,
+# tamaño de bloque, hash esperado) y los bloques ya guardados. Vive en la base
+# y no en memoria para que una subida siga tras un reinicio y para que los
+# bloques puedan llegar por conexiones atendidas por distintos workers.
+
+logger = logging.getLogger(__name__)
+
+def _conectar():
+    conn = metadatos.conectar()
+    asegurar_tablas(conn, TABLA_SUBIDAS, TABLA_SUBIDAS_BLOQUES)
+    return conn
+
+
+def crear(id_subida, usuario_id, directorio, nombre, tamaño, bloque, sha256=None):
+    conn = _conectar()
+    try:
+        with conn:
+            conn.execute("""
+                INSERT INTO subidas (id, usuario_id, directorio, nombre, bytes, bloque, sha256, actualizada)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            """, (id_subida, usuario_id, metadatos.clave_directorio(directorio), nombre, tamaño, bloque, sha256,
+                  time.time()))
+    finally:
+        conn.close()
+
+
+def obtener(id_subida, usuario_id):
+    """Retorna {nombre, bytes, bloque, sha256} de una subida del usuario, o None."""
+    conn = _conectar()
+    try:
+        fila = conn.execute(
+            "SELECT nombre, bytes, bloque, sha256 FROM subidas WHERE id = ? AND usuario_id IS ?",
+            (id_subida, usuario_id)
+        ).fetchone()
+    finally:
+        conn.close()
+    if not fila:
+        return None
+    return {'nombre': fila[0], 'bytes': fila[1], 'bloque': fila[2], 'sha256': fila[3]}
+
+
+def registrar_bloque(id_subida, numero):
+    conn = _conectar()
+    try:
+        with conn:
+            conn.execute("INSERT OR IGNORE INTO subidas_bloques (subida_id, numero) VALUES (?, ?)",
+                         (id_subida, numero))
+            conn.execute("UPDATE subidas SET actualizada = ? WHERE id = ?", (time.time(), id_subida))
+    finally:
+        conn.close()
+
+
+def bloques_recibidos(id_subida):
+    """Números de los bloques guardados, en orden."""
+    conn = _conectar()
+    try:
+        return [numero for (numero,) in conn.execute(
+            "SELECT numero FROM subidas_bloques WHERE subida_id = ? ORDER BY numero", (id_subida,)
+        )]
+    finally:
+        conn.close()
+
+
+def eliminar(id_subida):
+    conn = _conectar()
+    try:
+        with conn:
+            conn.execute("DELETE FROM subidas_bloques WHERE subida_id = ?", (id_subida,))
+            conn.execute("DELETE FROM subidas WHERE id = ?", (id_subida,))
+    finally:
+        conn.close()
+
+
+def vencidas(directorio, antes_de):
+    """Ids de las subidas del directorio sin actividad desde `antes_de` (epoch)."""
+    conn = _conectar()
+    try:
+        return [id_subida for (id_subida,) in conn.execute(
+            "SELECT id FROM subidas WHERE directorio = ? AND actualizada < ?",
+            (metadatos.clave_directorio(directorio), antes_de)
+        )]
+    finally:
+        conn.close()
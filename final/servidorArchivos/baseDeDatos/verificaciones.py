@@ -0,0 +1,81 @@
+import os
+import logging
+from datetime import datetime
+
+from baseDeDatos.db import asegurar_tablas, TABLA_VERIFICACIONES, INDICE_VERIFICACIONES_ARCHIVO
+from baseDeDatos import metadatos
+
+# 🔍 Resultados de verificación por archivo, en columnas (en lugar de buscarlos
+# con LIKE sobre el texto de log_eventos). La última verificación de un archivo
+# es la de id más alto para su (directorio, nombre), que cubre el índice
+# idx_verificaciones_archivo.
+
+logger = logging.getLogger(__name__)
+
+def _conectar():
+    conn = metadatos.conectar()
+    asegurar_tablas(conn, TABLA_VERIFICACIONES, INDICE_VERIFICACIONES_ARCHIVO)
+    return conn
+
+
+def registrar(ruta, estado, integridad, virus, mensaje, sha256=None):
+    directorio, nombre = os.path.split(ruta)
+    conn = _conectar()
+    try:
+        with conn:
+            conn.execute("""
+                INSERT INTO verificaciones (directorio, nombre, sha256, estado, integridad, virus, mensaje, fecha)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            """, (metadatos.clave_directorio(directorio), nombre, sha256, estado, integridad, virus, mensaje,
+                  datetime.now().isoformat(sep=' ')))
+    finally:
+        conn.close()
+
+
+def ultima(ruta):
+    """Retorna (mensaje, fecha) de la última verificación de `ruta`, o None."""
+    directorio, nombre = os.path.split(ruta)
+    conn = _conectar()
+    try:
+        fila = conn.execute("""
+            SELECT mensaje, fecha FROM verificaciones
+            WHERE directorio = ? AND nombre = ?
+            ORDER BY id DESC LIMIT 1
+        """, (metadatos.clave_directorio(directorio), nombre)).fetchone()
+    finally:
+        conn.close()
+    if not fila:
+        return None
+    return fila[0], _parsear_fecha(fila[1])
+
+
+def ultimas_del_directorio(directorio):
+    """
+    Una sola consulta para todos los archivos del directorio (según el índice de
+    metadatos): [(nombre, estado, mensaje)], con estado y mensaje en None si el
+    archivo nunca se verificó.
+    """
+    conn = _conectar()
+    try:
+        clave = metadatos.asegurar_indice(conn, directorio)
+        return conn.execute("""
+            SELECT m.nombre, v.estado, v.mensaje
+            FROM metadatos_archivos m
+            LEFT JOIN verificaciones v ON v.id = (
+                SELECT MAX(id) FROM verificaciones
+                WHERE directorio = m.directorio AND nombre = m.nombre
+            )
+            WHERE m.directorio = ?
+            ORDER BY m.nombre
+        """, (clave,)).fetchall()
+    finally:
+        conn.close()
+
+
+def _parsear_fecha(valor):
+    if isinstance(valor, datetime):
+        return valor
+    try:
+        return datetime.fromisoformat(str(valor))
+    except ValueError:
+        return None
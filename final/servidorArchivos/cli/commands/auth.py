@@ -2,7 +2,7 @@ import os
 import json
 from ..utils import config
 from ..utils.session import save_session, load_session, clear_session
-from ..utils.connection import create_ssl_connection, receive_prompt, send_response
+from ..utils.connection import create_ssl_connection, open_session
 from ..utils.visual import (
     print_success, print_error, print_info, print_warning, print_header,
     format_success, format_error, format_info, format_warning, BOLD, RESET
@@ -19,38 +19,24 @@ def login(username, password):
         return
     
     try:
-        # Recibir mensaje de bienvenida
-        welcome = receive_prompt(connection)
+        # Negociar protocolo (frames v2 si el servidor lo soporta)
         print_header("SERVIDOR DE ARCHIVOS")
-        print(welcome)
+        session = open_session(connection)
         
-        # Recibir prompt de usuario
-        user_prompt = receive_prompt(connection)
-        print(f"{BOLD}{user_prompt}{RESET}")
-        
-        # Enviar nombre de usuario
+        # Enviar credenciales
         print_info(f"Autenticando como {BOLD}{username}{RESET}...")
-        send_response(connection, username)
-        
-        # Recibir prompt de contraseña
-        pass_prompt = receive_prompt(connection)
-        print(f"{BOLD}{pass_prompt}{RESET}")
-        
-        # Enviar contraseña
-        send_response(connection, password)
-        
-        # Recibir resultado de autenticación
-        auth_result = receive_prompt(connection)
+        ok, auth_result = session.autenticar(username, password)
         
         # Si la autenticación fue exitosa, guardar sesión
-        if "✅ Autenticación exitosa" in auth_result:
+        if ok:
             # Extraer permisos del mensaje
             permisos = "admin" if "admin" in auth_result.lower() else "usuario"
             
             save_session({
                 "user": username,
                 "role": permisos,
-                "password": password
+                "password": password,
+                "token": session.token
             })
             
             print_success(f"Sesión iniciada como {BOLD}{username}{RESET} ({permisos})")
@@ -78,21 +64,13 @@ def register(username, password):
         return
     
     try:
-        # Recibir mensaje de bienvenida
-        welcome = receive_prompt(connection)
+        # Negociar protocolo (frames v2 si el servidor lo soporta)
         print_header("REGISTRO DE USUARIO")
-        print(welcome)
-        
-        # Recibir prompt de usuario
-        user_prompt = receive_prompt(connection)
-        print(f"{BOLD}{user_prompt}{RESET}")
+        session = open_session(connection)
         
         # Enviar comando de registro
         print_info(f"Registrando usuario {BOLD}{username}{RESET}...")
-        send_response(connection, f"REGISTRAR {username} {password}")
-        
-        # Recibir resultado del registro
-        register_result = receive_prompt(connection)
+        register_result = session.registrar(username, password)
         
         if "✅" in register_result:
             print_success(f"Usuario {BOLD}{username}{RESET} registrado correctamente")
@@ -2,8 +2,8 @@ import os
 import sys
 import socket
 from ..utils import config
-from ..utils.session import load_session, check_auth
-from ..utils.connection import create_ssl_connection, send_command, upload_file as conn_upload_file, download_file as conn_download_file, receive_prompt, send_response
+from ..utils.session import load_session, check_auth, update_session_token
+from ..utils.connection import create_ssl_connection, send_command, upload_file as conn_upload_file, download_file as conn_download_file, authenticate, start_transfer, get_session
 from ..utils.visual import (
     print_success, print_error, print_info, print_warning, print_header,
     format_success, format_error, format_info, format_warning, 
@@ -61,30 +61,18 @@ def _authenticate_with_session(connection):
     
     username = session.get("user", "Usuario")
     
-    # Recibir mensaje de bienvenida (silenciosamente)
-    welcome = receive_prompt(connection)
-    
-    # Recibir prompt de usuario (silenciosamente)
-    user_prompt = receive_prompt(connection)
-    
-    # Enviar nombre de usuario
+    # Negociar protocolo (frames v2 o texto) y enviar credenciales (silenciosamente)
     print_info(f"Autenticando como {BOLD}{username}{RESET}...", end="\r")
-    send_response(connection, session["user"])
-    
-    # Recibir prompt de contraseña (silenciosamente)
-    pass_prompt = receive_prompt(connection)
-    
-    # Enviar contraseña (usar contraseña real de la sesión)
-    send_response(connection, session.get("password", ""))
-    
-    # Recibir resultado de autenticación
-    auth_result = receive_prompt(connection)
+    ok, auth_result = authenticate(connection, session["user"], session.get("password", ""), session.get("token"))
     
     # Si la autenticación falló, lanzar excepción
-    if "❌" in auth_result:
+    if not ok:
         print_error(f"Error de autenticación para {BOLD}{username}{RESET}")
         raise Exception("Error de autenticación")
     
+    # Guardar el token renovado para la próxima conexión
+    update_session_token(get_session(connection).token)
+    
     # Limpiar la línea de "Autenticando..."
     sys.stdout.write("\033[K")
     
@@ -118,14 +106,8 @@ def list_files(silent=False):
         if not silent:
             print_info("Obteniendo lista de archivos...")
         
-        # Recibir el prompt de comando
-        command_prompt = receive_prompt(connection)
-        
-        # Enviar comando LISTAR
-        send_response(connection, "LISTAR")
-        
-        # Recibir respuesta del comando
-        response = receive_prompt(connection)
+        # Enviar comando LISTAR y recibir la respuesta completa
+        response = send_command(connection, "LISTAR") or ""
         
         # Cerrar conexión
         connection.close()
@@ -196,9 +178,6 @@ def upload_file(file_path):
         # Autenticar con la sesión guardada
         _authenticate_with_session(connection)
         
-        # Recibir el prompt de comando
-        command_prompt = receive_prompt(connection)
-        
         # Implementar nuestra propia función de subida con barra de progreso
         try:
             # Permitir al usuario pegar un SHA-256 opcional
@@ -215,17 +194,22 @@ def upload_file(file_path):
                 command = f'SUBIR "{filename}" {user_hash.lower()}'
             else:
                 command = f'SUBIR "{filename}"'
-            send_response(connection, command)
+            channel = start_transfer(connection, command)
             
             # Recibir respuesta inicial (si el servidor está listo para recibir)
-            initial_response = connection.recv(1024).decode('utf-8').strip()
+            initial_response = channel.recv(1024).decode('utf-8').strip()
+            if "ya estaba almacenado" in initial_response:
+                # El servidor ya tenía ese contenido: no hace falta enviarlo
+                print_success(f"Archivo {BOLD}{filename}{RESET} subido correctamente (sin transferir, el servidor ya lo tenía)")
+                connection.close()
+                return
             if "listo para recibir" not in initial_response.lower():
                 print_error(f"Error al iniciar la subida: {initial_response}")
                 connection.close()
                 return
             
             # Enviar el tamaño del archivo primero (como espera el servidor)
-            connection.sendall(str(file_size).encode("utf-8"))
+            channel.sendall(str(file_size).encode("utf-8"))
             # Leer y enviar el archivo con barra de progreso
             with open(file_path, 'rb') as f:
                 with tqdm(total=file_size, unit='B', unit_scale=True, desc=f"Subiendo {filename}") as pbar:
@@ -235,11 +219,11 @@ def upload_file(file_path):
                         chunk = f.read(chunk_size)
                         if not chunk:
                             break
-                        connection.sendall(chunk)
+                        channel.sendall(chunk)
                         pbar.update(len(chunk))
             
             # Recibir respuesta final
-            response = connection.recv(4096).decode('utf-8').strip()
+            response = channel.recv(4096).decode('utf-8').strip()
             
             if "✅" in response:
                 print_success(f"Archivo {BOLD}{filename}{RESET} subido correctamente")
@@ -272,16 +256,12 @@ def download_file(filename):
         # Autenticar con la sesión guardada
         _authenticate_with_session(connection)
         
-        # Ahora el servidor está esperando comandos en el bucle _procesar_comandos
-        # Recibir el prompt de comando
-        command_prompt = receive_prompt(connection)
-        
         # Enviar comando DESCARGAR
         command = f'DESCARGAR "{filename}"'
-        send_response(connection, command)
+        channel = start_transfer(connection, command)
         
         # Recibir mensaje de confirmación del servidor
-        server_response = connection.recv(4096).decode('utf-8').strip()
+        server_response = channel.recv(4096).decode('utf-8').strip()
         
         # Si el servidor reporta un error, mostrarlo y salir
         if server_response.startswith("❌") or server_response.startswith("⚠️"):
@@ -301,7 +281,7 @@ def download_file(filename):
                 file_size = None
             
             # Enviar confirmación al servidor
-            connection.sendall("LISTO".encode('utf-8'))
+            channel.sendall("LISTO".encode('utf-8'))
             
             # Recibir el archivo con barra de progreso
             file_data = b''
@@ -313,7 +293,7 @@ def download_file(filename):
                 while bytes_received < file_size:
                     # Usar chunks más pequeños para actualizaciones más fluidas
                     chunk_size = min(4096, file_size - bytes_received)
-                    chunk = connection.recv(chunk_size)
+                    chunk = channel.recv(chunk_size)
                     if not chunk:
                         break
                     
@@ -338,7 +318,7 @@ def download_file(filename):
                 f.write(file_data)
             
             # Enviar confirmación final al servidor
-            connection.sendall("✅ Archivo recibido correctamente".encode('utf-8'))
+            channel.sendall("✅ Archivo recibido correctamente".encode('utf-8'))
             
             print_success(f"Archivo {BOLD}{filename}{RESET} descargado correctamente ({format_size(len(file_data))})")
             if config.CLIENTE_DIR:
@@ -432,186 +412,115 @@ def rename_file(old_name, new_name):
 def verify_file(filename=None):
     """Verificar la integridad de un archivo o todos los archivos.
     Opción B: el CLI espera con polling hasta obtener un resultado definitivo.
-    Además, imprime comparación de hashes (.hash vs .sha256) cuando esté disponible.
+    Además, imprime comparación de hashes (esperado vs calculado) cuando esté disponible.
     """
     import time
     import re
-    import tempfile
-
-    def _descargar_hash_texto(remote_name: str) -> str | None:
-        tmp_dir = tempfile.gettempdir()
-        local_path = os.path.join(tmp_dir, f"cli_tmp_{os.getpid()}_{os.path.basename(remote_name)}")
-        try:
-            conn = create_ssl_connection(config.SERVER_HOST, config.SERVER_PORT)
-            if not conn:
-                return None
-            try:
-                # Evitar bloqueos prolongados
-                try:
-                    conn.settimeout(15)
-                except Exception:
-                    pass
-
-                _authenticate_with_session(conn)
-                receive_prompt(conn)
-                send_response(conn, f'DESCARGAR "{remote_name}"')
-
-                # Leer encabezado con tamaño
-                hdr = conn.recv(1024).decode('utf-8', errors='ignore')
-                if "listo para enviar" not in hdr.lower():
-                    return None
-
-                # Parsear tamaño: ... (12345 bytes)
-                import re as _re
-                msz = _re.search(r"\((\d+)\s*bytes\)", hdr)
-                expected_size = int(msz.group(1)) if msz else None
-
-                # Confirmar inicio de transferencia
-                conn.sendall(b"LISTO")
-
-                # Recibir datos
-                bytes_recibidos = 0
-                with open(local_path, "wb") as f:
-                    if expected_size is not None:
-                        while bytes_recibidos < expected_size:
-                            chunk = conn.recv(min(8192, expected_size - bytes_recibidos))
-                            if not chunk:
-                                break
-                            f.write(chunk)
-                            bytes_recibidos += len(chunk)
-                    else:
-                        # Fallback si no se pudo parsear tamaño
-                        while True:
-                            chunk = conn.recv(8192)
-                            if not chunk:
-                                break
-                            f.write(chunk)
 
-                # Enviar confirmación final para que el servidor termine correctamente
-                try:
-                    conn.sendall("✅ Recibido".encode("utf-8"))
-                except Exception:
-                    pass
-            finally:
-                try:
-                    conn.close()
-                except Exception:
-                    pass
-            content = None
-            try:
-                with open(local_path, "r") as f:
-                    content = f.read()
-            finally:
-                try:
-                    os.remove(local_path)
-                except Exception:
-                    pass
-            if not content:
-                return None
-            m = re.search(r"\b[0-9a-fA-F]{64}\b", content)
-            return m.group(0) if m else None
-        except Exception:
+    def _extraer_hash(contenido: bytes | None) -> str | None:
+        if not contenido:
             return None
+        m = re.search(r"\b[0-9a-fA-F]{64}\b", contenido.decode('utf-8', errors='ignore'))
+        return m.group(0) if m else None
 
     if filename:
         print_info(f"Conectando al servidor para verificar el archivo {BOLD}{filename}{RESET}...")
     else:
         print_info("Conectando al servidor para verificar todos los archivos...")
 
-    # Función para disparar VERIFICAR una sola vez
+    # Una sola conexión para VERIFICAR, el polling de ESTADO y la consulta de los hashes
+    conn = create_ssl_connection(config.SERVER_HOST, config.SERVER_PORT)
+    if not conn:
+        print_error("No se pudo conectar al servidor. Asegúrate de que el servidor esté en ejecución.")
+        return
+    try:
+        _authenticate_with_session(conn)
+    except Exception as e:
+        print_error(f"Error al iniciar verificación: {e}")
+        conn.close()
+        return
+    session = get_session(conn)
+
     def _disparar_verificar_once():
-        conn = create_ssl_connection(config.SERVER_HOST, config.SERVER_PORT)
-        if not conn:
-            raise RuntimeError("No se pudo conectar al servidor")
-        try:
-            _authenticate_with_session(conn)
-            receive_prompt(conn)
-            cmd = f'VERIFICAR "{filename}"' if filename else 'VERIFICAR'
-            send_response(conn, cmd)
-            resp = receive_prompt(conn)
-            return resp
-        finally:
-            try:
-                conn.close()
-            except Exception:
-                pass
+        cmd = f'VERIFICAR "{filename}"' if filename else 'VERIFICAR'
+        return send_command(conn, cmd) or ""
 
-    # Función para consultar estado de solo lectura (no encola)
+    # Consultar estado de solo lectura (no encola)
     def _consultar_estado_readonly():
-        conn = create_ssl_connection(config.SERVER_HOST, config.SERVER_PORT)
-        if not conn:
-            raise RuntimeError("No se pudo conectar al servidor")
-        try:
-            _authenticate_with_session(conn)
-            receive_prompt(conn)
-            cmd = f'ESTADO "{filename}"' if filename else 'ESTADO'
-            send_response(conn, cmd)
-            resp = receive_prompt(conn)
-            return resp
-        finally:
-            try:
-                conn.close()
-            except Exception:
-                pass
+        cmd = f'ESTADO "{filename}"' if filename else 'ESTADO'
+        return send_command(conn, cmd) or ""
 
-    # Polling hasta resultado final
-    max_wait_seconds = 120
-    interval = 2
-    waited = 0
+    try:
+        # Polling hasta resultado final
+        max_wait_seconds = 120
+        interval = 2
+        waited = 0
 
-    print_info(f"Verificando {'archivo ' + BOLD + filename + RESET if filename else 'todos los archivos'}...")
-    if not filename:
-        print_warning("Esta operación puede tardar varios minutos para muchos archivos.")
-    print_header("RESULTADO DE LA VERIFICACIÓN")
+        print_info(f"Verificando {'archivo ' + BOLD + filename + RESET if filename else 'todos los archivos'}...")
+        if not filename:
+            print_warning("Esta operación puede tardar varios minutos para muchos archivos.")
+        print_header("RESULTADO DE LA VERIFICACIÓN")
 
-    # Disparar verificación una sola vez (puede devolver 'iniciada' o un resultado inmediato)
-    try:
-        first_resp = _disparar_verificar_once()
-    except Exception as e:
-        print_error(f"Error al iniciar verificación: {e}")
-        return
+        # Disparar verificación una sola vez (puede devolver 'iniciada' o un resultado inmediato)
+        try:
+            first_resp = _disparar_verificar_once()
+        except Exception as e:
+            print_error(f"Error al iniciar verificación: {e}")
+            return
 
-    final_response = None
-    low_first = first_resp.lower()
-    if not ("verificación iniciada" in low_first or "vuelve a consultar" in low_first):
-        # Si ya hay un resultado definitivo en la primera respuesta, úsalo
-        final_response = first_resp
-    else:
-        # Poll con ESTADO (solo lectura)
-        while waited <= max_wait_seconds:
-            resp = _consultar_estado_readonly()
-            low = resp.lower()
-            if (" ok " in f" {low} ") or ("corrupto" in low) or ("infectado" in low) or ("parcial" in low) or ("integridad:" in low) or ("antivirus:" in low):
-                final_response = resp
-                break
-            time.sleep(interval)
-            waited += interval
+        final_response = None
+        low_first = first_resp.lower()
+        if not ("verificación iniciada" in low_first or "vuelve a consultar" in low_first):
+            # Si ya hay un resultado definitivo en la primera respuesta, úsalo
+            final_response = first_resp
+        else:
+            # Poll con ESTADO (solo lectura)
+            while waited <= max_wait_seconds:
+                resp = _consultar_estado_readonly()
+                low = resp.lower()
+                if (" ok " in f" {low} ") or ("corrupto" in low) or ("infectado" in low) or ("parcial" in low) or ("integridad:" in low) or ("antivirus:" in low):
+                    final_response = resp
+                    break
+                time.sleep(interval)
+                waited += interval
 
-    if not final_response:
-        print_error("⏳ Tiempo de espera agotado sin obtener un resultado final. Intenta nuevamente.")
-        return
+        if not final_response:
+            print_error("⏳ Tiempo de espera agotado sin obtener un resultado final. Intenta nuevamente.")
+            return
 
-    print(final_response)
+        print(final_response)
 
-    # Intentar mostrar comparación de hashes
-    if filename:
-        expected = _descargar_hash_texto(f"{filename}.hash")
-        calculated = _descargar_hash_texto(f"{filename}.sha256")
-        if expected or calculated:
-            print_header("COMPARACIÓN DE HASHES")
-            if expected:
-                print_info(f"Hash esperado (.hash):   {BOLD}{expected}{RESET}")
-            else:
-                print_warning("No se encontró archivo .hash (hash esperado).")
-            if calculated:
-                print_info(f"Hash calculado (.sha256): {BOLD}{calculated}{RESET}")
-            else:
-                print_warning("No se encontró archivo .sha256 (hash calculado por el servidor).")
-            if expected and calculated:
-                if expected.lower() == calculated.lower():
-                    print_success("🔑 Ambos hashes coinciden.")
+        # Intentar mostrar comparación de hashes
+        if filename:
+            try:
+                conn.settimeout(15)
+                info = session.info_archivo(filename)
+                if info is not None:
+                    expected, calculated = info.get('sha256_esperado'), info.get('sha256_calculado')
+                else:
+                    # Servidor sin INFO: descargar los archivos .hash/.sha256 (en paralelo si habla v2)
+                    hashes = session.descargar_en_paralelo([f"{filename}.hash", f"{filename}.sha256"])
+                    expected = _extraer_hash(hashes.get(f"{filename}.hash", (None, ""))[0])
+                    calculated = _extraer_hash(hashes.get(f"{filename}.sha256", (None, ""))[0])
+            except Exception:
+                expected = calculated = None
+            if expected or calculated:
+                print_header("COMPARACIÓN DE HASHES")
+                if expected:
+                    print_info(f"Hash esperado:  {BOLD}{expected}{RESET}")
+                else:
+                    print_warning("No se encontró el hash esperado.")
+                if calculated:
+                    print_info(f"Hash calculado: {BOLD}{calculated}{RESET}")
                 else:
-                    print_error("❌ Los hashes NO coinciden.")
+                    print_warning("No se encontró el hash calculado por el servidor.")
+                if expected and calculated:
+                    if expected.lower() == calculated.lower():
+                        print_success("🔑 Ambos hashes coinciden.")
+                    else:
+                        print_error("❌ Los hashes NO coinciden.")
+    finally:
+        session.cerrar()
 
 def format_size(bytes):
     """Formatear tamaño en bytes a formato legible"""
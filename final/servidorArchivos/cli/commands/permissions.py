@@ -1,8 +1,8 @@
 import sys
 import socket
 from ..utils import config
-from ..utils.session import load_session, check_auth
-from ..utils.connection import create_ssl_connection, send_command, receive_prompt, send_response
+from ..utils.session import load_session, check_auth, update_session_token
+from ..utils.connection import create_ssl_connection, send_command, authenticate, get_session
 from ..utils.visual import (
     print_success, print_error, print_info, print_warning, print_header,
     format_success, format_error, format_info, format_warning, 
@@ -17,30 +17,18 @@ def _authenticate_with_session(connection):
     
     username = session.get("user", "Usuario")
     
-    # Recibir mensaje de bienvenida (silenciosamente)
-    welcome = receive_prompt(connection)
-    
-    # Recibir prompt de usuario (silenciosamente)
-    user_prompt = receive_prompt(connection)
-    
-    # Enviar nombre de usuario
+    # Negociar protocolo (frames v2 o texto) y enviar credenciales (silenciosamente)
     print_info(f"Autenticando como {BOLD}{username}{RESET}...", end="\r")
-    send_response(connection, session["user"])
-    
-    # Recibir prompt de contraseña (silenciosamente)
-    pass_prompt = receive_prompt(connection)
-    
-    # Enviar contraseña (usar la contraseña real de la sesión)
-    send_response(connection, session.get("password", ""))
-    
-    # Recibir resultado de autenticación
-    auth_result = receive_prompt(connection)
+    ok, auth_result = authenticate(connection, session["user"], session.get("password", ""), session.get("token"))
     
     # Si la autenticación falló, lanzar excepción
-    if "❌" in auth_result:
+    if not ok:
         print_error(f"Error de autenticación para {BOLD}{username}{RESET}")
         raise Exception("Error de autenticación")
     
+    # Guardar el token renovado para la próxima conexión
+    update_session_token(get_session(connection).token)
+    
     # Limpiar la línea de "Autenticando..."
     sys.stdout.write("\033[K")
     
@@ -1,6 +1,12 @@
 import socket
 import ssl
 import os
+import weakref
+
+from utils.protocolo import ClienteProtocolo
+
+# Sesiones negociadas por conexión (v2 con frames o texto como fallback)
+_sessions = weakref.WeakKeyDictionary()
 
 def create_ssl_connection(host, port):
     """Crea una conexión SSL con el servidor"""
@@ -60,8 +66,46 @@ def create_ssl_connection(host, port):
         print(f"❌ Error al conectar con el servidor: {str(e)}")
         return None
 
+def open_session(connection):
+    """Negocia el protocolo con el servidor (v2 si está disponible) y lo asocia a la conexión"""
+    session = ClienteProtocolo(connection)
+    session.negociar()
+    _sessions[connection] = session
+    return session
+
+def get_session(connection):
+    """Retorna la sesión negociada de la conexión, o None si se usa el flujo de texto manual"""
+    return _sessions.get(connection)
+
+def authenticate(connection, username, password, token=None):
+    """Negocia el protocolo y autentica. Retorna (exito, mensaje del servidor)"""
+    session = open_session(connection)
+    if token:
+        # Token de la sesión guardada: evita el bcrypt del servidor; si venció, usar la contraseña
+        ok, auth_result = session.autenticar_token(token)
+        if ok:
+            return ok, auth_result
+    return session.autenticar(username, password)
+
+def start_transfer(connection, command):
+    """Inicia SUBIR/DESCARGAR; retorna el canal (sendall/recv) para la transferencia"""
+    session = get_session(connection)
+    if session:
+        return session.transferencia(command)
+    connection.sendall(command.encode('utf-8'))
+    return connection
+
 def send_command(connection, command):
     """Envía un comando al servidor y recibe la respuesta"""
+    session = get_session(connection)
+    if session:
+        # Respuesta delimitada por el protocolo: sin esperas por timeout
+        try:
+            return session.comando(command)
+        except Exception as e:
+            print(f"❌ Error en la comunicación con el servidor: {str(e)}")
+            return None
+
     try:
         # Enviar comando
         connection.sendall(command.encode('utf-8'))
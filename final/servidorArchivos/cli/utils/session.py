@@ -19,6 +19,13 @@ def load_session():
     except:
         return None
 
+def update_session_token(token):
+    """Guardar el token de sesión renovado por el servidor"""
+    session = load_session()
+    if session and token and session.get("token") != token:
+        session["token"] = token
+        save_session(session)
+
 def clear_session():
     """Eliminar archivo de sesión"""
     if os.path.exists(SESSION_FILE):
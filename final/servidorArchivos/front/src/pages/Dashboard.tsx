@@ -1,4 +1,4 @@
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useRef } from 'react';
 import styled from 'styled-components';
 import axios from 'axios';
 import { useAuth } from '../contexts/AuthContext';
@@ -11,9 +11,16 @@ interface FileItem {
   type: 'file' | 'directory';
 }
 
+// Archivos por página: el resto se pide con "Cargar más"
+const PAGE_SIZE = 200;
+const MAX_PAGE_SIZE = 1000;
+
 const Dashboard: React.FC = () => {
   const { user, userRole, logout } = useAuth();
   const [files, setFiles] = useState<FileItem[]>([]);
+  const [nextCursor, setNextCursor] = useState<string | null>(null);
+  // Cuántos archivos hay cargados, para que el refresco periódico no descarte las páginas extra
+  const loadedCountRef = useRef(PAGE_SIZE);
   const [isLoading, setIsLoading] = useState(true);
   const [error, setError] = useState<string | null>(null);
   const [selectedFile, setSelectedFile] = useState<FileItem | null>(null);
@@ -46,9 +53,12 @@ const Dashboard: React.FC = () => {
     setError(null);
 
     try {
-      const response = await axios.get('/api/files', { withCredentials: true });
-      console.log('API response:', response.data); // Debug log
+      const response = await axios.get('/api/files', {
+        params: { limit: Math.min(loadedCountRef.current, MAX_PAGE_SIZE) },
+        withCredentials: true
+      });
       setFiles(response.data.files || []);
+      setNextCursor(response.data.next_cursor || null);
     } catch (err: any) {
       console.error('Error fetching files:', err);
 
@@ -67,6 +77,21 @@ const Dashboard: React.FC = () => {
     }
   };
 
+  const loadMoreFiles = async () => {
+    if (!nextCursor) return;
+    try {
+      const response = await axios.get('/api/files', {
+        params: { limit: PAGE_SIZE, cursor: nextCursor },
+        withCredentials: true
+      });
+      setFiles((previous) => [...previous, ...(response.data.files || [])]);
+      setNextCursor(response.data.next_cursor || null);
+      loadedCountRef.current += PAGE_SIZE;
+    } catch (err: any) {
+      setError(err.response?.data?.error || 'Error al cargar más archivos');
+    }
+  };
+
   const handleFileSelect = (file: FileItem) => {
     setSelectedFile(file === selectedFile ? null : file);
   };
@@ -76,17 +101,17 @@ const Dashboard: React.FC = () => {
     if (!files || files.length === 0) return;
 
     const file = files[0];
-    const formData = new FormData();
-    formData.append('file', file);
 
     setUploadProgress(0);
     setError(null);
 
     try {
-      await axios.post('/api/files/upload', formData, {
+      // Cuerpo crudo: la API lo reenvía al servidor sin guardarlo en disco
+      await axios.post('/api/files/upload', file, {
         withCredentials: true,
+        params: { name: file.name },
         headers: {
-          'Content-Type': 'multipart/form-data',
+          'Content-Type': 'application/octet-stream',
         },
         onUploadProgress: (progressEvent) => {
           if (progressEvent.total) {
@@ -274,6 +299,10 @@ const Dashboard: React.FC = () => {
                   <div>{new Date(file.modified).toLocaleString()}</div>
                 </FileItem>
               ))}
+
+              {nextCursor && (
+                <RefreshButton onClick={loadMoreFiles}>Cargar más</RefreshButton>
+              )}
             </FileList>
           )}
         </MainContent>
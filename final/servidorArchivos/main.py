@@ -16,6 +16,7 @@ warnings.filterwarnings("ignore", category=DeprecationWarning)
 sys.path.append(os.path.abspath(os.path.dirname(__file__)))
 # 📚 Importaciones de módulos propios
 from server.servidor import manejar_cliente
+from server.admision import ControlAdmision
 from baseDeDatos.db import crear_tablas
 from utils.config import verificar_configuracion_env, crear_directorio_si_no_existe, configurar_argumentos
 from utils.config import CERT_PATH, KEY_PATH, BASE_DIR
@@ -25,12 +26,6 @@ from utils.ip import obtener_ip_local
 # 📝 Configurar logging
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 
-# Verificar configuración del archivo .env
-verificar_configuracion_env()
-
-# ⚙️ Crear tablas si no existen
-crear_tablas()
-
 
 def iniciar_servidor_ssl(host=None, port=None, directorio=None):
     # Usar valores predeterminados si no se proporcionan
@@ -79,12 +74,15 @@ def iniciar_servidor_ssl(host=None, port=None, directorio=None):
             family = "IPv6" if sock.family == socket.AF_INET6 else "IPv4"
             print(f"   ✅ Socket {i+1}: {family}")
 
+        # Pool fijo de hilos para atender clientes (compartido por IPv4 e IPv6)
+        control = ControlAdmision(manejar_cliente).iniciar()
+
         # Crear hilos para cada socket
         hilos = []
         for sock in sockets_servidor:
             hilo = threading.Thread(
                 target=_escuchar_conexiones_socket,
-                args=(sock, contexto, directorio),
+                args=(sock, contexto, directorio, control),
                 daemon=True,
                 name=f"socket-listener-{'IPv6' if sock.family == socket.AF_INET6 else 'IPv4'}"
             )
@@ -127,7 +125,7 @@ def iniciar_servidor_ssl(host=None, port=None, directorio=None):
 # Conjunto global para rastrear IPs que ya se han conectado
 _ips_conectadas = set()
 
-def _escuchar_conexiones_socket(servidor, contexto, directorio):
+def _escuchar_conexiones_socket(servidor, contexto, directorio, control):
     family_type = "IPv6" if servidor.family == socket.AF_INET6 else "IPv4"
     print(f"👂 Esperando conexiones {family_type} entrantes...")
     # PID/TID del hilo aceptador
@@ -153,27 +151,9 @@ def _escuchar_conexiones_socket(servidor, contexto, directorio):
                     print(f"✅ Nueva conexión desde {ip_cliente} ({family_type})")
                     _ips_conectadas.add(ip_cliente)
 
-                try:
-                    # Envolver con SSL
-                    conexion_ssl = contexto.wrap_socket(conexion, server_side=True)
-
-                    # Iniciar hilo para manejar cliente
-                    hilo = threading.Thread(
-                        target=manejar_cliente,
-                        args=(conexion_ssl, direccion, directorio),
-                        daemon=True,
-                        name=f"cliente-{ip_cliente}"
-                    )
-                    hilo.start()
-                    # 🧵 Print informativo de hilo de cliente levantado con PID/TID
-                    try:
-                        import os
-                        print(f"🧵 Hilo para cliente {ip_cliente} ({family_type}) levantado (PID: {os.getpid()}, TID: {hilo.ident})")
-                    except Exception:
-                        print(f"🧵 Hilo para cliente {ip_cliente} ({family_type}) levantado")
-                except ssl.SSLError as error:
-                    logging.error(f"🔒 Error SSL con {ip_cliente}: {error}")
-                    conexion.close()
+                # Encolar en el pool (SSL + sesión en un hilo del pool);
+                # si no hay lugar, se rechaza con "servidor ocupado"
+                control.enviar(conexion, direccion, contexto, directorio)
             except Exception as e:
                 logging.error(f"❌ Error al aceptar conexión {family_type}: {e}")
     finally:
@@ -328,7 +308,14 @@ def _iniciar_modo_servidor(args):
     worker_process = iniciar_worker_celery()
 
     try:
-        iniciar_servidor_ssl(args.host, args.port, args.directorio)
+        if args.workers > 1:
+            from server.supervisor import iniciar_supervisor
+            iniciar_supervisor(args.host, args.port, args.directorio, args.engine, args.workers)
+        elif args.engine == 'asyncio':
+            from server.servidor_asyncio import iniciar_servidor_asyncio
+            iniciar_servidor_asyncio(args.host, args.port, args.directorio)
+        else:
+            iniciar_servidor_ssl(args.host, args.port, args.directorio)
     except KeyboardInterrupt:
         print("\n🛑 Apagando servidor y worker Celery...")
         if worker_process:
@@ -367,6 +354,14 @@ def _iniciar_modo_cli(args):
 
 
 if __name__ == "__main__":
+    # Solo en el proceso principal: los procesos de bcrypt (spawn/forkserver)
+    # importan este módulo como __mp_main__
+    # Verificar configuración del archivo .env
+    verificar_configuracion_env()
+
+    # ⚙️ Crear tablas si no existen
+    crear_tablas()
+
     # 📋 Obtener argumentos de línea de comandos
     args = configurar_argumentos(modo_dual=True)
 
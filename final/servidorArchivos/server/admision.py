@@ -0,0 +1,223 @@
+import os
+import ssl
+import time
+import queue
+import socket
+import logging
+import threading
+
+# Control de admisión para el servidor: en lugar de un hilo por conexión, un pool
+# fijo de hilos consume una cola de aceptación acotada. Las conexiones que exceden
+# la cola o los límites de sesiones se rechazan de inmediato con "servidor ocupado".
+
+# ⚙️ Configuración (variables de entorno)
+MAX_HILOS = int(os.getenv("SERVER_MAX_HILOS", 64))
+TAM_COLA_ACEPTACION = int(os.getenv("SERVER_COLA_ACEPTACION", 128))
+MAX_SESIONES = int(os.getenv("SERVER_MAX_SESIONES", MAX_HILOS + TAM_COLA_ACEPTACION))
+MAX_SESIONES_POR_IP = int(os.getenv("SERVER_MAX_SESIONES_IP", 32))
+TIMEOUT_HANDSHAKE = float(os.getenv("SERVER_TIMEOUT_HANDSHAKE", 30))
+TIMEOUT_RECHAZO = 2.0  # Handshake breve solo para avisar del rechazo
+
+MENSAJE_OCUPADO = "⛔ Servidor ocupado. Intenta nuevamente en unos segundos.\n"
+
+# Motivos de rechazo
+RECHAZO_COLA = 'cola_llena'
+RECHAZO_GLOBAL = 'limite_global'
+RECHAZO_IP = 'limite_ip'
+
+
+class LimitadorSesiones:
+    """Cuenta sesiones abiertas, globales y por IP, de forma thread-safe."""
+
+    def __init__(self, max_sesiones=MAX_SESIONES, max_por_ip=MAX_SESIONES_POR_IP):
+        self.max_sesiones = max_sesiones
+        self.max_por_ip = max_por_ip
+        self._lock = threading.Lock()
+        self._por_ip = {}
+        self._total = 0
+
+    def adquirir(self, ip):
+        """Retorna None si la sesión fue admitida o el motivo del rechazo."""
+        with self._lock:
+            if self._total >= self.max_sesiones:
+                return RECHAZO_GLOBAL
+            if self._por_ip.get(ip, 0) >= self.max_por_ip:
+                return RECHAZO_IP
+            self._total += 1
+            self._por_ip[ip] = self._por_ip.get(ip, 0) + 1
+            return None
+
+    def liberar(self, ip):
+        with self._lock:
+            self._total = max(0, self._total - 1)
+            restantes = self._por_ip.get(ip, 0) - 1
+            if restantes > 0:
+                self._por_ip[ip] = restantes
+            else:
+                self._por_ip.pop(ip, None)
+
+    def sesiones_activas(self):
+        with self._lock:
+            return self._total
+
+    def ips_activas(self):
+        with self._lock:
+            return len(self._por_ip)
+
+
+class ControlAdmision:
+    """
+    Pool fijo de hilos que atiende clientes desde una cola de aceptación acotada.
+    El handshake TLS se hace en el hilo del pool, no en el hilo que llama accept().
+    """
+
+    def __init__(self, manejador, max_hilos=MAX_HILOS, tam_cola=TAM_COLA_ACEPTACION,
+                 limitador=None):
+        self._manejador = manejador
+        self.max_hilos = max_hilos
+        self._cola = queue.Queue(maxsize=tam_cola)
+        self._rechazos = queue.Queue(maxsize=tam_cola)
+        self.limitador = limitador or LimitadorSesiones()
+        self._hilos = []
+        self._lock = threading.Lock()
+        self._contadores = {
+            'aceptadas': 0,
+            'atendidas': 0,
+            RECHAZO_COLA: 0,
+            RECHAZO_GLOBAL: 0,
+            RECHAZO_IP: 0,
+            'errores_ssl': 0,
+        }
+        self._espera_total = 0.0
+        self._espera_max = 0.0
+        self._hilos_ocupados = 0
+
+    def iniciar(self):
+        for i in range(self.max_hilos):
+            hilo = threading.Thread(target=self._trabajar, daemon=True, name=f"pool-cliente-{i}")
+            hilo.start()
+            self._hilos.append(hilo)
+        threading.Thread(target=self._procesar_rechazos, daemon=True, name="pool-rechazos").start()
+        registrar_fuente_estadisticas(self.estadisticas)
+        print(f"🧵 Pool de {self.max_hilos} hilos listo (cola: {self._cola.maxsize}, "
+              f"máx. sesiones: {self.limitador.max_sesiones}, por IP: {self.limitador.max_por_ip})")
+        return self
+
+    def enviar(self, conexion, direccion, contexto_ssl, directorio):
+        """
+        Encola una conexión recién aceptada. Nunca bloquea: si no hay lugar,
+        la conexión se rechaza y se retorna False.
+        """
+        ip_cliente = direccion[0]
+        motivo = self.limitador.adquirir(ip_cliente)
+        if motivo is None:
+            try:
+                self._cola.put_nowait((time.monotonic(), conexion, direccion, contexto_ssl, directorio))
+                self._incrementar('aceptadas')
+                return True
+            except queue.Full:
+                self.limitador.liberar(ip_cliente)
+                motivo = RECHAZO_COLA
+
+        self._incrementar(motivo)
+        logging.warning(f"⛔ Conexión de {ip_cliente} rechazada ({motivo})")
+        try:
+            self._rechazos.put_nowait((conexion, contexto_ssl))
+        except queue.Full:
+            # Ni siquiera hay lugar para avisar: cerrar sin handshake
+            _cerrar(conexion)
+        return False
+
+    def _trabajar(self):
+        while True:
+            encolada, conexion, direccion, contexto_ssl, directorio = self._cola.get()
+            espera = time.monotonic() - encolada
+            with self._lock:
+                self._espera_total += espera
+                self._espera_max = max(self._espera_max, espera)
+                self._hilos_ocupados += 1
+            ip_cliente = direccion[0]
+            try:
+                try:
+                    conexion.settimeout(TIMEOUT_HANDSHAKE)
+                    conexion_ssl = contexto_ssl.wrap_socket(conexion, server_side=True)
+                    conexion_ssl.settimeout(None)
+                except (ssl.SSLError, OSError) as error:
+                    self._incrementar('errores_ssl')
+                    logging.error(f"🔒 Error SSL con {ip_cliente}: {error}")
+                    _cerrar(conexion)
+                    continue
+                self._manejador(conexion_ssl, direccion, directorio)
+            except Exception as error:
+                logging.error(f"❌ Error en hilo del pool con {ip_cliente}: {error}")
+            finally:
+                self.limitador.liberar(ip_cliente)
+                with self._lock:
+                    self._hilos_ocupados -= 1
+                    self._contadores['atendidas'] += 1
+
+    def _procesar_rechazos(self):
+        while True:
+            conexion, contexto_ssl = self._rechazos.get()
+            try:
+                conexion.settimeout(TIMEOUT_RECHAZO)
+                conexion_ssl = contexto_ssl.wrap_socket(conexion, server_side=True)
+                conexion_ssl.sendall(MENSAJE_OCUPADO.encode('utf-8'))
+                _cerrar(conexion_ssl)
+            except Exception:
+                _cerrar(conexion)
+
+    def _incrementar(self, contador):
+        with self._lock:
+            self._contadores[contador] += 1
+
+    def estadisticas(self):
+        with self._lock:
+            contadores = dict(self._contadores)
+            espera_total = self._espera_total
+            espera_max = self._espera_max
+            ocupados = self._hilos_ocupados
+        atendidas = contadores['atendidas'] + ocupados
+        return {
+            'motor': 'threads',
+            **contadores,
+            'rechazadas': contadores[RECHAZO_COLA] + contadores[RECHAZO_GLOBAL] + contadores[RECHAZO_IP],
+            'hilos': self.max_hilos,
+            'hilos_ocupados': ocupados,
+            'en_cola': self._cola.qsize(),
+            'sesiones_activas': self.limitador.sesiones_activas(),
+            'ips_activas': self.limitador.ips_activas(),
+            'espera_cola_promedio_ms': round(espera_total / atendidas * 1000, 2) if atendidas else 0.0,
+            'espera_cola_max_ms': round(espera_max * 1000, 2),
+        }
+
+
+def _cerrar(conexion):
+    try:
+        conexion.shutdown(socket.SHUT_RDWR)
+    except Exception:
+        pass
+    try:
+        conexion.close()
+    except Exception:
+        pass
+
+
+# 📊 Estadísticas expuestas al comando ESTADISTICAS
+_fuentes_estadisticas = []
+
+
+def registrar_fuente_estadisticas(fuente):
+    """Registra una función sin argumentos que retorna un dict de contadores."""
+    if fuente not in _fuentes_estadisticas:
+        _fuentes_estadisticas.append(fuente)
+
+
+def obtener_estadisticas():
+    resultado = {'pid': os.getpid()}
+    for fuente in _fuentes_estadisticas:
+        try:
+            resultado.update(fuente())
+        except Exception as error:
+            logging.error(f"❌ Error al obtener estadísticas: {error}")
+    return resultado
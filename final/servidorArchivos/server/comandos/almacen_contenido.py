@@ -0,0 +1,155 @@
+import os
+import sys
+import logging
+import threading
+
+# Configuración básica
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+from server.admision import registrar_fuente_estadisticas
+from utils.integridad import leer_hash_calculado, calcular_sha256
+
+# 🧱 Almacén direccionado por contenido (opcional). Cada contenido distinto se
+# guarda una sola vez como blob en "<directorio>/.blobs/ab/cd/<sha256>" y cada
+# nombre del directorio es un hard link a su blob. La cantidad de referencias
+# es el contador de links del inode (st_nlink - 1): no hace falta una tabla
+# aparte que pueda desincronizarse con el disco.
+#
+# Como los nombres siguen siendo archivos regulares, LISTAR, DESCARGAR,
+# RENOMBRAR y la verificación funcionan sin cambios. Un
+# nombre deduplicado comparte el inode con su blob, así que conserva el mtime
+# de la primera subida de ese contenido. El servidor nunca escribe sobre un
+# archivo existente, por lo que compartir el inode es seguro. El nombre
+# ".blobs" está reservado: ningún comando puede renombrarlo ni borrarlo.
+
+# ⚙️ Configuración (variables de entorno)
+ALMACEN_CAS = os.getenv("SERVER_ALMACEN_CAS", "0") == "1"
+
+DIRECTORIO_BLOBS = ".blobs"
+
+_contadores = {'cas_deduplicados': 0, 'cas_subidas_evitadas': 0, 'cas_bytes_ahorrados': 0,
+               'cas_blobs_liberados': 0}
+_lock_contadores = threading.Lock()
+# Serializa "enlazar a un blob" con "liberar el blob" dentro del proceso
+_lock_blobs = threading.Lock()
+
+
+def _estadisticas():
+    with _lock_contadores:
+        return {'cas_activo': ALMACEN_CAS, **_contadores}
+
+
+registrar_fuente_estadisticas(_estadisticas)
+
+
+def _contar(clave, delta=1):
+    with _lock_contadores:
+        _contadores[clave] += delta
+
+
+def ruta_blob(directorio_base, sha256):
+    """Dos niveles de 256 subdirectorios: ningún directorio de blobs crece sin límite."""
+    return os.path.join(directorio_base, DIRECTORIO_BLOBS, sha256[:2], sha256[2:4], sha256)
+
+
+def _es_sha256(texto):
+    return len(texto) == 64 and all(c in '0123456789abcdef' for c in texto)
+
+
+def buscar(directorio_base, sha256):
+    """Ruta del blob con ese contenido, o None si el almacén no lo tiene."""
+    if not ALMACEN_CAS or not sha256 or not _es_sha256(sha256.lower()):
+        return None
+    blob = ruta_blob(directorio_base, sha256.lower())
+    return blob if os.path.isfile(blob) else None
+
+
+def enlazar_existente(directorio_base, sha256, ruta):
+    """
+    Publica bajo `ruta` el contenido ya almacenado con ese SHA-256, sin recibir
+    nada. Retorna el tamaño, o None si el almacén no lo tiene (el cliente debe
+    enviarlo). Lanza FileExistsError si `ruta` ya existe.
+
+    Cualquier usuario autenticado puede descargar cualquier archivo del
+    directorio, así que conocer un hash no da acceso a nada que no tuviera ya.
+    """
+    blob = buscar(directorio_base, sha256)
+    if not blob:
+        return None
+    with _lock_blobs:
+        try:
+            os.link(blob, ruta)
+        except FileNotFoundError:
+            # Liberado entre la búsqueda y el link
+            return None
+    tamaño = os.stat(ruta).st_size
+    _contar('cas_subidas_evitadas')
+    _contar('cas_bytes_ahorrados', tamaño)
+    logging.info(f"🧱 '{os.path.basename(ruta)}' enlazado a contenido ya almacenado, sin transferir ({tamaño} bytes)")
+    return tamaño
+
+
+def guardar(directorio_base, ruta, sha256):
+    """
+    Incorpora al almacén el archivo recién recibido en `ruta`. Si ya hay un blob
+    con ese contenido, `ruta` pasa a ser un link a él y el archivo recibido se
+    descarta. Retorna True si se deduplicó.
+    """
+    if not ALMACEN_CAS:
+        return False
+    blob = ruta_blob(directorio_base, sha256)
+    os.makedirs(os.path.dirname(blob), exist_ok=True)
+    with _lock_blobs:
+        try:
+            # Primer archivo con este contenido: él mismo es el blob
+            os.link(ruta, blob)
+            return False
+        except FileExistsError:
+            pass
+        if os.path.samefile(ruta, blob):
+            return False
+
+        # El link temporal va junto al blob (mismo sistema de archivos, fuera del listado)
+        temporal = f"{blob}.{os.getpid()}-{threading.get_ident()}"
+        try:
+            os.link(blob, temporal)
+        except FileNotFoundError:
+            # Otro proceso liberó el blob entretanto: este archivo pasa a serlo
+            os.link(ruta, blob)
+            return False
+        tamaño = os.stat(ruta).st_size
+        # replace es atómico: el nombre nunca queda sin contenido
+        os.replace(temporal, ruta)
+
+    _contar('cas_deduplicados')
+    _contar('cas_bytes_ahorrados', tamaño)
+    logging.info(f"🧱 '{os.path.basename(ruta)}' deduplicado: contenido ya almacenado ({tamaño} bytes)")
+    return True
+
+
+def eliminar(directorio_base, ruta):
+    """Borra el nombre `ruta` y, si era la última referencia, también su blob."""
+    blob = _blob_de(directorio_base, ruta)
+    with _lock_blobs:
+        os.remove(ruta)
+        if blob:
+            try:
+                if os.stat(blob).st_nlink == 1:
+                    os.remove(blob)
+                    _contar('cas_blobs_liberados')
+            except FileNotFoundError:
+                pass
+
+
+def _blob_de(directorio_base, ruta):
+    """Blob que comparte el inode con `ruta`, o None si no está en el almacén."""
+    try:
+        if os.stat(ruta).st_nlink < 2:
+            return None
+        # Sin hash vigente en el índice (archivo sin rehashear, índice reconstruido)
+        # se recalcula: si no, el blob quedaría huérfano al borrar el último nombre
+        sha256 = leer_hash_calculado(ruta) or calcular_sha256(ruta)
+        blob = ruta_blob(directorio_base, sha256)
+        return blob if os.path.exists(blob) and os.path.samefile(ruta, blob) else None
+    except OSError:
+        return None
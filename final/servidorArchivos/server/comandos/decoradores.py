@@ -1,6 +1,9 @@
 
 import os
 import sys
+import time
+import threading
+from collections import OrderedDict
 from functools import wraps
 
 # Configuración básica
@@ -14,6 +17,17 @@ NIVELES_PERMISOS = {
     'admin': 2
 }
 
+# ⚙️ Configuración (variables de entorno)
+TTL_CACHE_PERMISOS = float(os.getenv("SERVER_CACHE_PERMISOS_TTL", 30))   # Segundos (0: sin caché)
+MAX_CACHE_PERMISOS = int(os.getenv("SERVER_CACHE_PERMISOS_MAX", 1024))   # Usuarios en caché
+
+# 🗝️ Caché de permisos por usuario_id: evita consultar la tabla usuarios en cada
+# comando. APROBAR invalida la entrada del usuario afectado en este proceso; en
+# los demás workers el cambio se ve como máximo TTL_CACHE_PERMISOS segundos después.
+_cache_permisos = OrderedDict()  # usuario_id -> (permisos, expira)
+_lock_cache_permisos = threading.Lock()
+_contadores_cache = {'permisos_cache_aciertos': 0, 'permisos_cache_fallos': 0}
+
 # Decorador para validar argumentos
 def validar_argumentos(num_args=None, min_args=None, max_args=None, mensaje_error=None):
     def decorador(func):
@@ -35,19 +49,64 @@ def validar_argumentos(num_args=None, min_args=None, max_args=None, mensaje_erro
         return wrapper
     return decorador
 
+def invalidar_permisos(usuario_id=None):
+    """Descarta los permisos en caché de un usuario (o de todos si no se indica)."""
+    with _lock_cache_permisos:
+        if usuario_id is None:
+            _cache_permisos.clear()
+        else:
+            _cache_permisos.pop(usuario_id, None)
+
+def estadisticas_cache_permisos():
+    with _lock_cache_permisos:
+        datos = dict(_contadores_cache)
+        datos['permisos_cache_usuarios'] = len(_cache_permisos)
+    return datos
+
+def _permisos_en_cache(usuario_id):
+    with _lock_cache_permisos:
+        entrada = _cache_permisos.get(usuario_id)
+        if entrada and entrada[1] > time.monotonic():
+            _cache_permisos.move_to_end(usuario_id)
+            _contadores_cache['permisos_cache_aciertos'] += 1
+            return entrada[0]
+        _contadores_cache['permisos_cache_fallos'] += 1
+        return None
+
+def _guardar_permisos_en_cache(usuario_id, permisos):
+    if TTL_CACHE_PERMISOS <= 0:
+        return
+    with _lock_cache_permisos:
+        _cache_permisos[usuario_id] = (permisos, time.monotonic() + TTL_CACHE_PERMISOS)
+        _cache_permisos.move_to_end(usuario_id)
+        while len(_cache_permisos) > MAX_CACHE_PERMISOS:
+            _cache_permisos.popitem(last=False)
+
+def _obtener_permisos(usuario_id):
+    permisos_usuario = _permisos_en_cache(usuario_id)
+    if permisos_usuario:
+        return permisos_usuario
+
+    conn = obtener_conexion()
+    try:
+        # Obtener permisos del usuario
+        from .permisos import _obtener_permisos_usuario
+        permisos_usuario = _obtener_permisos_usuario(conn.cursor(), usuario_id)
+    finally:
+        conn.close()
+
+    # Un usuario inexistente no se guarda: podría registrarse después
+    if permisos_usuario:
+        _guardar_permisos_en_cache(usuario_id, permisos_usuario)
+    return permisos_usuario
+
 # Función para verificar si un usuario tiene un nivel de permiso específico
 def _tiene_permiso(usuario_id, nivel_requerido):
     if not usuario_id:
         return False
 
     try:
-        conn = obtener_conexion()
-        cursor = conn.cursor()
-
-        # Obtener permisos del usuario
-        from .permisos import _obtener_permisos_usuario
-        permisos_usuario = _obtener_permisos_usuario(cursor, usuario_id)
-        conn.close()
+        permisos_usuario = _obtener_permisos(usuario_id)
 
         if not permisos_usuario:
             return False
@@ -4,14 +4,23 @@ import sys
 # Configuración básica
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
 
+from baseDeDatos.db import estadisticas_pool, estadisticas_logs
+from server.admision import registrar_fuente_estadisticas
+from server.seguridad import estadisticas_autenticacion
+
 # Importar decoradores desde el módulo de decoradores
-from .decoradores import requiere_permiso, validar_argumentos
+from .decoradores import requiere_permiso, validar_argumentos, estadisticas_cache_permisos
 
 # Importar funciones de operaciones con archivos
 from .operaciones_archivos import (
     listar_archivos, crear_archivo, eliminar_archivo, renombrar_archivo,
     verificar_estado_archivo, descargar_archivo, verificar_estado_todos_archivos,
-    estado_archivo_en_bd, estado_todos_en_bd
+    estado_archivo_en_bd, estado_todos_en_bd, info_archivo
+)
+
+# Importar funciones de subidas por bloques
+from .operaciones_subidas import (
+    abrir_subida, recibir_bloque, estado_subida, finalizar_subida, cancelar_subida
 )
 
 # Importar funciones de gestión de permisos
@@ -20,10 +29,28 @@ from .permisos import (
     ver_solicitudes_permisos, listar_usuarios_sistema
 )
 
+# Uso del pool de conexiones SQLite, del escritor de logs y de las cachés de permisos y autenticación en ESTADISTICAS
+registrar_fuente_estadisticas(estadisticas_pool)
+registrar_fuente_estadisticas(estadisticas_logs)
+registrar_fuente_estadisticas(estadisticas_cache_permisos)
+registrar_fuente_estadisticas(estadisticas_autenticacion)
+
 # Manejadores de comandos
 @requiere_permiso('usuario')
+@validar_argumentos(min_args=0, max_args=4,
+                   mensaje_error="❌ Formato incorrecto. Usa: LISTAR [cursor|- [límite|- [prefijo [orden]]]]")
 def _cmd_listar_archivos(partes, directorio_base, usuario_id=None):
-    return listar_archivos(directorio_base)
+    # Sin argumentos: el listado completo de siempre. "-" es la primera página / el límite predeterminado.
+    if len(partes) == 1:
+        return listar_archivos(directorio_base)
+    cursor = partes[1] if partes[1] != "-" else ""
+    try:
+        limite = int(partes[2]) if len(partes) >= 3 and partes[2] != "-" else None
+    except ValueError:
+        return "❌ El límite debe ser un número entero."
+    prefijo = partes[3] if len(partes) >= 4 else None
+    orden = partes[4] if len(partes) == 5 else None
+    return listar_archivos(directorio_base, cursor, limite, prefijo, orden)
 
 @requiere_permiso('usuario')
 @validar_argumentos(min_args=1, max_args=2, 
@@ -33,9 +60,9 @@ def _cmd_crear_archivo(partes, directorio_base, usuario_id=None, conexion=None):
     nombre_archivo = partes[1]
 
     if len(partes) == 2:
-        return crear_archivo(directorio_base, nombre_archivo, None, conexion)
+        return crear_archivo(directorio_base, nombre_archivo, None, conexion, usuario_id)
     else:  # len(partes) == 3
-        return crear_archivo(directorio_base, nombre_archivo, partes[2], conexion)
+        return crear_archivo(directorio_base, nombre_archivo, partes[2], conexion, usuario_id)
 
 @requiere_permiso('usuario')
 @validar_argumentos(num_args=1, 
@@ -87,20 +114,65 @@ def _cmd_verificar_archivo(partes, directorio_base, usuario_id=None):
     return "❌ Uso: VERIFICAR [archivo]"
 
 @requiere_permiso('usuario')
-@validar_argumentos(num_args=1, 
-                   mensaje_error="❌ Formato incorrecto. Usa: DESCARGAR nombre_archivo")
+@validar_argumentos(min_args=1, max_args=3,
+                   mensaje_error="❌ Formato incorrecto. Usa: DESCARGAR nombre_archivo [desde [longitud]]")
 def _cmd_descargar_archivo(partes, directorio_base, usuario_id=None, conexion=None):
     # Extraer el nombre del archivo (puede contener espacios si está entre comillas)
     nombre_archivo = partes[1]
-    return descargar_archivo(directorio_base, nombre_archivo, conexion)
+    try:
+        desde = int(partes[2]) if len(partes) >= 3 else None
+        longitud = int(partes[3]) if len(partes) == 4 else None
+    except ValueError:
+        return "❌ El desde y la longitud deben ser números enteros."
+    return descargar_archivo(directorio_base, nombre_archivo, conexion, desde, longitud)
 
 @requiere_permiso('usuario')
 @validar_argumentos(min_args=1, max_args=2, 
-                   mensaje_error="❌ Formato incorrecto. Usa: SUBIR nombre_archivo [sha256]")
+                   mensaje_error="❌ Formato incorrecto. Usa: SUBIR nombre_archivo [sha256 | -]")
 def _cmd_subir_archivo(partes, directorio_base, usuario_id=None, conexion=None):
     nombre_archivo = partes[1]
     hash_esperado = partes[2] if len(partes) >= 3 else None
-    return crear_archivo(directorio_base, nombre_archivo, hash_esperado, conexion)
+    return crear_archivo(directorio_base, nombre_archivo, hash_esperado, conexion, usuario_id)
+
+@requiere_permiso('usuario')
+@validar_argumentos(min_args=2, max_args=3,
+                   mensaje_error="❌ Formato incorrecto. Usa: SUBIDA_ABRIR nombre_archivo tamaño [sha256]")
+def _cmd_abrir_subida(partes, directorio_base, usuario_id=None):
+    try:
+        tamaño = int(partes[2])
+    except ValueError:
+        return "❌ El tamaño debe ser un número entero."
+    hash_esperado = partes[3] if len(partes) == 4 else None
+    return abrir_subida(directorio_base, usuario_id, partes[1], tamaño, hash_esperado)
+
+@requiere_permiso('usuario')
+@validar_argumentos(min_args=2, max_args=3,
+                   mensaje_error="❌ Formato incorrecto. Usa: SUBIDA_BLOQUE id numero [sha256]")
+def _cmd_subir_bloque(partes, directorio_base, usuario_id=None, conexion=None):
+    try:
+        numero = int(partes[2])
+    except ValueError:
+        return "❌ El número de bloque debe ser un entero."
+    hash_bloque = partes[3] if len(partes) == 4 else None
+    return recibir_bloque(directorio_base, usuario_id, partes[1], numero, hash_bloque, conexion)
+
+@requiere_permiso('usuario')
+@validar_argumentos(num_args=1,
+                   mensaje_error="❌ Formato incorrecto. Usa: SUBIDA_ESTADO id")
+def _cmd_estado_subida(partes, directorio_base, usuario_id=None):
+    return estado_subida(usuario_id, partes[1])
+
+@requiere_permiso('usuario')
+@validar_argumentos(num_args=1,
+                   mensaje_error="❌ Formato incorrecto. Usa: SUBIDA_FINALIZAR id")
+def _cmd_finalizar_subida(partes, directorio_base, usuario_id=None):
+    return finalizar_subida(directorio_base, usuario_id, partes[1])
+
+@requiere_permiso('usuario')
+@validar_argumentos(num_args=1,
+                   mensaje_error="❌ Formato incorrecto. Usa: SUBIDA_CANCELAR id")
+def _cmd_cancelar_subida(partes, directorio_base, usuario_id=None):
+    return cancelar_subida(directorio_base, usuario_id, partes[1])
 
 @requiere_permiso('admin')
 @validar_argumentos(num_args=0, 
@@ -108,6 +180,15 @@ def _cmd_subir_archivo(partes, directorio_base, usuario_id=None, conexion=None):
 def _cmd_listar_usuarios_sistema(partes, directorio_base, usuario_id=None):
     return listar_usuarios_sistema()
 
+@requiere_permiso('admin')
+@validar_argumentos(num_args=0,
+                   mensaje_error="❌ Formato incorrecto. Usa: ESTADISTICAS")
+def _cmd_estadisticas(partes, directorio_base, usuario_id=None):
+    from server.admision import obtener_estadisticas
+    estadisticas = obtener_estadisticas()
+    lineas = [f"  • {clave}: {valor}" for clave, valor in estadisticas.items()]
+    return "📊 Estadísticas del servidor:\n" + "\n".join(lineas)
+
 @requiere_permiso('usuario')
 def _cmd_estado_archivo(partes, directorio_base, usuario_id=None):
     """Consulta de estado (solo lectura) sin encolar verificación."""
@@ -119,3 +200,10 @@ def _cmd_estado_archivo(partes, directorio_base, usuario_id=None):
         return estado_archivo_en_bd(directorio_base, partes[1])
     else:
         return "❌ Uso: ESTADO [archivo]"
+
+@requiere_permiso('usuario')
+@validar_argumentos(num_args=1,
+                   mensaje_error="❌ Formato incorrecto. Usa: INFO nombre_archivo")
+def _cmd_info_archivo(partes, directorio_base, usuario_id=None):
+    """Hashes esperado y calculado, usuario, fechas y última verificación (solo lectura)."""
+    return info_archivo(directorio_base, partes[1])
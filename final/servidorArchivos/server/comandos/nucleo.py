@@ -15,7 +15,9 @@ from .manejadores import (
     _cmd_renombrar_archivo, _cmd_solicitar_cambio_permisos,
     _cmd_aprobar_solicitud_permisos, _cmd_ver_solicitudes_permisos,
     _cmd_verificar_archivo, _cmd_descargar_archivo, _cmd_subir_archivo,
-    _cmd_listar_usuarios_sistema, _cmd_estado_archivo
+    _cmd_listar_usuarios_sistema, _cmd_estado_archivo, _cmd_estadisticas,
+    _cmd_abrir_subida, _cmd_subir_bloque, _cmd_estado_subida,
+    _cmd_finalizar_subida, _cmd_cancelar_subida, _cmd_info_archivo
 )
 
 # Mapeo de comandos a sus manejadores
@@ -29,9 +31,16 @@ COMANDOS = {
     "VER_SOLICITUDES": _cmd_ver_solicitudes_permisos,
     "VERIFICAR": _cmd_verificar_archivo,
     "ESTADO": _cmd_estado_archivo,
+    "INFO": _cmd_info_archivo,  # Metadatos del archivo (reemplaza descargar sus .hash/.sha256)
     "DESCARGAR": _cmd_descargar_archivo,
     "SUBIR": _cmd_subir_archivo,
+    "SUBIDA_ABRIR": _cmd_abrir_subida,          # Subidas por bloques reanudables
+    "SUBIDA_BLOQUE": _cmd_subir_bloque,
+    "SUBIDA_ESTADO": _cmd_estado_subida,
+    "SUBIDA_FINALIZAR": _cmd_finalizar_subida,
+    "SUBIDA_CANCELAR": _cmd_cancelar_subida,
     "LISTAR_USUARIOS": _cmd_listar_usuarios_sistema,  # Comando para administradores
+    "ESTADISTICAS": _cmd_estadisticas,  # Contadores del pool / admisión (administradores)
 }
 
 def manejar_comando(comando, directorio_base, usuario_id=None, conexion=None):
@@ -53,8 +62,8 @@ def manejar_comando(comando, directorio_base, usuario_id=None, conexion=None):
     manejador = COMANDOS.get(accion)
 
     if manejador:
-        # Pasar la conexión solo para comandos que la necesitan (DESCARGAR, SUBIR)
-        if accion in ["DESCARGAR", "SUBIR"]:
+        # Pasar la conexión solo para comandos que la necesitan (DESCARGAR, SUBIR, SUBIDA_BLOQUE)
+        if accion in ["DESCARGAR", "SUBIR", "SUBIDA_BLOQUE"]:
             return manejador(partes, directorio_base, usuario_id, conexion)
         else:
             return manejador(partes, directorio_base, usuario_id)
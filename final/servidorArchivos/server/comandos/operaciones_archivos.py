@@ -1,44 +1,212 @@
 import os
 import sys
+import heapq
+import base64
+import time
 import socket
 import hashlib
+import logging
+import threading
 from datetime import datetime
 
 # Configuración básica
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
 
 from tareas.celery import verificar_integridad_y_virus
-from baseDeDatos.db import obtener_conexion
+from baseDeDatos import metadatos, verificaciones, info_archivos
+from server.admision import registrar_fuente_estadisticas
+from . import almacen_contenido
+from utils.integridad import (guardar_hash_calculado, leer_hash_calculado, guardar_hash_esperado,
+                              leer_hash_esperado, EXTENSION_HASH_CALCULADO, EXTENSION_HASH_ESPERADO,
+                              SIDECARS_HASH)
+from utils.protocolo import recibir_exacto, HASH_AL_FINAL, MARCA_CURSOR
+
+# Directorios internos del servidor dentro del directorio servido (ver
+# reservar_nombre): ningún comando los acepta como nombre de archivo
+_NOMBRES_RESERVADOS = set()
+
+# ⚙️ Descargas (variables de entorno)
+CHUNK_DESCARGA = int(os.getenv("SERVER_CHUNK_DESCARGA", 256 * 1024))
+
+# ⚙️ Listado paginado (variables de entorno)
+LISTAR_LIMITE = int(os.getenv("SERVER_LISTAR_LIMITE", 100))     # Archivos por página si no se indica
+LISTAR_LIMITE_MAX = int(os.getenv("SERVER_LISTAR_LIMITE_MAX", 1000))
+
+_contadores_descarga = {'descargas': 0, 'descarga_bytes': 0, 'descarga_segundos': 0.0}
+_lock_descargas = threading.Lock()
+
+
+def _estadisticas_descargas():
+    with _lock_descargas:
+        segundos = _contadores_descarga['descarga_segundos']
+        return {
+            'descargas': _contadores_descarga['descargas'],
+            'descarga_bytes': _contadores_descarga['descarga_bytes'],
+            'descarga_mb_s_promedio': round(_contadores_descarga['descarga_bytes'] / segundos / 1e6, 1)
+            if segundos else 0,
+        }
+
+
+registrar_fuente_estadisticas(_estadisticas_descargas)
 
 def _enviar_mensaje(conexion, mensaje):
     if conexion:
         conexion.sendall(mensaje.encode('utf-8'))
 
-def listar_archivos(directorio_base):
+def _enviar_contenido(conexion, f, tamaño, desde=0):
+    """
+    Envía `tamaño` bytes de `f` a partir de `desde`. Retorna los bytes enviados.
+    Todas las conexiones son TLS (o canales v2 sobre TLS), así que el archivo
+    tiene que pasar por el proceso para cifrarse: SSLSocket.sendfile sería un
+    bucle de send de 8 KB, más lento que este.
+    """
+    f.seek(desde)
+
+    # Un único buffer reutilizado: readinto evita crear un bytes nuevo por bloque
+    buffer = bytearray(max(1, min(CHUNK_DESCARGA, tamaño)))
+    vista = memoryview(buffer)
+    enviados = 0
+    while enviados < tamaño:
+        leidos = f.readinto(vista[:min(len(buffer), tamaño - enviados)])
+        if not leidos:
+            break
+        conexion.sendall(vista[:leidos])
+        enviados += leidos
+    return enviados
+
+
+def _registrar_descarga(nombre_archivo, bytes_enviados, segundos):
+    with _lock_descargas:
+        _contadores_descarga['descargas'] += 1
+        _contadores_descarga['descarga_bytes'] += bytes_enviados
+        _contadores_descarga['descarga_segundos'] += segundos
+    mb_s = bytes_enviados / segundos / 1e6 if segundos > 0 else 0
+    logging.info(f"📤 '{nombre_archivo}' enviado: {bytes_enviados} bytes en {segundos:.3f}s "
+                 f"({mb_s:.1f} MB/s)")
+
+
+def listar_archivos(directorio_base, cursor=None, limite=None, prefijo=None, orden=None):
+    if cursor is not None or limite is not None or prefijo or orden:
+        return _listar_pagina(directorio_base, cursor, limite, prefijo, orden or 'nombre')
     try:
-        archivos = os.listdir(directorio_base)
-        if not archivos:
+        # Índice de metadatos: sin un stat por archivo si el directorio no cambió
+        try:
+            entradas = metadatos.listar(directorio_base)
+        except Exception as error:
+            logging.error(f"❌ Índice de metadatos no disponible, se recorre el directorio: {error}")
+            entradas = _escanear_directorio(directorio_base)
+
+        if not entradas:
             return "📂 No hay archivos en el servidor."
 
         # Formatear la lista de archivos incluyendo tamaño y fecha de modificación
         archivos_formateados = []
-        for archivo in archivos:
-            ruta_completa = os.path.join(directorio_base, archivo)
-            if os.path.isfile(ruta_completa):
-                # Obtener tamaño en bytes
-                tamaño = os.path.getsize(ruta_completa)
-                # Obtener fecha de modificación
-                fecha_mod = os.path.getmtime(ruta_completa)
-                # Convertir timestamp a formato legible
-                fecha_str = datetime.fromtimestamp(fecha_mod).strftime('%Y-%m-%d %H:%M:%S')
-                # Formatear línea con nombre, tamaño y fecha
-                archivos_formateados.append(f"{archivo} {tamaño} {fecha_str}")
+        for archivo, tamaño, mtime_ns in entradas:
+            # Convertir timestamp a formato legible
+            fecha_str = datetime.fromtimestamp(mtime_ns / 1e9).strftime('%Y-%m-%d %H:%M:%S')
+            # Formatear línea con nombre, tamaño y fecha
+            archivos_formateados.append(f"{archivo} {tamaño} {fecha_str}")
 
         return "\n".join(archivos_formateados)
     except Exception as error:
         return f"❌ Error al listar archivos: {error}"
 
-def crear_archivo(directorio_base, nombre_archivo, hash_esperado=None, conexion=None):
+def _listar_pagina(directorio_base, cursor, limite, prefijo, orden):
+    """
+    Una página del listado en el orden pedido (nombre, tamaño o fecha; con "-"
+    adelante, descendente). El cursor es opaco: en base64, el último nombre de
+    la página anterior o, si el orden es por tamaño o fecha, "valor/nombre"
+    (un nombre nunca contiene "/"). Así los nombres con espacios o comillas
+    viajan como un solo argumento.
+    """
+    try:
+        limite = LISTAR_LIMITE if limite is None else limite
+        if not 1 <= limite <= LISTAR_LIMITE_MAX:
+            return f"❌ El límite debe estar entre 1 y {LISTAR_LIMITE_MAX}."
+        if orden.lstrip("-") not in metadatos.ORDENES:
+            return f"❌ Orden inválido. Usa {', '.join(metadatos.ORDENES)} (con - adelante para descendente)."
+        por_nombre = metadatos.ORDENES[orden.lstrip("-")] is None
+        try:
+            despues_de = None
+            if cursor:
+                despues_de = base64.b64decode(cursor + "=" * (-len(cursor) % 4), altchars=b"-_",
+                                              validate=True).decode('utf-8')
+                if not por_nombre:
+                    valor, nombre = despues_de.split("/", 1)
+                    despues_de = (int(valor), nombre)
+        except (ValueError, UnicodeDecodeError):
+            return "❌ Cursor inválido. Usa el que devolvió la página anterior."
+
+        # Se pide uno de más para saber si hay otra página
+        try:
+            entradas = metadatos.listar_pagina(directorio_base, despues_de, limite + 1, prefijo, orden)
+        except Exception as error:
+            logging.error(f"❌ Índice de metadatos no disponible, se recorre el directorio: {error}")
+            entradas = _escanear_pagina(directorio_base, despues_de, limite + 1, prefijo, orden)
+
+        if not entradas:
+            return "📂 No hay archivos en el servidor." if despues_de is None and not prefijo \
+                else "📂 No hay más archivos."
+
+        lineas = [f"{archivo} {tamaño} {datetime.fromtimestamp(mtime_ns / 1e9).strftime('%Y-%m-%d %H:%M:%S')}"
+                  for archivo, tamaño, mtime_ns in entradas[:limite]]
+        if len(entradas) > limite:
+            nombre, tamaño, mtime_ns = entradas[limite - 1]
+            if not por_nombre:
+                nombre = f"{tamaño if orden.lstrip('-') == 'tamaño' else mtime_ns}/{nombre}"
+            siguiente = base64.urlsafe_b64encode(nombre.encode('utf-8')).decode('ascii').rstrip("=")
+            lineas.append(f"{MARCA_CURSOR}{siguiente}")
+        return "\n".join(lineas)
+    except Exception as error:
+        return f"❌ Error al listar archivos: {error}"
+
+def _escanear_pagina(directorio_base, despues_de, limite, prefijo, orden='nombre'):
+    """
+    Sin índice: por nombre, scandir lee solo nombres y el stat se hace para los
+    de la página; por tamaño o fecha hace falta el stat de todos.
+    """
+    descendente = orden.startswith("-")
+    elegir = heapq.nlargest if descendente else heapq.nsmallest
+    posterior = (lambda clave: clave < despues_de) if descendente else (lambda clave: clave > despues_de)
+
+    with os.scandir(directorio_base) as iterador:
+        candidatas = [entrada for entrada in iterador
+                      if (not prefijo or entrada.name.startswith(prefijo)) and entrada.is_file()]
+
+    if metadatos.ORDENES[orden.lstrip("-")] is None:
+        nombres = elegir(limite, (entrada.name for entrada in candidatas
+                                  if despues_de is None or posterior(entrada.name)))
+        entradas = []
+        for nombre in nombres:
+            try:
+                estado = os.stat(os.path.join(directorio_base, nombre))
+            except FileNotFoundError:
+                continue
+            entradas.append((nombre, estado.st_size, estado.st_mtime_ns))
+        return entradas
+
+    por_tamaño = orden.lstrip("-") == 'tamaño'
+    filas = []
+    for entrada in candidatas:
+        try:
+            estado = entrada.stat()
+        except FileNotFoundError:
+            continue
+        clave = (estado.st_size if por_tamaño else estado.st_mtime_ns, entrada.name)
+        if despues_de is None or posterior(clave):
+            filas.append((clave, (entrada.name, estado.st_size, estado.st_mtime_ns)))
+    return [fila for _, fila in elegir(limite, filas, key=lambda par: par[0])]
+
+def _escanear_directorio(directorio_base):
+    entradas = []
+    with os.scandir(directorio_base) as iterador:
+        for entrada in iterador:
+            if entrada.is_file():
+                estado = entrada.stat()
+                entradas.append((entrada.name, estado.st_size, estado.st_mtime_ns))
+    return sorted(entradas)
+
+def crear_archivo(directorio_base, nombre_archivo, hash_esperado=None, conexion=None, usuario_id=None):
     try:
         # Validar nombre de archivo
         if not _es_nombre_archivo_valido(nombre_archivo):
@@ -51,6 +219,22 @@ def crear_archivo(directorio_base, nombre_archivo, hash_esperado=None, conexion=
         if os.path.exists(ruta):
             return f"⚠️ El archivo '{nombre_archivo}' ya existe."
 
+        # El hash se calcula mientras se recibe: el archivo no se vuelve a leer
+        hasher = hashlib.sha256()
+
+        # "SUBIR nombre -": el cliente lo calcula mientras envía y lo manda al final
+        hash_al_final = hash_esperado == HASH_AL_FINAL
+        if hash_al_final:
+            hash_esperado = None
+
+        # Con el hash por adelantado, un contenido que ya está en el almacén no se vuelve a recibir
+        if conexion and hash_esperado:
+            tamaño = almacen_contenido.enlazar_existente(directorio_base, hash_esperado, ruta)
+            if tamaño is not None:
+                registrar_archivo_nuevo(directorio_base, nombre_archivo, hash_esperado.lower(), hash_esperado.lower(),
+                                        usuario_id)
+                return f"✅ Archivo '{nombre_archivo}' ya estaba almacenado: enlazado sin transferir ({tamaño} bytes)"
+
         # Si tenemos conexión, esperamos recibir el contenido del archivo
         if conexion:
             # Enviar mensaje de aceptación
@@ -64,21 +248,29 @@ def crear_archivo(directorio_base, nombre_archivo, hash_esperado=None, conexion=
             try:
                 with open(ruta, 'wb') as f:
                     while bytes_recibidos < tamaño:
-                        chunk_size = min(8192, tamaño - bytes_recibidos)
+                        chunk_size = min(65536, tamaño - bytes_recibidos)
                         try:
                             chunk = conexion.recv(chunk_size)
                             if not chunk:  # Conexión cerrada por el cliente
                                 raise ConnectionError("Conexión cerrada por el cliente durante la transferencia")
                             f.write(chunk)
+                            hasher.update(chunk)
                             bytes_recibidos += len(chunk)
                         except socket.timeout:
                             raise TimeoutError("Tiempo de espera agotado durante la recepción del archivo")
+                if hash_al_final:
+                    hash_esperado = recibir_exacto(conexion, 64).decode('ascii', errors='replace').lower()
             except (TimeoutError, ConnectionError, OSError) as e:
                 # Eliminar el archivo parcial si hubo un error
                 if os.path.exists(ruta):
                     os.remove(ruta)
                 raise Exception(f"Error durante la recepción del archivo: {str(e)}")
 
+            if hash_al_final and hash_esperado != hasher.hexdigest():
+                # El archivo no se registra: no coincide con lo que el cliente envió
+                os.remove(ruta)
+                return f"❌ El SHA-256 enviado no coincide con el contenido recibido. '{nombre_archivo}' descartado."
+
             # Enviar confirmación
             _enviar_mensaje(conexion, f"✅ Archivo '{nombre_archivo}' recibido correctamente ({bytes_recibidos} bytes)")
         else:
@@ -87,27 +279,7 @@ def crear_archivo(directorio_base, nombre_archivo, hash_esperado=None, conexion=
             with open(ruta, 'wb') as _:
                 pass
 
-        # Calcular el hash del archivo (calculado por el servidor)
-        hash_calculado = _calcular_hash_archivo(ruta)
-
-        # Preparar rutas para expected y calculated
-        ruta_hash_expected = f"{ruta}.hash"      # Hash esperado (del usuario o compat)
-        ruta_hash_calculated = f"{ruta}.sha256"  # Hash calculado por el servidor (auditoría)
-
-        if hash_esperado:
-            # Guardar el hash esperado provisto por el usuario
-            with open(ruta_hash_expected, 'w') as f:
-                f.write(hash_esperado)
-            # Guardar el hash calculado del servidor
-            with open(ruta_hash_calculated, 'w') as f:
-                f.write(hash_calculado)
-        else:
-            # Compatibilidad: si no se provee hash esperado, usar el calculado como referencia
-            with open(ruta_hash_expected, 'w') as f:
-                f.write(hash_calculado)
-
-        # Iniciar verificación en segundo plano
-        _iniciar_verificacion(ruta, hash_esperado)
+        registrar_archivo_nuevo(directorio_base, nombre_archivo, hasher.hexdigest(), hash_esperado, usuario_id)
 
         # Retornar mensaje apropiado (solo si no enviamos ya una respuesta)
         if not conexion:
@@ -119,6 +291,28 @@ def crear_archivo(directorio_base, nombre_archivo, hash_esperado=None, conexion=
     except Exception as error:
         return f"❌ Error al crear archivo: {error}"
 
+def registrar_archivo_nuevo(directorio_base, nombre_archivo, hash_calculado, hash_esperado=None, usuario_id=None):
+    """Hashes, metadatos, índice y verificación en segundo plano de un archivo recién recibido."""
+    ruta = os.path.join(directorio_base, nombre_archivo)
+
+    # Con el almacén por contenido activo, un contenido repetido no ocupa espacio extra
+    try:
+        almacen_contenido.guardar(directorio_base, ruta, hash_calculado)
+    except OSError as error:
+        # El archivo ya está completo bajo su nombre: solo se pierde la deduplicación
+        logging.error(f"❌ No se pudo incorporar '{nombre_archivo}' al almacén por contenido: {error}")
+
+    # Hash calculado por el servidor (auditoría), con la identidad del archivo para reutilizarlo
+    guardar_hash_calculado(ruta, hash_calculado)
+
+    # Hash esperado: el del usuario o, por compatibilidad, el calculado como referencia
+    guardar_hash_esperado(ruta, hash_esperado or hash_calculado, usuario_id)
+
+    metadatos.registrar_cambios(directorio_base, _con_archivos_hash(nombre_archivo))
+
+    # Iniciar verificación en segundo plano
+    _iniciar_verificacion(ruta, hash_esperado)
+
 def eliminar_archivo(directorio_base, nombre_archivo):
     try:
         # Validar nombre de archivo
@@ -128,17 +322,22 @@ def eliminar_archivo(directorio_base, nombre_archivo):
         # Construir ruta completa
         ruta = os.path.join(directorio_base, nombre_archivo)
 
-        # Verificar si existe
-        if not os.path.exists(ruta):
+        # Verificar si existe (solo archivos regulares: nunca un directorio)
+        if not os.path.isfile(ruta):
             return f"⚠️ Archivo '{nombre_archivo}' no encontrado."
 
-        # Eliminar archivo
-        os.remove(ruta)
-        
-        # Eliminar archivo de hash si existe
-        ruta_hash = f"{ruta}.hash"
-        if os.path.exists(ruta_hash):
-            os.remove(ruta_hash)
+        # Eliminar archivo (y su blob si era la última referencia)
+        almacen_contenido.eliminar(directorio_base, ruta)
+
+        # Sus metadatos (hashes incluidos) no sirven sin el archivo
+        hash_eliminado = info_archivos.eliminar(ruta)
+        con_sidecars = _usa_archivos_hash(hash_eliminado)
+        if con_sidecars:
+            hash_eliminado = _eliminar_archivos_hash(ruta) or hash_eliminado
+
+        metadatos.registrar_cambios(directorio_base, _con_archivos_hash(nombre_archivo, con_sidecars))
+
+        if hash_eliminado:
             return f"🗑️ Archivo '{nombre_archivo}' y su hash eliminados correctamente."
             
         return f"🗑️ Archivo '{nombre_archivo}' eliminado correctamente."
@@ -156,7 +355,7 @@ def renombrar_archivo(directorio_base, nombre_viejo, nombre_nuevo):
         ruta_nueva = os.path.join(directorio_base, nombre_nuevo)
 
         # Verificar si el archivo original existe
-        if not os.path.exists(ruta_vieja):
+        if not os.path.isfile(ruta_vieja):
             return f"⚠️ Archivo '{nombre_viejo}' no encontrado."
 
         # Verificar si el nuevo nombre ya existe
@@ -165,30 +364,70 @@ def renombrar_archivo(directorio_base, nombre_viejo, nombre_nuevo):
 
         # Renombrar archivo
         os.rename(ruta_vieja, ruta_nueva)
-        
-        # Renombrar archivo de hash si existe
-        ruta_hash_vieja = f"{ruta_vieja}.hash"
-        ruta_hash_nueva = f"{ruta_nueva}.hash"
-        
-        if os.path.exists(ruta_hash_vieja):
-            os.rename(ruta_hash_vieja, ruta_hash_nueva)
+
+        # Los metadatos pasan al nuevo nombre; el rename conserva inode y mtime,
+        # así que el hash calculado sigue vigente
+        hash_renombrado = info_archivos.renombrar(directorio_base, nombre_viejo, nombre_nuevo)
+        con_sidecars = _usa_archivos_hash(hash_renombrado)
+        if con_sidecars:
+            hash_renombrado = _renombrar_archivos_hash(ruta_vieja, ruta_nueva) or hash_renombrado
+
+        # La entrada del índice se mueve con su hash antes de refrescar ambos nombres
+        metadatos.renombrar(directorio_base, nombre_viejo, nombre_nuevo)
+        metadatos.registrar_cambios(
+            directorio_base,
+            _con_archivos_hash(nombre_viejo, con_sidecars) + _con_archivos_hash(nombre_nuevo, con_sidecars)
+        )
+
+        if hash_renombrado:
             return f"✏️ Archivo '{nombre_viejo}' y su hash renombrados a '{nombre_nuevo}'."
             
         return f"✏️ Archivo '{nombre_viejo}' renombrado a '{nombre_nuevo}'."
     except Exception as error:
         return f"❌ Error al renombrar archivo: {error}"
 
+def _con_archivos_hash(nombre_archivo, con_sidecars=SIDECARS_HASH):
+    if not con_sidecars:
+        return [nombre_archivo]
+    return [nombre_archivo, f"{nombre_archivo}{EXTENSION_HASH_ESPERADO}", f"{nombre_archivo}{EXTENSION_HASH_CALCULADO}"]
+
+def _usa_archivos_hash(con_metadatos):
+    # Un archivo sin fila en info_archivos es anterior a la migración y puede tener sidecars
+    return SIDECARS_HASH or not con_metadatos
+
+def _eliminar_archivos_hash(ruta):
+    eliminado = False
+    for extension in (EXTENSION_HASH_CALCULADO, EXTENSION_HASH_ESPERADO):
+        try:
+            os.remove(f"{ruta}{extension}")
+            eliminado = eliminado or extension == EXTENSION_HASH_ESPERADO
+        except FileNotFoundError:
+            pass
+    return eliminado
+
+def _renombrar_archivos_hash(ruta_vieja, ruta_nueva):
+    renombrado = False
+    for extension in (EXTENSION_HASH_CALCULADO, EXTENSION_HASH_ESPERADO):
+        try:
+            os.rename(f"{ruta_vieja}{extension}", f"{ruta_nueva}{extension}")
+            renombrado = renombrado or extension == EXTENSION_HASH_ESPERADO
+        except FileNotFoundError:
+            pass
+    return renombrado
+
+def reservar_nombre(nombre):
+    """Marca un directorio interno del servidor (dentro del directorio servido) como no disponible."""
+    _NOMBRES_RESERVADOS.add(nombre)
+
+reservar_nombre(almacen_contenido.DIRECTORIO_BLOBS)
+
 def _es_nombre_archivo_valido(nombre):
     # Caracteres prohibidos en nombres de archivo
     caracteres_prohibidos = ['/', '\\', ':', '*', '?', '"', '<', '>', '|']
+    if nombre in ('', '.', '..') or nombre in _NOMBRES_RESERVADOS:
+        return False
     return not any(c in nombre for c in caracteres_prohibidos)
 
-def _calcular_hash_archivo(ruta_archivo):
-    #
-    with open(ruta_archivo, 'rb') as archivo:
-        contenido = archivo.read()
-        return hashlib.sha256(contenido).hexdigest()
-
 def _iniciar_verificacion(ruta, hash_esperado=None):
     # Print de debugging para verificar que se está iniciando la verificación
     nombre_archivo = os.path.basename(ruta)
@@ -213,7 +452,23 @@ def _iniciar_verificacion(ruta, hash_esperado=None):
         except Exception as e2:
             print(f"❌ ERROR: Falló la verificación síncrona: {e2}")
 
-def descargar_archivo(directorio_base, nombre_archivo, conexion=None):
+def _resolver_rango(total, desde, longitud):
+    """
+    Segmento (desde, bytes) a enviar. Un `desde` negativo cuenta desde el final
+    (los últimos N bytes); sin `longitud` se envía hasta el final. Retorna None
+    si el segmento queda fuera del archivo.
+    """
+    if desde is None:
+        return 0, total
+    if desde < 0:
+        desde = max(0, total + desde)
+    if desde > total or (longitud is not None and longitud < 0):
+        return None
+    restantes = total - desde
+    return desde, restantes if longitud is None else min(longitud, restantes)
+
+
+def descargar_archivo(directorio_base, nombre_archivo, conexion=None, desde=None, longitud=None):
     try:
         # Validar nombre de archivo
         if not _es_nombre_archivo_valido(nombre_archivo):
@@ -222,8 +477,8 @@ def descargar_archivo(directorio_base, nombre_archivo, conexion=None):
         # Construir ruta completa
         ruta = os.path.join(directorio_base, nombre_archivo)
 
-        # Verificar si existe
-        if not os.path.exists(ruta):
+        # Verificar si existe (solo archivos regulares: nunca un directorio)
+        if not os.path.isfile(ruta):
             return f"⚠️ Archivo '{nombre_archivo}' no encontrado."
 
         # Si no tenemos conexión, no podemos enviar el archivo
@@ -231,27 +486,27 @@ def descargar_archivo(directorio_base, nombre_archivo, conexion=None):
             return f"⚠️ No se puede descargar '{nombre_archivo}'. Conexión no disponible."
 
         try:
-            # Obtener tamaño del archivo
-            file_size = os.path.getsize(ruta)
+            # Tamaño y versión del archivo: el cliente los usa para reanudar o validar rangos
+            estado = os.stat(ruta)
+            rango = _resolver_rango(estado.st_size, desde, longitud)
+            if rango is None:
+                return f"❌ Rango fuera del archivo '{nombre_archivo}' total={estado.st_size}"
+            desde, file_size = rango
 
-            # Enviar mensaje de aceptación con el tamaño
-            conexion.sendall(f"✅ Listo para enviar '{nombre_archivo}' ({file_size} bytes)\n".encode('utf-8'))
+            # Enviar mensaje de aceptación con los bytes que se van a enviar
+            conexion.sendall(f"✅ Listo para enviar '{nombre_archivo}' ({file_size} bytes) "
+                             f"desde={desde} total={estado.st_size} mtime_ns={estado.st_mtime_ns}\n".encode('utf-8'))
 
             # Esperar confirmación del cliente
             respuesta = conexion.recv(1024).decode().strip()
             if respuesta.upper() != "LISTO":
                 return f"❌ Cliente no está listo para recibir el archivo."
 
-            # Enviar el archivo en chunks
+            # Enviar el archivo (bloques grandes sin copias intermedias)
+            inicio = time.perf_counter()
             with open(ruta, 'rb') as f:
-                bytes_enviados = 0
-                chunk_size = 8192  # 8KB chunks
-                while bytes_enviados < file_size:
-                    chunk = f.read(chunk_size)
-                    if not chunk:
-                        break
-                    conexion.sendall(chunk)
-                    bytes_enviados += len(chunk)
+                bytes_enviados = _enviar_contenido(conexion, f, file_size, desde)
+            _registrar_descarga(nombre_archivo, bytes_enviados, time.perf_counter() - inicio)
 
             # Esperar confirmación final del cliente
             try:
@@ -282,57 +537,17 @@ def verificar_estado_archivo(directorio_base, nombre_archivo):
         # Construir ruta completa
         ruta = os.path.join(directorio_base, nombre_archivo)
 
-        # Verificar si existe
-        if not os.path.exists(ruta):
+        # Verificar si existe (solo archivos regulares: nunca un directorio)
+        if not os.path.isfile(ruta):
             return f"⚠️ Archivo '{nombre_archivo}' no encontrado."
 
-        # Obtener la fecha de modificación del archivo
-        fecha_mod = os.path.getmtime(ruta)
-        
-        # Consultar estado en la base de datos
-        # Buscar el registro de verificación más reciente después de la última modificación del archivo
-        conn = obtener_conexion()
-        cursor = conn.cursor()
-        
-        # Primero intentamos buscar por nombre o ruta (por si acaso)
-        cursor.execute("""
-            SELECT accion, mensaje, fecha FROM log_eventos 
-            WHERE accion = 'VERIFICACION' AND 
-            (mensaje LIKE ? OR mensaje LIKE ?)
-            ORDER BY fecha DESC LIMIT 1
-        """, (f"%{nombre_archivo}%", f"%{ruta}%"))
-        
-        resultado = cursor.fetchone()
-        
-        # Si no encontramos nada, buscamos el registro de verificación más reciente
-        if not resultado:
-            # Convertir fecha_mod a formato de fecha de SQLite
-            from datetime import datetime
-            fecha_mod_str = datetime.fromtimestamp(fecha_mod).strftime('%Y-%m-%d %H:%M:%S')
-            
-            cursor.execute("""
-                SELECT accion, mensaje, fecha FROM log_eventos 
-                WHERE accion = 'VERIFICACION' AND fecha > ?
-                ORDER BY fecha DESC LIMIT 1
-            """, (fecha_mod_str,))
-            
-            resultado = cursor.fetchone()
-        
-        conn.close()
+        # Última verificación registrada para este archivo (tabla verificaciones)
+        resultado = verificaciones.ultima(ruta)
 
         def _disparar_y_formatear(ruta_local):
             try:
-                # Cargar hash esperado desde archivo si existe
-                hash_expected = None
-                ruta_expected = f"{ruta_local}.hash"
-                try:
-                    if os.path.exists(ruta_expected):
-                        with open(ruta_expected, 'r') as rf:
-                            cand = rf.read().strip()
-                            if len(cand) == 64 and all(c in '0123456789abcdef' for c in cand.lower()):
-                                hash_expected = cand
-                except Exception:
-                    pass
+                # Hash esperado registrado al subir el archivo
+                hash_expected = leer_hash_esperado(ruta_local)
                 res = verificar_integridad_y_virus.delay(ruta_local, hash_expected)
                 # Caso síncrono (sin Celery): res es el dict resultado
                 if isinstance(res, dict):
@@ -353,16 +568,7 @@ def verificar_estado_archivo(directorio_base, nombre_archivo):
                 # Fallback: intento síncrono directo
                 try:
                     # Pasar también el hash esperado en el fallback
-                    hash_expected = None
-                    ruta_expected = f"{ruta_local}.hash"
-                    try:
-                        if os.path.exists(ruta_expected):
-                            with open(ruta_expected, 'r') as rf:
-                                cand = rf.read().strip()
-                                if len(cand) == 64 and all(c in '0123456789abcdef' for c in cand.lower()):
-                                    hash_expected = cand
-                    except Exception:
-                        pass
+                    hash_expected = leer_hash_esperado(ruta_local)
                     res = verificar_integridad_y_virus(ruta_local, hash_expected)
                     estado = res.get('estado', 'desconocido')
                     integridad = res.get('integridad', 'no verificada')
@@ -376,30 +582,23 @@ def verificar_estado_archivo(directorio_base, nombre_archivo):
                     return f"❌ Error al iniciar verificación: {e2}"
 
         if resultado:
-            # Verificar recencia: comparar fecha del log vs mtime de archivo y .hash
-            try:
-                from datetime import datetime as _dt
-                fecha_log = _dt.strptime(resultado[2], '%Y-%m-%d %H:%M:%S')
-            except Exception:
+            mensaje, fecha_log = resultado
+            if fecha_log is None:
                 # Si no se puede parsear la fecha, disparar verificación para evitar estado obsoleto
                 return _disparar_y_formatear(ruta)
 
+            # El archivo o su hash esperado pudieron cambiar después de la última verificación
             ultimo_mtime = os.path.getmtime(ruta)
-            ruta_hash = f"{ruta}.hash"
-            if os.path.exists(ruta_hash):
-                try:
-                    mtime_hash = os.path.getmtime(ruta_hash)
-                    if mtime_hash > ultimo_mtime:
-                        ultimo_mtime = mtime_hash
-                except Exception:
-                    pass
+            info = info_archivos.obtener(ruta)
+            if info and info['actualizado'] and info['actualizado'] > ultimo_mtime:
+                ultimo_mtime = info['actualizado']
 
             if fecha_log.timestamp() < ultimo_mtime:
                 # Registro desactualizado; re-verificar
                 return _disparar_y_formatear(ruta)
 
             # Registro vigente; devolver
-            return f"📋 Estado de verificación para '{nombre_archivo}':\n{resultado[1]}"
+            return f"📋 Estado de verificación para '{nombre_archivo}':\n{mensaje}"
         else:
             # No hay registro: iniciar verificación ahora
             return _disparar_y_formatear(ruta)
@@ -407,72 +606,30 @@ def verificar_estado_archivo(directorio_base, nombre_archivo):
     except Exception as error:
         return f"❌ Error al consultar estado: {error}"
 
+_ESTADOS_RESUMIDOS = {
+    'ok': "✅ OK",
+    'corrupto': "❌ CORRUPTO",
+    'infectado': "🦠 INFECTADO",
+    'parcial': "⚠️ PARCIAL",
+}
+
 def verificar_estado_todos_archivos(directorio_base):
     try:
-        # Obtener lista de archivos
-        archivos = os.listdir(directorio_base)
-        if not archivos:
+        # Archivos del índice con su última verificación, en una sola consulta
+        filas = verificaciones.ultimas_del_directorio(directorio_base)
+        if not filas:
             return "📂 No hay archivos en el servidor para verificar."
 
-        # Consultar estado en la base de datos para cada archivo
-        conn = obtener_conexion()
-        cursor = conn.cursor()
-
         resultados = []
-        for nombre_archivo in archivos:
-            # Verificar si es un archivo (no un directorio)
-            ruta = os.path.join(directorio_base, nombre_archivo)
-            if not os.path.isfile(ruta):
-                continue
+        for nombre_archivo, estado, _ in filas:
             # Omitir archivos de metadatos de hash
-            if nombre_archivo.endswith('.hash') or nombre_archivo.endswith('.sha256'):
+            if nombre_archivo.endswith((EXTENSION_HASH_ESPERADO, EXTENSION_HASH_CALCULADO)):
                 continue
-
-            # Primero intentamos buscar por nombre o ruta
-            cursor.execute("""
-                SELECT accion, mensaje, fecha FROM log_eventos 
-                WHERE accion = 'VERIFICACION' AND 
-                (mensaje LIKE ? OR mensaje LIKE ?)
-                ORDER BY fecha DESC LIMIT 1
-            """, (f"%{nombre_archivo}%", f"%{ruta}%"))
-
-            resultado = cursor.fetchone()
-            
-            # Si no encontramos nada, buscamos el registro de verificación más reciente después de la última modificación
-            if not resultado:
-                # Obtener la fecha de modificación del archivo
-                fecha_mod = os.path.getmtime(ruta)
-                # Convertir fecha_mod a formato de fecha de SQLite
-                fecha_mod_str = datetime.fromtimestamp(fecha_mod).strftime('%Y-%m-%d %H:%M:%S')
-                
-                cursor.execute("""
-                    SELECT accion, mensaje, fecha FROM log_eventos 
-                    WHERE accion = 'VERIFICACION' AND fecha > ?
-                    ORDER BY fecha DESC LIMIT 1
-                """, (fecha_mod_str,))
-                
-                resultado = cursor.fetchone()
-
-            if resultado:
-                estado = resultado[1]
-                # Extraer solo la parte relevante del mensaje
-                if "OK -" in estado:
-                    estado_resumido = "✅ OK"
-                elif "CORRUPTO -" in estado:
-                    estado_resumido = "❌ CORRUPTO"
-                elif "INFECTADO -" in estado:
-                    estado_resumido = "🦠 INFECTADO"
-                elif "PARCIAL -" in estado:
-                    estado_resumido = "⚠️ PARCIAL"
-                else:
-                    estado_resumido = "⚠️ DESCONOCIDO"
-
-                resultados.append(f"📄 {nombre_archivo}: {estado_resumido}")
+            if estado:
+                resultados.append(f"📄 {nombre_archivo}: {_ESTADOS_RESUMIDOS.get(estado, '⚠️ DESCONOCIDO')}")
             else:
                 resultados.append(f"📄 {nombre_archivo}: ℹ️ Sin información de verificación")
 
-        conn.close()
-
         # Formatear resultados
         if resultados:
             return "📋 Estado de verificación de todos los archivos:\n" + "\n".join(resultados)
@@ -493,21 +650,9 @@ def estado_archivo_en_bd(directorio_base, nombre_archivo):
         if not os.path.exists(ruta):
             return f"⚠️ Archivo '{nombre_archivo}' no encontrado."
 
-        conn = obtener_conexion()
-        cursor = conn.cursor()
-        cursor.execute(
-            """
-            SELECT mensaje, fecha FROM log_eventos
-            WHERE accion='VERIFICACION' AND (mensaje LIKE ? OR mensaje LIKE ?)
-            ORDER BY fecha DESC LIMIT 1
-            """,
-            (f"%{nombre_archivo}%", f"%{ruta}%")
-        )
-        row = cursor.fetchone()
-        conn.close()
-
-        if row:
-            return f"📋 Estado de verificación para '{nombre_archivo}':\n{row[0]}"
+        resultado = verificaciones.ultima(ruta)
+        if resultado:
+            return f"📋 Estado de verificación para '{nombre_archivo}':\n{resultado[0]}"
         return f"📋 Estado de verificación para '{nombre_archivo}':\nℹ️ No hay información de verificación"
     except Exception as e:
         return f"❌ Error al consultar estado: {e}"
@@ -515,30 +660,49 @@ def estado_archivo_en_bd(directorio_base, nombre_archivo):
 
 def estado_todos_en_bd(directorio_base):
     try:
-        archivos = [f for f in os.listdir(directorio_base) if os.path.isfile(os.path.join(directorio_base, f))]
-        if not archivos:
+        filas = verificaciones.ultimas_del_directorio(directorio_base)
+        if not filas:
             return "📂 No hay archivos en el servidor para verificar."
 
-        conn = obtener_conexion()
-        cursor = conn.cursor()
         resultados = []
-        for nombre in archivos:
-            ruta = os.path.join(directorio_base, nombre)
-            cursor.execute(
-                """
-                SELECT mensaje, fecha FROM log_eventos
-                WHERE accion='VERIFICACION' AND (mensaje LIKE ? OR mensaje LIKE ?)
-                ORDER BY fecha DESC LIMIT 1
-                """,
-                (f"%{nombre}%", f"%{ruta}%")
-            )
-            row = cursor.fetchone()
-            if row:
-                resultados.append(f"📄 {nombre}: {row[0]}")
+        for nombre, _, mensaje in filas:
+            if mensaje:
+                resultados.append(f"📄 {nombre}: {mensaje}")
             else:
                 resultados.append(f"📄 {nombre}: ℹ️ Sin información de verificación")
-        conn.close()
 
         return "📋 Estado de verificación de todos los archivos:\n" + "\n".join(resultados)
     except Exception as e:
         return f"❌ Error al consultar estado de archivos: {e}"
+
+
+# --- Metadatos de un archivo (en lugar de descargar sus .hash/.sha256) ---
+
+def _fecha(epoch):
+    return datetime.fromtimestamp(epoch).isoformat(timespec='seconds') if epoch else "-"
+
+
+def info_archivo(directorio_base, nombre_archivo):
+    try:
+        if not _es_nombre_archivo_valido(nombre_archivo):
+            return "❌ Nombre de archivo inválido."
+        ruta = os.path.join(directorio_base, nombre_archivo)
+        if not os.path.isfile(ruta):
+            return f"⚠️ Archivo '{nombre_archivo}' no encontrado."
+
+        info = info_archivos.obtener(ruta) or {}
+        # Archivos todavía no migrados: sus sidecars
+        esperado = info.get('sha256_esperado') or leer_hash_esperado(ruta)
+        calculado = info.get('sha256_calculado') or leer_hash_calculado(ruta)
+        verificacion = f"{info['estado']} ({info['verificado']})" if info.get('estado') else "-"
+        campos = [
+            ("sha256_esperado", esperado or "-"),
+            ("sha256_calculado", calculado or "-"),
+            ("usuario", info.get('usuario') or "-"),
+            ("creado", _fecha(info.get('creado'))),
+            ("actualizado", _fecha(info.get('actualizado'))),
+            ("verificacion", verificacion),
+        ]
+        return f"🧾 Metadatos de '{nombre_archivo}':\n" + "\n".join(f"  • {clave}: {valor}" for clave, valor in campos)
+    except Exception as error:
+        return f"❌ Error al consultar los metadatos: {error}"
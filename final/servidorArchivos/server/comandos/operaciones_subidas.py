@@ -0,0 +1,208 @@
+import os
+import sys
+import time
+import socket
+import hashlib
+import logging
+import secrets
+
+# Configuración básica
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+from baseDeDatos import subidas
+from utils.integridad import calcular_sha256
+from . import almacen_contenido
+from .operaciones_archivos import registrar_archivo_nuevo, reservar_nombre, _es_nombre_archivo_valido
+
+# 📦 Subidas por bloques reanudables. El cliente abre una sesión con el tamaño
+# (y opcionalmente el SHA-256) del archivo, envía bloques numerados en cualquier
+# orden y por cualquier cantidad de conexiones, consulta cuáles ya están
+# guardados y finaliza: el archivo parcial se verifica y se publica con un
+# link atómico (nunca pisa un archivo existente ni queda a medio escribir).
+#
+# Los parciales viven en "<directorio>/.subidas/<id>.parcial", en el mismo
+# sistema de archivos que el destino. El listado solo muestra archivos
+# regulares, así que el directorio no aparece, y su nombre está reservado:
+# ningún comando puede crearlo, renombrarlo ni borrarlo.
+
+# ⚙️ Configuración (variables de entorno)
+TAM_BLOQUE = int(os.getenv("SERVER_SUBIDA_BLOQUE", 4 * 1024 * 1024))
+TTL_SUBIDA = float(os.getenv("SERVER_SUBIDA_TTL", 24 * 3600))  # Segundos sin actividad antes de descartarla
+
+DIRECTORIO_PARCIALES = ".subidas"
+reservar_nombre(DIRECTORIO_PARCIALES)
+
+
+def _ruta_parcial(directorio_base, id_subida):
+    return os.path.join(directorio_base, DIRECTORIO_PARCIALES, f"{id_subida}.parcial")
+
+
+def _cantidad_bloques(sesion):
+    return -(-sesion['bytes'] // sesion['bloque'])
+
+
+def _rangos(numeros):
+    """[0, 1, 2, 5, 7, 8] -> '0-2,5,7-8'"""
+    partes = []
+    inicio = anterior = None
+    for numero in numeros:
+        if anterior is not None and numero == anterior + 1:
+            anterior = numero
+            continue
+        if inicio is not None:
+            partes.append(str(inicio) if inicio == anterior else f"{inicio}-{anterior}")
+        inicio = anterior = numero
+    if inicio is not None:
+        partes.append(str(inicio) if inicio == anterior else f"{inicio}-{anterior}")
+    return ",".join(partes) or "-"
+
+
+def _descartar(directorio_base, id_subida):
+    try:
+        os.remove(_ruta_parcial(directorio_base, id_subida))
+    except FileNotFoundError:
+        pass
+    subidas.eliminar(id_subida)
+
+
+def _purgar_vencidas(directorio_base):
+    for id_subida in subidas.vencidas(directorio_base, time.time() - TTL_SUBIDA):
+        logging.info(f"🧹 Subida {id_subida} vencida: se descarta")
+        _descartar(directorio_base, id_subida)
+
+
+def abrir_subida(directorio_base, usuario_id, nombre_archivo, tamaño, hash_esperado=None):
+    try:
+        if not _es_nombre_archivo_valido(nombre_archivo):
+            return "❌ Nombre de archivo inválido. No debe contener caracteres especiales."
+        if tamaño < 0:
+            return "❌ El tamaño no puede ser negativo."
+        if hash_esperado and (len(hash_esperado) != 64
+                              or any(c not in '0123456789abcdef' for c in hash_esperado.lower())):
+            return "❌ El SHA-256 debe tener 64 caracteres hexadecimales."
+        ruta = os.path.join(directorio_base, nombre_archivo)
+        if os.path.exists(ruta):
+            return f"⚠️ El archivo '{nombre_archivo}' ya existe."
+
+        # Contenido ya almacenado: no hace falta abrir la subida
+        if hash_esperado:
+            existente = almacen_contenido.enlazar_existente(directorio_base, hash_esperado, ruta)
+            if existente is not None:
+                registrar_archivo_nuevo(directorio_base, nombre_archivo, hash_esperado.lower(), hash_esperado.lower(),
+                                        usuario_id)
+                return f"✅ Archivo '{nombre_archivo}' ya estaba almacenado: enlazado sin transferir ({existente} bytes)"
+
+        _purgar_vencidas(directorio_base)
+
+        id_subida = secrets.token_hex(16)
+        ruta_parcial = _ruta_parcial(directorio_base, id_subida)
+        os.makedirs(os.path.dirname(ruta_parcial), exist_ok=True)
+        # Archivo disperso del tamaño final: cada bloque se escribe en su posición
+        with open(ruta_parcial, 'wb') as f:
+            f.truncate(tamaño)
+        subidas.crear(id_subida, usuario_id, directorio_base, nombre_archivo, tamaño, TAM_BLOQUE,
+                      hash_esperado.lower() if hash_esperado else None)
+
+        bloques = -(-tamaño // TAM_BLOQUE)
+        return f"✅ Subida abierta para '{nombre_archivo}' id={id_subida} bloque={TAM_BLOQUE} bloques={bloques}"
+    except Exception as error:
+        return f"❌ Error al abrir la subida: {error}"
+
+
+def recibir_bloque(directorio_base, usuario_id, id_subida, numero, hash_bloque=None, conexion=None):
+    try:
+        sesion = subidas.obtener(id_subida, usuario_id)
+        if not sesion:
+            return f"❌ La subida {id_subida} no existe o venció."
+        if not 0 <= numero < _cantidad_bloques(sesion):
+            return f"❌ Bloque {numero} fuera de rango (0-{_cantidad_bloques(sesion) - 1})."
+        if not conexion:
+            return "⚠️ No se puede recibir el bloque. Conexión no disponible."
+
+        desde = numero * sesion['bloque']
+        longitud = min(sesion['bloque'], sesion['bytes'] - desde)
+        conexion.sendall(f"✅ Listo para recibir el bloque {numero} ({longitud} bytes)".encode('utf-8'))
+
+        hasher = hashlib.sha256()
+        fd = os.open(_ruta_parcial(directorio_base, id_subida), os.O_WRONLY)
+        try:
+            recibidos = 0
+            while recibidos < longitud:
+                try:
+                    datos = conexion.recv(min(65536, longitud - recibidos))
+                except socket.timeout:
+                    raise TimeoutError("Tiempo de espera agotado durante la recepción del bloque")
+                if not datos:
+                    raise ConnectionError("Conexión cerrada por el cliente durante la transferencia")
+                os.pwrite(fd, datos, desde + recibidos)
+                hasher.update(datos)
+                recibidos += len(datos)
+            if hash_bloque and hasher.hexdigest() != hash_bloque.lower():
+                return f"❌ El SHA-256 del bloque {numero} no coincide. Envíalo de nuevo."
+            # Un bloque se informa como guardado solo cuando ya está en disco
+            os.fdatasync(fd) if hasattr(os, 'fdatasync') else os.fsync(fd)
+        finally:
+            os.close(fd)
+
+        subidas.registrar_bloque(id_subida, numero)
+        return f"✅ Bloque {numero} guardado ({longitud} bytes)"
+    except (TimeoutError, ConnectionError, OSError) as error:
+        # El bloque no se registra: el cliente lo reenvía sin perder los demás
+        return f"❌ Error durante la recepción del bloque {numero}: {error}"
+    except Exception as error:
+        return f"❌ Error al recibir el bloque: {error}"
+
+
+def estado_subida(usuario_id, id_subida):
+    try:
+        sesion = subidas.obtener(id_subida, usuario_id)
+        if not sesion:
+            return f"❌ La subida {id_subida} no existe o venció."
+        recibidos = subidas.bloques_recibidos(id_subida)
+        total = _cantidad_bloques(sesion)
+        faltan = sorted(set(range(total)) - set(recibidos))
+        return (f"📦 Subida {id_subida} de '{sesion['nombre']}': {len(recibidos)}/{total} bloques "
+                f"bloque={sesion['bloque']} recibidos={_rangos(recibidos)} faltan={_rangos(faltan)}")
+    except Exception as error:
+        return f"❌ Error al consultar la subida: {error}"
+
+
+def finalizar_subida(directorio_base, usuario_id, id_subida):
+    try:
+        sesion = subidas.obtener(id_subida, usuario_id)
+        if not sesion:
+            return f"❌ La subida {id_subida} no existe o venció."
+        faltan = _cantidad_bloques(sesion) - len(subidas.bloques_recibidos(id_subida))
+        if faltan:
+            return f"⚠️ Faltan {faltan} bloques. Consulta SUBIDA_ESTADO {id_subida}."
+
+        nombre_archivo = sesion['nombre']
+        ruta_parcial = _ruta_parcial(directorio_base, id_subida)
+        # Los bloques llegan en cualquier orden: el hash del archivo completo se calcula al final
+        hash_calculado = calcular_sha256(ruta_parcial)
+        if sesion['sha256'] and hash_calculado != sesion['sha256']:
+            _descartar(directorio_base, id_subida)
+            return f"❌ El SHA-256 del archivo no coincide con el declarado. Subida de '{nombre_archivo}' descartada."
+
+        ruta = os.path.join(directorio_base, nombre_archivo)
+        try:
+            # link falla si el destino ya existe: la publicación es atómica y no pisa nada
+            os.link(ruta_parcial, ruta)
+        except FileExistsError:
+            return f"⚠️ El archivo '{nombre_archivo}' ya existe. La subida sigue abierta."
+        _descartar(directorio_base, id_subida)
+
+        registrar_archivo_nuevo(directorio_base, nombre_archivo, hash_calculado, sesion['sha256'], usuario_id)
+        return f"✅ Archivo '{nombre_archivo}' recibido correctamente ({sesion['bytes']} bytes)"
+    except Exception as error:
+        return f"❌ Error al finalizar la subida: {error}"
+
+
+def cancelar_subida(directorio_base, usuario_id, id_subida):
+    try:
+        if not subidas.obtener(id_subida, usuario_id):
+            return f"❌ La subida {id_subida} no existe o venció."
+        _descartar(directorio_base, id_subida)
+        return f"🗑️ Subida {id_subida} cancelada."
+    except Exception as error:
+        return f"❌ Error al cancelar la subida: {error}"
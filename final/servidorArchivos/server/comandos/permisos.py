@@ -6,6 +6,7 @@ import sys
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
 
 from baseDeDatos.db import obtener_conexion
+from .decoradores import invalidar_permisos
 
 def solicitar_cambio_permisos(usuario_id, permiso_solicitado):
     # 🔍 Validar el permiso solicitado
@@ -203,6 +204,9 @@ def aprobar_cambio_permisos(usuario_id, id_solicitud, decision):
         conn.commit()
         conn.close()
 
+        # 🗝️ El rol del solicitante pudo cambiar: no seguir usando el de la caché
+        invalidar_permisos(solicitante_id)
+
         return mensaje
 
     except Exception as error:
@@ -0,0 +1,313 @@
+import os
+import sys
+import queue
+import select
+import time
+import socket
+import logging
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+# Configuración básica de sys.path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from server.comandos import manejar_comando
+from server.seguridad import (autenticar_usuario_en_servidor, registrar_usuario, autenticar_con_token,
+                              token_de_comando, mensaje_autenticacion_exitosa)
+from server.admision import registrar_fuente_estadisticas
+from utils import protocolo
+
+# Sesiones v2 multiplexadas (motor de hilos): una sesión autenticada puede tener
+# varias solicitudes en vuelo, identificadas por request_id, que se ejecutan en
+# paralelo y se responden en el orden en que terminan.
+#
+# El hilo de la sesión es el único que lee y escribe el socket TLS (un objeto SSL
+# no admite uso concurrente): los hilos que ejecutan solicitudes le pasan sus
+# frames por una cola de salida y lo despiertan con un socketpair.
+
+# ⚙️ Configuración (variables de entorno)
+MAX_EN_VUELO = int(os.getenv("SERVER_MAX_EN_VUELO", 8))                # Por sesión
+MAX_PENDIENTES = int(os.getenv("SERVER_MAX_PENDIENTES", 64))            # Por sesión, esperando turno
+MAX_HILOS_SOLICITUDES = int(os.getenv("SERVER_MAX_HILOS_SOLICITUDES", 32))  # Compartidos por el proceso
+MAX_FRAMES_COLA = 64  # Frames en tránsito por transferencia / salida antes de aplicar backpressure
+TIMEOUT_TRANSFERENCIA = 120
+
+COMANDOS_TRANSFERENCIA = ("DESCARGAR", "SUBIR", "SUBIDA_BLOQUE")
+
+_ejecutor = None
+_lock_ejecutor = threading.Lock()
+_contadores = {'solicitudes_v2': 0, 'solicitudes_en_vuelo': 0, 'solicitudes_rechazadas': 0}
+_lock_contadores = threading.Lock()
+
+
+def _obtener_ejecutor():
+    global _ejecutor
+    with _lock_ejecutor:
+        if _ejecutor is None:
+            _ejecutor = ThreadPoolExecutor(max_workers=MAX_HILOS_SOLICITUDES, thread_name_prefix="solicitud")
+            registrar_fuente_estadisticas(_estadisticas)
+        return _ejecutor
+
+
+def _contar(clave, delta=1):
+    with _lock_contadores:
+        _contadores[clave] += delta
+
+
+def _estadisticas():
+    with _lock_contadores:
+        return dict(_contadores)
+
+
+class _Cerrada(Exception):
+    """La sesión terminó mientras una solicitud seguía en curso."""
+
+
+class _CanalMultiplexado(protocolo.ConexionEnmarcada):
+    """
+    Canal de transferencia de una solicitud: recibe sus frames DATOS desde la
+    cola que alimenta el hilo de la sesión y envía los suyos por la cola de salida.
+    """
+
+    def __init__(self, sesion, request_id):
+        self._sesion = sesion
+        self._entrada = queue.Queue(maxsize=MAX_FRAMES_COLA)
+        self._timeout = TIMEOUT_TRANSFERENCIA
+        self.abortado = False
+        super().__init__(None, request_id, lector=self._leer_entrada, escritor=sesion.encolar_salida)
+
+    def abortar(self):
+        """Descarta lo pendiente y deja la marca de fin para el hilo que espera datos."""
+        self.abortado = True
+        try:
+            while True:
+                self._entrada.get_nowait()
+        except queue.Empty:
+            pass
+        self._entrada.put_nowait(None)
+
+    def _leer_entrada(self):
+        if self.abortado and self._entrada.empty():
+            raise ConnectionError("Transferencia abortada")
+        try:
+            frame = self._entrada.get(timeout=self._timeout)
+        except queue.Empty:
+            raise socket.timeout("Tiempo de espera agotado en la transferencia")
+        if frame is None:
+            raise ConnectionError("Sesión cerrada durante la transferencia")
+        return frame
+
+    def settimeout(self, timeout):
+        self._timeout = timeout
+
+    def gettimeout(self):
+        return self._timeout
+
+    def getpeername(self):
+        return self._sesion.direccion
+
+
+class SesionMultiplexada:
+    """Atiende una sesión v2 ya negociada sobre `conexion` (socket TLS bloqueante)."""
+
+    def __init__(self, conexion, directorio):
+        self.conexion = conexion
+        self.directorio = directorio
+        try:
+            self.direccion = conexion.getpeername()
+        except OSError:
+            self.direccion = None
+        self.usuario_id = None
+        self._salida = queue.Queue(maxsize=MAX_FRAMES_COLA)
+        self._despertar_r, self._despertar_w = socket.socketpair()
+        self._despertar_r.setblocking(False)
+        self._en_vuelo = {}          # request_id -> canal (o None si no transfiere)
+        self._pendientes = deque()   # (request_id, comando) esperando un lugar
+        self._cerrada = False
+        self._salir = None           # request_id del SALIR recibido
+
+    # --- API usada por los hilos de solicitudes ---
+
+    def encolar_salida(self, frame, finalizado=None):
+        while True:
+            if self._cerrada:
+                raise _Cerrada()
+            try:
+                self._salida.put((frame, finalizado), timeout=1)
+                break
+            except queue.Full:
+                continue
+        try:
+            self._despertar_w.send(b'\0')
+        except OSError:
+            pass
+
+    # --- bucle de la sesión ---
+
+    def atender(self) -> bool:
+        """Retorna True si el cliente envió SALIR explícitamente."""
+        try:
+            while True:
+                self._vaciar_salida()
+                if self._salir is not None and not self._en_vuelo and not self._pendientes:
+                    self._responder(self._salir, "🔌 Desconectando...")
+                    return True
+
+                # Los datos ya descifrados por TLS no se ven con select()
+                if self.conexion.pending() == 0:
+                    listos, _, _ = select.select([self.conexion, self._despertar_r], [], [])
+                    if self._despertar_r in listos:
+                        self._vaciar_despertador()
+                    if self.conexion not in listos:
+                        continue
+                self._procesar_frame(*protocolo.recibir_frame(self.conexion))
+        finally:
+            self._cerrar()
+
+    def _procesar_frame(self, tipo, flags, request_id, payload):
+        if tipo == protocolo.DATOS:
+            canal = self._en_vuelo.get(request_id)
+            if canal is not None and not canal.abortado:
+                self._entregar(request_id, canal, (tipo, flags, request_id, payload))
+            return
+
+        if tipo == protocolo.AUTENTICAR:
+            usuario, _, password = payload.decode('utf-8').partition("\0")
+            datos_usuario = autenticar_usuario_en_servidor(usuario, password)
+            if not datos_usuario:
+                self._responder(request_id, "❌ Credenciales inválidas. Intenta nuevamente.", protocolo.ERROR)
+                return
+            self.usuario_id, permisos = datos_usuario
+            self._responder(request_id, mensaje_autenticacion_exitosa(self.usuario_id, permisos))
+            return
+
+        if tipo != protocolo.COMANDO:
+            self._responder(request_id, f"❌ Tipo de mensaje no soportado: {tipo}", protocolo.ERROR)
+            return
+
+        comando = payload.decode('utf-8').strip()
+        partes = comando.split()
+        nombre = partes[0].upper() if partes else ""
+
+        if nombre == "SALIR":
+            # Se responde cuando terminen las solicitudes en curso
+            self._salir = request_id
+            return
+
+        if nombre == "AUTH":
+            datos_usuario = autenticar_con_token(token_de_comando(comando) or "")
+            if not datos_usuario:
+                self._responder(request_id, "❌ Token inválido o vencido. Inicia sesión con tu contraseña.",
+                                protocolo.ERROR)
+                return
+            self.usuario_id, permisos = datos_usuario
+            self._responder(request_id, mensaje_autenticacion_exitosa(self.usuario_id, permisos))
+            return
+
+        if self.usuario_id is None:
+            if nombre == "REGISTRAR" and len(partes) == 3:
+                self._responder(request_id, registrar_usuario(partes[1], partes[2]))
+            else:
+                self._responder(request_id, "❌ Debes autenticarte primero.", protocolo.ERROR)
+            return
+
+        if request_id in self._en_vuelo:
+            self._responder(request_id, f"❌ El request_id {request_id} ya está en curso.", protocolo.ERROR)
+            return
+
+        if len(self._en_vuelo) >= MAX_EN_VUELO:
+            if len(self._pendientes) >= MAX_PENDIENTES:
+                _contar('solicitudes_rechazadas')
+                self._responder(request_id, "⛔ Demasiadas solicitudes en curso. Espera las respuestas.",
+                                protocolo.ERROR)
+                return
+            self._pendientes.append((request_id, comando, nombre))
+            return
+
+        self._despachar(request_id, comando, nombre)
+
+    def _despachar(self, request_id, comando, nombre):
+        canal = _CanalMultiplexado(self, request_id) if nombre in COMANDOS_TRANSFERENCIA else None
+        self._en_vuelo[request_id] = canal
+        _contar('solicitudes_v2')
+        _contar('solicitudes_en_vuelo')
+        _obtener_ejecutor().submit(self._ejecutar, request_id, comando, canal)
+
+    def _ejecutar(self, request_id, comando, canal):
+        try:
+            if canal is not None:
+                respuesta = manejar_comando(comando, self.directorio, self.usuario_id, canal)
+            else:
+                respuesta = manejar_comando(comando, self.directorio, self.usuario_id)
+            texto = "" if respuesta is None else str(respuesta)
+            self.encolar_salida(
+                protocolo.empaquetar_frame(protocolo.RESPUESTA, request_id, texto, protocolo.FLAG_FINAL),
+                finalizado=request_id,
+            )
+        except _Cerrada:
+            pass
+        except Exception as error:
+            logging.error(f"❌ Error al ejecutar '{comando}': {error}")
+            try:
+                self.encolar_salida(
+                    protocolo.empaquetar_frame(protocolo.ERROR, request_id,
+                                               f"❌ Error al ejecutar el comando: {error}", protocolo.FLAG_FINAL),
+                    finalizado=request_id,
+                )
+            except _Cerrada:
+                pass
+        finally:
+            _contar('solicitudes_en_vuelo', -1)
+
+    def _vaciar_salida(self):
+        while True:
+            try:
+                frame, finalizado = self._salida.get_nowait()
+            except queue.Empty:
+                return
+            self.conexion.sendall(frame)
+            if finalizado is not None:
+                self._en_vuelo.pop(finalizado, None)
+                if self._pendientes and len(self._en_vuelo) < MAX_EN_VUELO:
+                    self._despachar(*self._pendientes.popleft())
+
+    def _vaciar_despertador(self):
+        try:
+            while self._despertar_r.recv(4096):
+                pass
+        except (BlockingIOError, OSError):
+            pass
+
+    def _entregar(self, request_id, canal, frame):
+        # Si la solicitud no consume sus datos, seguir atendiendo la salida mientras
+        # tanto. Si ya terminó (p. ej. rechazó la subida) el frame se descarta, y si
+        # sigue sin leer pasado TIMEOUT_TRANSFERENCIA se aborta la transferencia.
+        limite = time.monotonic() + TIMEOUT_TRANSFERENCIA
+        while True:
+            try:
+                canal._entrada.put(frame, timeout=0.05)
+                return
+            except queue.Full:
+                self._vaciar_salida()
+            if self._en_vuelo.get(request_id) is not canal:
+                return
+            if time.monotonic() >= limite:
+                logging.warning(f"⏳ La solicitud {request_id} no consume sus datos: transferencia abortada")
+                canal.abortar()
+                return
+
+    def _responder(self, request_id, texto, tipo=protocolo.RESPUESTA):
+        self._vaciar_salida()
+        protocolo.enviar_frame(self.conexion, tipo, request_id, texto, protocolo.FLAG_FINAL)
+
+    def _cerrar(self):
+        self._cerrada = True
+        for canal in self._en_vuelo.values():
+            if canal is not None:
+                canal.abortar()
+        for sock in (self._despertar_r, self._despertar_w):
+            try:
+                sock.close()
+            except OSError:
+                pass
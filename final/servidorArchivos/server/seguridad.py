@@ -1,6 +1,15 @@
 import os
 import sys
+import hmac
+import base64
+import time
+import hashlib
 import logging
+import threading
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 
 # 🔧 Asegurar que el path raíz esté en sys.path antes de cualquier import personalizado
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
@@ -14,6 +23,168 @@ logger = logging.getLogger(__name__)
 import bcrypt
 logger.info("✅ bcrypt habilitado para el hash de contraseñas.")
 
+# ⚙️ Configuración (variables de entorno)
+PROCESOS_BCRYPT = int(os.getenv("SERVER_BCRYPT_PROCESOS", os.cpu_count() or 1))  # 0: en el hilo que llama
+TTL_CACHE_AUTENTICACION = float(os.getenv("SERVER_CACHE_AUTH_TTL", 60))         # Segundos (0: sin caché)
+MAX_CACHE_AUTENTICACION = int(os.getenv("SERVER_CACHE_AUTH_MAX", 4096))
+TTL_TOKEN = int(os.getenv("SERVER_TOKEN_TTL", 3600))                            # Segundos de validez de un token
+SECRETO_TOKEN = os.getenv("SERVER_TOKEN_SECRETO")                               # Compartido entre procesos/reinicios
+
+# 🔐 bcrypt corre en un pool de procesos propio: cada verificación cuesta decenas
+# de milisegundos de CPU y así se reparten entre todos los núcleos sin ocupar los
+# hilos que atienden clientes. Los procesos se crean con forkserver/spawn, nunca
+# con fork desde un servidor con hilos.
+#
+# Las verificaciones exitosas se recuerdan TTL_CACHE_AUTENTICACION segundos para
+# que los logins repetidos (la API se autentica en cada solicitud) no repitan
+# bcrypt. La clave es un HMAC de la contraseña y del hash guardado con un secreto
+# aleatorio del proceso: la contraseña no queda en memoria y cambiarla (otro hash
+# guardado) deja sin efecto la entrada. Los fallos no se guardan.
+
+_ejecutor_bcrypt = None
+_pid_ejecutor = None
+_lock_ejecutor = threading.Lock()
+
+_secreto_cache = os.urandom(32)
+_cache_autenticacion = OrderedDict()  # hmac -> expira
+_lock_cache = threading.Lock()
+_contadores = {'auth_cache_aciertos': 0, 'auth_cache_fallos': 0, 'bcrypt_operaciones': 0}
+
+
+def _contexto_procesos():
+    metodos = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context('forkserver' if 'forkserver' in metodos else 'spawn')
+
+
+def _obtener_ejecutor_bcrypt():
+    global _ejecutor_bcrypt, _pid_ejecutor
+    if PROCESOS_BCRYPT <= 0:
+        return None
+    with _lock_ejecutor:
+        if _ejecutor_bcrypt is None or _pid_ejecutor != os.getpid():
+            _ejecutor_bcrypt = ProcessPoolExecutor(max_workers=PROCESOS_BCRYPT, mp_context=_contexto_procesos())
+            _pid_ejecutor = os.getpid()
+        return _ejecutor_bcrypt
+
+
+def _descartar_ejecutor_bcrypt(ejecutor):
+    global _ejecutor_bcrypt
+    with _lock_ejecutor:
+        if _ejecutor_bcrypt is ejecutor:
+            _ejecutor_bcrypt = None
+    ejecutor.shutdown(wait=False)
+
+
+def _ejecutar_bcrypt(funcion, *args):
+    with _lock_cache:
+        _contadores['bcrypt_operaciones'] += 1
+    ejecutor = _obtener_ejecutor_bcrypt()
+    if ejecutor is None:
+        return funcion(*args)
+    try:
+        return ejecutor.submit(funcion, *args).result()
+    except BrokenProcessPool:
+        # Un proceso del pool murió: resolver esta en el hilo y recrear el pool la próxima vez
+        logger.warning("⚠️ Pool de bcrypt roto; se recrea en la próxima autenticación")
+        _descartar_ejecutor_bcrypt(ejecutor)
+        return funcion(*args)
+
+
+def _bcrypt_hashpw(password):
+    return bcrypt.hashpw(password, bcrypt.gensalt())
+
+
+def _bcrypt_checkpw(password, hashed):
+    return bcrypt.checkpw(password, hashed)
+
+
+def _clave_cache(password, hashed):
+    return hmac.new(_secreto_cache, f"{hashed}\0{password}".encode('utf-8'), hashlib.sha256).digest()
+
+
+def _en_cache(clave):
+    with _lock_cache:
+        expira = _cache_autenticacion.get(clave)
+        if expira and expira > time.monotonic():
+            _contadores['auth_cache_aciertos'] += 1
+            return True
+        _cache_autenticacion.pop(clave, None)
+        _contadores['auth_cache_fallos'] += 1
+        return False
+
+
+def _guardar_en_cache(clave):
+    if TTL_CACHE_AUTENTICACION <= 0:
+        return
+    with _lock_cache:
+        _cache_autenticacion[clave] = time.monotonic() + TTL_CACHE_AUTENTICACION
+        _cache_autenticacion.move_to_end(clave)
+        while len(_cache_autenticacion) > MAX_CACHE_AUTENTICACION:
+            _cache_autenticacion.popitem(last=False)
+
+
+def estadisticas_autenticacion():
+    with _lock_cache:
+        datos = dict(_contadores)
+        datos['auth_cache_entradas'] = len(_cache_autenticacion)
+    return datos
+
+# 🎫 Tokens de sesión: al autenticarse con usuario y contraseña el servidor
+# entrega un token firmado "usuario_id.permisos.vence.firma" (HMAC-SHA256). Con
+# AUTH TOKEN <token> una conexión nueva se autentica verificando solo la firma
+# y el vencimiento, sin bcrypt ni base de datos. Sin SERVER_TOKEN_SECRETO el
+# secreto es aleatorio: lo comparten los workers creados por fork, pero los
+# tokens dejan de valer al reiniciar el servidor (el cliente vuelve a la contraseña).
+
+_secreto_token = SECRETO_TOKEN.encode('utf-8') if SECRETO_TOKEN else os.urandom(32)
+
+
+def _firmar(contenido):
+    firma = hmac.new(_secreto_token, contenido.encode('utf-8'), hashlib.sha256).digest()
+    return base64.urlsafe_b64encode(firma).rstrip(b'=').decode('ascii')
+
+
+def emitir_token(usuario_id, permisos):
+    contenido = f"{usuario_id}.{permisos}.{int(time.time()) + TTL_TOKEN}"
+    return f"{contenido}.{_firmar(contenido)}"
+
+
+def validar_token(token):
+    """Retorna (usuario_id, permisos) si el token es auténtico y no venció, o None."""
+    try:
+        contenido, _, firma = token.strip().rpartition(".")
+        # En bytes: compare_digest no acepta str con caracteres no ASCII
+        firma_esperada = _firmar(contenido).encode('ascii')
+        if not contenido or not hmac.compare_digest(firma.encode('utf-8', 'surrogateescape'), firma_esperada):
+            return None
+        usuario_id, permisos, vence = contenido.split(".")
+        if int(vence) < time.time():
+            return None
+        return int(usuario_id), permisos
+    except (ValueError, AttributeError):
+        return None
+
+
+def autenticar_con_token(token):
+    datos_usuario = validar_token(token)
+    if not datos_usuario:
+        logger.warning("❌ Intento de autenticación con un token inválido o vencido")
+    return datos_usuario
+
+
+def token_de_comando(comando):
+    """Retorna el token de un comando "AUTH TOKEN <token>", o None si es otro comando."""
+    partes = comando.split()
+    if len(partes) == 3 and partes[0].upper() == "AUTH" and partes[1].upper() == "TOKEN":
+        return partes[2]
+    return None
+
+
+def mensaje_autenticacion_exitosa(usuario_id, permisos):
+    """Respuesta de un login exitoso, con un token nuevo para las próximas conexiones."""
+    return f"✅ Autenticación exitosa! Permisos: {permisos}\n🎫 Token: {emitir_token(usuario_id, permisos)}"
+
+
 def autenticar_usuario_en_servidor(username, password):
     try:
         usuario = autenticar_usuario(username, password)
@@ -44,7 +215,7 @@ def hash_password(password: str) -> str:
     if not password:
         raise ValueError("❌ La contraseña no puede estar vacía")
     try:
-        return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+        return _ejecutar_bcrypt(_bcrypt_hashpw, password.encode('utf-8')).decode('utf-8')
     except Exception as error:
         logger.error(f"❌ Error al generar hash de contraseña: {error}")
         raise
@@ -54,7 +225,13 @@ def verificar_password(password: str, hashed: str) -> bool:
     if not password or not hashed:
         return False
     try:
-        return bcrypt.checkpw(password.encode('utf-8'), hashed.encode('utf-8'))
+        clave = _clave_cache(password, hashed)
+        if _en_cache(clave):
+            return True
+        valida = _ejecutar_bcrypt(_bcrypt_checkpw, password.encode('utf-8'), hashed.encode('utf-8'))
+        if valida:
+            _guardar_en_cache(clave)
+        return valida
     except Exception as error:
         logger.error(f"❌ Error al verificar contraseña: {error}")
         return False
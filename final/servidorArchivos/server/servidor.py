@@ -13,13 +13,20 @@ sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 # Importaciones con fallback
 try:
     from server.comandos import manejar_comando
-    from server.seguridad import autenticar_usuario_en_servidor, registrar_usuario
+    from server.seguridad import (autenticar_usuario_en_servidor, registrar_usuario, autenticar_con_token,
+                                  token_de_comando, mensaje_autenticacion_exitosa)
+    from server.admision import ControlAdmision
+    from server.multiplexor import SesionMultiplexada
 except ImportError:
     sys.path.append(os.path.dirname(os.path.abspath(__file__)))
     from comandos import manejar_comando
-    from seguridad import autenticar_usuario_en_servidor, registrar_usuario
+    from seguridad import (autenticar_usuario_en_servidor, registrar_usuario, autenticar_con_token,
+                           token_de_comando, mensaje_autenticacion_exitosa)
+    from admision import ControlAdmision
+    from multiplexor import SesionMultiplexada
 
 from baseDeDatos.db import log_evento
+from utils import protocolo
 from utils.config import CERT_PATH, KEY_PATH
 from utils.config import crear_directorio_si_no_existe, configurar_argumentos
 from utils.network import crear_socket_servidor, configurar_contexto_ssl
@@ -46,7 +53,11 @@ def _enviar_mensaje(conexion, mensaje: str):
 def _recibir_mensaje(conexion, prompt: str | None = None) -> str:
     if prompt:
         _enviar_mensaje(conexion, prompt)
-    return conexion.recv(1024).decode().strip()
+    datos = conexion.recv(1024)
+    if not datos:
+        # Cliente desconectado: liberar el hilo del pool de inmediato
+        raise ConnectionError("Conexión cerrada por el cliente")
+    return datos.decode().strip()
 
 def _manejar_registro(conexion, comando_registro: str):
     partes = comando_registro.split()
@@ -61,24 +72,36 @@ def _manejar_registro(conexion, comando_registro: str):
     if respuesta.startswith("✅"):
         _enviar_mensaje(conexion, "👤 Ahora inicia sesión con tu nuevo usuario.\n")
 
-def _autenticar_usuario(conexion):
+def _autenticar_usuario(conexion, usuario: str | None = None):
     while True:
-        usuario = _recibir_mensaje(conexion, "👤 Usuario: ")
+        if usuario is None:
+            usuario = _recibir_mensaje(conexion, "👤 Usuario: ")
 
         # Registro inline
         if usuario.upper().startswith("REGISTRAR"):
             _manejar_registro(conexion, usuario)
+            usuario = None
             continue
 
-        password = _recibir_mensaje(conexion, "🔒 Contraseña: ")
+        # Token de una sesión anterior: sin contraseña ni bcrypt
+        token = token_de_comando(usuario)
+        if token is not None:
+            datos_usuario = autenticar_con_token(token)
+            if not datos_usuario:
+                _enviar_mensaje(conexion, "❌ Token inválido o vencido. Inicia sesión con tu contraseña.\n")
+                usuario = None
+                continue
+        else:
+            password = _recibir_mensaje(conexion, "🔒 Contraseña: ")
 
-        datos_usuario = autenticar_usuario_en_servidor(usuario, password)
-        if not datos_usuario:
-            _enviar_mensaje(conexion, "❌ Credenciales inválidas. Intenta nuevamente.\n")
-            continue
+            datos_usuario = autenticar_usuario_en_servidor(usuario, password)
+            if not datos_usuario:
+                _enviar_mensaje(conexion, "❌ Credenciales inválidas. Intenta nuevamente.\n")
+                usuario = None
+                continue
 
         usuario_id, permisos = datos_usuario
-        _enviar_mensaje(conexion, f"✅ Autenticación exitosa! Permisos: {permisos}\n")
+        _enviar_mensaje(conexion, f"{mensaje_autenticacion_exitosa(usuario_id, permisos)}\n")
         return usuario_id, permisos
 
 def _procesar_comandos(conexion, directorio: str, usuario_id: int) -> bool:
@@ -93,7 +116,7 @@ def _procesar_comandos(conexion, directorio: str, usuario_id: int) -> bool:
             return True
 
         partes = comando.strip().split()
-        if partes and partes[0].upper() in ["DESCARGAR", "SUBIR"]:
+        if partes and partes[0].upper() in ["DESCARGAR", "SUBIR", "SUBIDA_BLOQUE"]:
             # Estos comandos usan la conexión para transferir datos
             respuesta = manejar_comando(comando, directorio, usuario_id, conexion)
         else:
@@ -105,20 +128,29 @@ def manejar_cliente(conexion_ssl, direccion, directorio):
     ip_cliente = direccion[0]
     global _ips_desconectadas
 
-    # Log de PID/TID al iniciar el hilo del cliente
+    # Log de PID/TID del hilo del pool que atiende al cliente
     try:
-        import os
-        import threading
-        print(f"🧵 Hilo para cliente {ip_cliente} levantado (PID: {os.getpid()}, TID: {threading.get_ident()})")
+        print(f"🧵 Cliente {ip_cliente} atendido por {threading.current_thread().name} (PID: {os.getpid()}, TID: {threading.get_ident()})")
     except Exception:
         pass
 
     cliente_desconectado = False
     try:
         _enviar_mensaje(conexion_ssl, "🌍 Bienvenido al servidor de archivos seguro.\n")
-        usuario_id, permisos = _autenticar_usuario(conexion_ssl)
-        cliente_desconectado = _procesar_comandos(conexion_ssl, directorio, usuario_id)
+        primer_mensaje = _recibir_mensaje(conexion_ssl, "👤 Usuario: ")
 
+        if primer_mensaje == protocolo.SALUDO_V2:
+            # Cliente con soporte de frames: desde acá todo va enmarcado
+            _enviar_mensaje(conexion_ssl, f"{protocolo.CONFIRMACION_V2}\n")
+            cliente_desconectado = SesionMultiplexada(conexion_ssl, directorio).atender()
+        else:
+            usuario_id, permisos = _autenticar_usuario(conexion_ssl, primer_mensaje)
+            cliente_desconectado = _procesar_comandos(conexion_ssl, directorio, usuario_id)
+
+    except (ConnectionError, ssl.SSLError, protocolo.ErrorProtocolo) as error:
+        # Cierre normal del cliente (p. ej. una sesión que el pool de la API descarta): no es un error
+        logging.debug(f"🔌 Conexión con {ip_cliente} finalizada: {error}")
+        cliente_desconectado = True
     except Exception as error:
         logging.error(f"❌ Error con cliente {ip_cliente}: {error}")
     finally:
@@ -137,7 +169,8 @@ def manejar_cliente(conexion_ssl, direccion, directorio):
                 print(f"🔌 Cliente {ip_cliente} desconectado")
                 _ips_desconectadas.add(ip_cliente)
 
-def _escuchar_conexiones_socket(servidor_sock: socket.socket, contexto_ssl: ssl.SSLContext, directorio: str):
+def _escuchar_conexiones_socket(servidor_sock: socket.socket, contexto_ssl: ssl.SSLContext, directorio: str,
+                                control: ControlAdmision):
     family_type = "IPv6" if servidor_sock.family == socket.AF_INET6 else "IPv4"
     try:
         addr = servidor_sock.getsockname()
@@ -157,33 +190,40 @@ def _escuchar_conexiones_socket(servidor_sock: socket.socket, contexto_ssl: ssl.
             ip_cliente = direccion[0]
             logging.info(f"✅ Nueva conexión desde {ip_cliente} ({family_type})")
 
-            try:
-                conexion_ssl = contexto_ssl.wrap_socket(conexion, server_side=True)
-            except ssl.SSLError as error:
-                logging.error(f"🔒 Error SSL con {ip_cliente}: {error}")
-                try:
-                    conexion.close()
-                except Exception:
-                    pass
-                continue
-
-            hilo = threading.Thread(
-                target=manejar_cliente,
-                args=(conexion_ssl, direccion, directorio),
-                daemon=True,
-                name=f"cliente-{ip_cliente}"
-            )
-            hilo.start()
-            # 🧵 Print informativo de hilo de cliente levantado con PID/TID
-            try:
-                import os
-                print(f"🧵 Hilo para cliente {ip_cliente} ({family_type}) levantado (PID: {os.getpid()}, TID: {hilo.ident})")
-            except Exception:
-                print(f"🧵 Hilo para cliente {ip_cliente} ({family_type}) levantado")
+            # El handshake TLS y la sesión corren en un hilo del pool; si no hay
+            # lugar en la cola la conexión se rechaza sin bloquear este accept()
+            control.enviar(conexion, direccion, contexto_ssl, directorio)
 
         except Exception as e:
             logging.error(f"❌ Error al aceptar conexión {family_type}: {e}")
 
+def servir_sockets(sockets_servidor, contexto_ssl: ssl.SSLContext, directorio: str):
+    """Atiende los sockets ya creados con el pool de hilos hasta Ctrl+C."""
+    # 🧵 Pool fijo de hilos compartido por todos los sockets
+    control = ControlAdmision(manejar_cliente).iniciar()
+
+    # 🧵 Lanzar un hilo accept() por socket
+    hilos = []
+    for sock in sockets_servidor:
+        hilo = threading.Thread(
+            target=_escuchar_conexiones_socket,
+            args=(sock, contexto_ssl, directorio, control),
+            daemon=True
+        )
+        hilos.append(hilo)
+        hilo.start()
+        # 🧵 Print informativo de hilo de socket levantado
+        fam = "IPv6" if sock.family == socket.AF_INET6 else "IPv4"
+        print(f"🧵 Hilo de escucha {fam} levantado (PID: {os.getpid()})")
+
+    # Mantener proceso vivo hasta Ctrl+C
+    try:
+        for hilo in hilos:
+            hilo.join()
+    except KeyboardInterrupt:
+        logging.info("👋 Servidor detenido por el usuario")
+        print("\n👋 Servidor detenido. ¡Hasta pronto!")
+
 def iniciar_servidor(host=None, port=None, directorio=None):
     # Defaults
     host = host or os.getenv("SERVER_HOST", "0.0.0.0")      # ignorado en hardening por utils.network
@@ -217,27 +257,7 @@ def iniciar_servidor(host=None, port=None, directorio=None):
                 bind_str = "<desconocido>"
             print(f"   ✅ Socket {i}: {fam} en {bind_str}")
 
-        # 🧵 Lanzar un hilo accept() por socket
-        hilos = []
-        for sock in sockets_servidor:
-            hilo = threading.Thread(
-                target=_escuchar_conexiones_socket,
-                args=(sock, contexto, directorio),
-                daemon=True
-            )
-            hilos.append(hilo)
-            hilo.start()
-            # 🧵 Print informativo de hilo de socket levantado
-            fam = "IPv6" if sock.family == socket.AF_INET6 else "IPv4"
-            print(f"🧵 Hilo de escucha {fam} levantado")
-
-        # Mantener proceso vivo hasta Ctrl+C
-        try:
-            for hilo in hilos:
-                hilo.join()
-        except KeyboardInterrupt:
-            logging.info("👋 Servidor detenido por el usuario")
-            print("\n👋 Servidor detenido. ¡Hasta pronto!")
+        servir_sockets(sockets_servidor, contexto, directorio)
 
     except Exception as error:
         logging.error(f"❌ Error en el servidor: {error}")
@@ -253,5 +273,12 @@ if __name__ == "__main__":
     if getattr(args, "verbose", False):
         logging.getLogger().setLevel(logging.DEBUG)
 
-    # 🚀 Iniciar servidor
-    iniciar_servidor(args.host, args.port, args.directorio)
+    # 🚀 Iniciar servidor con el motor elegido
+    if args.workers > 1:
+        from server.supervisor import iniciar_supervisor
+        iniciar_supervisor(args.host, args.port, args.directorio, args.engine, args.workers)
+    elif args.engine == 'asyncio':
+        from server.servidor_asyncio import iniciar_servidor_asyncio
+        iniciar_servidor_asyncio(args.host, args.port, args.directorio)
+    else:
+        iniciar_servidor(args.host, args.port, args.directorio)
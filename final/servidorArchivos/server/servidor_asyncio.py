@@ -0,0 +1,504 @@
+import asyncio
+import socket
+import ssl
+import logging
+import os
+import sys
+import concurrent.futures
+from concurrent.futures import ThreadPoolExecutor
+
+# Configuración básica de sys.path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from server.comandos import manejar_comando
+from server.seguridad import (autenticar_usuario_en_servidor, registrar_usuario, autenticar_con_token,
+                              token_de_comando, mensaje_autenticacion_exitosa)
+from server.admision import LimitadorSesiones, MENSAJE_OCUPADO, registrar_fuente_estadisticas
+from server.multiplexor import MAX_EN_VUELO, MAX_PENDIENTES, MAX_FRAMES_COLA
+from utils import protocolo
+from utils.config import CERT_PATH, KEY_PATH, crear_directorio_si_no_existe
+from utils.network import crear_socket_servidor, configurar_contexto_ssl
+
+# Motor alternativo al de hilos (server/servidor.py): cada sesión es una corrutina
+# sobre un único event loop, por lo que una sesión inactiva no ocupa un hilo.
+# El trabajo bloqueante (bcrypt, SQLite, disco) se delega a un ejecutor acotado.
+
+# ⚙️ Límites del motor
+MAX_HILOS_EJECUTOR = int(os.getenv("ASYNC_MAX_HILOS", 32))
+TIMEOUT_HANDSHAKE_SSL = float(os.getenv("ASYNC_TIMEOUT_HANDSHAKE", 30))
+TIMEOUT_TRANSFERENCIA = 120  # Igual al timeout de socket usado por los clientes
+# asyncio reserva un buffer de lectura TLS de 256 KB por conexión; con miles de
+# sesiones inactivas eso domina el uso de memoria, así que se reduce.
+BUFFER_SSL = int(os.getenv("ASYNC_BUFFER_SSL", 32 * 1024))
+
+# Comandos que necesitan la conexión para transferir datos
+COMANDOS_TRANSFERENCIA = ("DESCARGAR", "SUBIR", "SUBIDA_BLOQUE")
+
+
+class _ConexionPuente:
+    """
+    Adapta un par StreamReader/StreamWriter a la interfaz bloqueante de socket
+    (sendall/recv/settimeout) que esperan `crear_archivo` y `descargar_archivo`.
+    Se usa desde un hilo del ejecutor; cada operación se agenda en el event loop.
+    """
+
+    def __init__(self, loop, reader, writer):
+        self._loop = loop
+        self._reader = reader
+        self._writer = writer
+        self._timeout = TIMEOUT_TRANSFERENCIA
+
+    def settimeout(self, timeout):
+        self._timeout = timeout
+
+    def gettimeout(self):
+        return self._timeout
+
+    def getpeername(self):
+        return self._writer.get_extra_info('peername')
+
+    def sendall(self, datos):
+        # Copia: el transporte puede retener el objeto y quien llama reutiliza su buffer
+        self._ejecutar(_escribir(self._writer, bytes(datos)))
+
+    def recv(self, tamaño):
+        return self._ejecutar(self._reader.read(tamaño))
+
+    def _ejecutar(self, corrutina):
+        futuro = asyncio.run_coroutine_threadsafe(corrutina, self._loop)
+        try:
+            return futuro.result(self._timeout)
+        except concurrent.futures.TimeoutError:
+            futuro.cancel()
+            raise socket.timeout("Tiempo de espera agotado en la conexión")
+
+
+async def _escribir(writer, datos: bytes):
+    writer.write(datos)
+    await writer.drain()
+
+
+async def _enviar_mensaje(writer, mensaje: str):
+    await _escribir(writer, mensaje.encode('utf-8'))
+
+
+async def _recibir_mensaje(reader, writer, prompt: str | None = None) -> str:
+    if prompt:
+        await _enviar_mensaje(writer, prompt)
+    datos = await reader.read(1024)
+    if not datos:
+        raise ConnectionError("Conexión cerrada por el cliente")
+    return datos.decode().strip()
+
+
+async def _manejar_registro(writer, comando_registro: str, ejecutor):
+    partes = comando_registro.split()
+    if len(partes) != 3:
+        await _enviar_mensaje(writer, "❌ Formato incorrecto. Usa: REGISTRAR usuario contraseña\n")
+        return
+
+    _, nuevo_usuario, nueva_contraseña = partes
+    loop = asyncio.get_running_loop()
+    respuesta = await loop.run_in_executor(ejecutor, registrar_usuario, nuevo_usuario, nueva_contraseña)
+    await _enviar_mensaje(writer, f"{respuesta}\n")
+
+    if respuesta.startswith("✅"):
+        await _enviar_mensaje(writer, "👤 Ahora inicia sesión con tu nuevo usuario.\n")
+
+
+async def _autenticar_usuario(reader, writer, ejecutor, usuario: str | None = None):
+    loop = asyncio.get_running_loop()
+    while True:
+        if usuario is None:
+            usuario = await _recibir_mensaje(reader, writer, "👤 Usuario: ")
+
+        # Registro inline
+        if usuario.upper().startswith("REGISTRAR"):
+            await _manejar_registro(writer, usuario, ejecutor)
+            usuario = None
+            continue
+
+        # Token de una sesión anterior: se valida en el loop (solo un HMAC)
+        token = token_de_comando(usuario)
+        if token is not None:
+            datos_usuario = autenticar_con_token(token)
+            if not datos_usuario:
+                await _enviar_mensaje(writer, "❌ Token inválido o vencido. Inicia sesión con tu contraseña.\n")
+                usuario = None
+                continue
+        else:
+            password = await _recibir_mensaje(reader, writer, "🔒 Contraseña: ")
+
+            # bcrypt + SQLite: fuera del event loop
+            datos_usuario = await loop.run_in_executor(ejecutor, autenticar_usuario_en_servidor, usuario, password)
+            if not datos_usuario:
+                await _enviar_mensaje(writer, "❌ Credenciales inválidas. Intenta nuevamente.\n")
+                usuario = None
+                continue
+
+        usuario_id, permisos = datos_usuario
+        await _enviar_mensaje(writer, f"{mensaje_autenticacion_exitosa(usuario_id, permisos)}\n")
+        return usuario_id, permisos
+
+
+async def _procesar_comandos(reader, writer, directorio: str, usuario_id: int, ejecutor) -> bool:
+    """
+    Retorna True si el cliente envió SALIR explícitamente.
+    """
+    loop = asyncio.get_running_loop()
+    while True:
+        comando = await _recibir_mensaje(reader, writer, "\n💻 Ingresar comando ('SALIR' para desconectar): ")
+
+        if comando.upper() == "SALIR":
+            await _enviar_mensaje(writer, "🔌 Desconectando...\n")
+            return True
+
+        partes = comando.strip().split()
+        if partes and partes[0].upper() in COMANDOS_TRANSFERENCIA:
+            # La transferencia se ejecuta en el ejecutor; mientras tanto esta
+            # corrutina no lee del stream, así que el puente tiene acceso exclusivo.
+            puente = _ConexionPuente(loop, reader, writer)
+            respuesta = await loop.run_in_executor(
+                ejecutor, manejar_comando, comando, directorio, usuario_id, puente
+            )
+        else:
+            respuesta = await loop.run_in_executor(
+                ejecutor, manejar_comando, comando, directorio, usuario_id
+            )
+
+        await _enviar_mensaje(writer, f"📄 {respuesta}\n")
+
+
+async def _recibir_frame(reader):
+    cabecera = await reader.readexactly(protocolo.CABECERA.size)
+    tipo, flags, request_id, longitud = protocolo.desempaquetar_cabecera(cabecera)
+    payload = await reader.readexactly(longitud) if longitud else b''
+    return tipo, flags, request_id, payload
+
+
+async def _responder_frame(writer, request_id: int, respuesta, tipo=protocolo.RESPUESTA):
+    texto = "" if respuesta is None else str(respuesta)
+    await _escribir(writer, protocolo.empaquetar_frame(tipo, request_id, texto, protocolo.FLAG_FINAL))
+
+
+class _CanalAsync(protocolo.ConexionEnmarcada):
+    """
+    Canal de transferencia de una solicitud v2 multiplexada: sus frames DATOS
+    llegan por una cola que alimenta la corrutina de la sesión, y los que envía
+    se escriben enteros en el event loop, sin mezclarse con otras solicitudes.
+    """
+
+    def __init__(self, loop, writer, request_id):
+        self._loop = loop
+        self._writer = writer
+        self.entrada = asyncio.Queue(maxsize=MAX_FRAMES_COLA)
+        self._timeout = TIMEOUT_TRANSFERENCIA
+        self.abortado = False
+        super().__init__(None, request_id, lector=self._leer_entrada, escritor=self._escribir_frame)
+
+    def abortar(self):
+        """Descarta lo pendiente y deja la marca de fin (se llama desde el event loop)."""
+        self.abortado = True
+        while not self.entrada.empty():
+            self.entrada.get_nowait()
+        self.entrada.put_nowait(None)
+
+    def _leer_entrada(self):
+        if self.abortado and self.entrada.empty():
+            raise ConnectionError("Transferencia abortada")
+        frame = self._ejecutar(self.entrada.get())
+        if frame is None:
+            raise ConnectionError("Sesión cerrada durante la transferencia")
+        return frame
+
+    def _escribir_frame(self, frame):
+        self._ejecutar(_escribir(self._writer, frame))
+
+    def settimeout(self, timeout):
+        self._timeout = timeout
+
+    def gettimeout(self):
+        return self._timeout
+
+    def getpeername(self):
+        return self._writer.get_extra_info('peername')
+
+    _ejecutar = _ConexionPuente._ejecutar
+
+
+async def _procesar_protocolo_v2(reader, writer, directorio: str, ejecutor) -> bool:
+    """
+    Sesión con frames (utils/protocolo.py), equivalente a la de server/multiplexor.py:
+    cada COMANDO se atiende en su propia tarea y las respuestas salen en el orden
+    en que terminan. Retorna True si el cliente envió SALIR explícitamente.
+    """
+    loop = asyncio.get_running_loop()
+    usuario_id = None
+    cupo = asyncio.Semaphore(MAX_EN_VUELO)
+    tareas = {}    # request_id -> tarea
+    canales = {}   # request_id -> _CanalAsync (solo transferencias)
+
+    async def _atender(request_id, comando, canal):
+        try:
+            async with cupo:
+                if canal is not None:
+                    respuesta = await loop.run_in_executor(
+                        ejecutor, manejar_comando, comando, directorio, usuario_id, canal
+                    )
+                else:
+                    respuesta = await loop.run_in_executor(
+                        ejecutor, manejar_comando, comando, directorio, usuario_id
+                    )
+            await _responder_frame(writer, request_id, respuesta)
+        except Exception as error:
+            logging.error(f"❌ Error al ejecutar '{comando}': {error}")
+            try:
+                await _responder_frame(writer, request_id, f"❌ Error al ejecutar el comando: {error}",
+                                       protocolo.ERROR)
+            except (ConnectionError, OSError):
+                pass
+        finally:
+            tareas.pop(request_id, None)
+            canales.pop(request_id, None)
+
+    async def _entregar(request_id, canal, frame):
+        # Sin bloquear la lectura de la sesión: si la solicitud no consume sus datos,
+        # se espera a que haya lugar o a que termine (y entonces el frame se
+        # descarta); pasado TIMEOUT_TRANSFERENCIA se aborta la transferencia.
+        try:
+            canal.entrada.put_nowait(frame)
+            return
+        except asyncio.QueueFull:
+            pass
+        poner = asyncio.ensure_future(canal.entrada.put(frame))
+        hechas, _ = await asyncio.wait({poner, tareas[request_id]}, timeout=TIMEOUT_TRANSFERENCIA,
+                                       return_when=asyncio.FIRST_COMPLETED)
+        if poner in hechas:
+            return
+        poner.cancel()
+        if canales.get(request_id) is canal:
+            logging.warning(f"⏳ La solicitud {request_id} no consume sus datos: transferencia abortada")
+            canal.abortar()
+
+    try:
+        while True:
+            tipo, flags, request_id, payload = await _recibir_frame(reader)
+
+            if tipo == protocolo.DATOS:
+                canal = canales.get(request_id)
+                if canal is not None and not canal.abortado:
+                    await _entregar(request_id, canal, (tipo, flags, request_id, payload))
+                continue
+
+            if tipo == protocolo.AUTENTICAR:
+                usuario, _, password = payload.decode('utf-8').partition("\0")
+                datos_usuario = await loop.run_in_executor(ejecutor, autenticar_usuario_en_servidor, usuario, password)
+                if not datos_usuario:
+                    await _responder_frame(writer, request_id, "❌ Credenciales inválidas. Intenta nuevamente.",
+                                           protocolo.ERROR)
+                    continue
+                usuario_id, permisos = datos_usuario
+                await _responder_frame(writer, request_id, mensaje_autenticacion_exitosa(usuario_id, permisos))
+                continue
+
+            if tipo != protocolo.COMANDO:
+                await _responder_frame(writer, request_id, f"❌ Tipo de mensaje no soportado: {tipo}", protocolo.ERROR)
+                continue
+
+            comando = payload.decode('utf-8').strip()
+            partes = comando.split()
+            nombre = partes[0].upper() if partes else ""
+
+            if nombre == "SALIR":
+                # Se responde cuando terminen las solicitudes en curso
+                if tareas:
+                    await asyncio.gather(*tareas.values(), return_exceptions=True)
+                await _responder_frame(writer, request_id, "🔌 Desconectando...")
+                return True
+
+            if nombre == "AUTH":
+                datos_usuario = autenticar_con_token(token_de_comando(comando) or "")
+                if not datos_usuario:
+                    await _responder_frame(writer, request_id,
+                                           "❌ Token inválido o vencido. Inicia sesión con tu contraseña.", protocolo.ERROR)
+                    continue
+                usuario_id, permisos = datos_usuario
+                await _responder_frame(writer, request_id, mensaje_autenticacion_exitosa(usuario_id, permisos))
+                continue
+
+            if usuario_id is None:
+                if nombre == "REGISTRAR" and len(partes) == 3:
+                    respuesta = await loop.run_in_executor(ejecutor, registrar_usuario, partes[1], partes[2])
+                    await _responder_frame(writer, request_id, respuesta)
+                else:
+                    await _responder_frame(writer, request_id, "❌ Debes autenticarte primero.", protocolo.ERROR)
+                continue
+
+            if request_id in tareas:
+                await _responder_frame(writer, request_id, f"❌ El request_id {request_id} ya está en curso.",
+                                       protocolo.ERROR)
+                continue
+
+            if len(tareas) >= MAX_EN_VUELO + MAX_PENDIENTES:
+                await _responder_frame(writer, request_id, "⛔ Demasiadas solicitudes en curso. Espera las respuestas.",
+                                       protocolo.ERROR)
+                continue
+
+            canal = None
+            if nombre in COMANDOS_TRANSFERENCIA:
+                canal = canales[request_id] = _CanalAsync(loop, writer, request_id)
+            tareas[request_id] = asyncio.create_task(_atender(request_id, comando, canal))
+    finally:
+        # Las solicitudes que esperan turno ya no tienen a quién responder
+        for tarea in tareas.values():
+            tarea.cancel()
+        # Desbloquear las transferencias que esperan datos de un cliente que ya no está
+        for canal in list(canales.values()):
+            canal.abortar()
+
+
+async def _manejar_cliente(reader, writer, directorio: str, ejecutor):
+    direccion = writer.get_extra_info('peername') or ("<desconocido>",)
+    ip_cliente = direccion[0]
+    logging.info(f"✅ Nueva conexión desde {ip_cliente} (asyncio)")
+
+    try:
+        await _enviar_mensaje(writer, "🌍 Bienvenido al servidor de archivos seguro.\n")
+        primer_mensaje = await _recibir_mensaje(reader, writer, "👤 Usuario: ")
+
+        if primer_mensaje == protocolo.SALUDO_V2:
+            await _enviar_mensaje(writer, f"{protocolo.CONFIRMACION_V2}\n")
+            desconectado = await _procesar_protocolo_v2(reader, writer, directorio, ejecutor)
+        else:
+            usuario_id, permisos = await _autenticar_usuario(reader, writer, ejecutor, primer_mensaje)
+            desconectado = await _procesar_comandos(reader, writer, directorio, usuario_id, ejecutor)
+
+        if desconectado:
+            logging.info(f"🔌 Cliente {ip_cliente} desconectado")
+    except (ConnectionError, ssl.SSLError, asyncio.IncompleteReadError, protocolo.ErrorProtocolo) as error:
+        logging.info(f"🔌 Conexión con {ip_cliente} finalizada: {error}")
+    except Exception as error:
+        logging.error(f"❌ Error con cliente {ip_cliente}: {error}")
+    finally:
+        try:
+            writer.close()
+            await writer.wait_closed()
+        except Exception:
+            pass
+
+
+def _reducir_buffer_ssl():
+    try:
+        from asyncio import sslproto
+        if hasattr(sslproto.SSLProtocol, 'max_size'):
+            sslproto.SSLProtocol.max_size = BUFFER_SSL
+    except ImportError:
+        pass
+
+
+def _ampliar_limite_descriptores():
+    # Miles de sesiones inactivas requieren miles de descriptores abiertos
+    try:
+        import resource
+        blando, duro = resource.getrlimit(resource.RLIMIT_NOFILE)
+        if duro == resource.RLIM_INFINITY or blando < duro:
+            nuevo = duro if duro != resource.RLIM_INFINITY else max(blando, 65536)
+            resource.setrlimit(resource.RLIMIT_NOFILE, (nuevo, duro))
+            logging.info(f"📈 Límite de descriptores ampliado: {blando} -> {nuevo}")
+    except (ImportError, ValueError, OSError) as error:
+        logging.debug(f"No se pudo ampliar el límite de descriptores: {error}")
+
+
+async def _servir(sockets_servidor, contexto_ssl: ssl.SSLContext, directorio: str):
+    ejecutor = ThreadPoolExecutor(max_workers=MAX_HILOS_EJECUTOR, thread_name_prefix="async-ejecutor")
+    limitador = LimitadorSesiones()
+    rechazos = {}
+
+    async def _al_conectar(reader, writer):
+        ip_cliente = (writer.get_extra_info('peername') or ("<desconocido>",))[0]
+        motivo = limitador.adquirir(ip_cliente)
+        if motivo:
+            rechazos[motivo] = rechazos.get(motivo, 0) + 1
+            logging.warning(f"⛔ Conexión de {ip_cliente} rechazada ({motivo})")
+            try:
+                await _enviar_mensaje(writer, MENSAJE_OCUPADO)
+                writer.close()
+            except Exception:
+                pass
+            return
+        try:
+            await _manejar_cliente(reader, writer, directorio, ejecutor)
+        finally:
+            limitador.liberar(ip_cliente)
+
+    registrar_fuente_estadisticas(lambda: {
+        'motor': 'asyncio',
+        'sesiones_activas': limitador.sesiones_activas(),
+        'ips_activas': limitador.ips_activas(),
+        'rechazadas': sum(rechazos.values()),
+        **rechazos,
+    })
+
+    servidores = []
+    try:
+        for sock in sockets_servidor:
+            servidor = await asyncio.start_server(
+                _al_conectar,
+                sock=sock,
+                ssl=contexto_ssl,
+                ssl_handshake_timeout=TIMEOUT_HANDSHAKE_SSL,
+            )
+            servidores.append(servidor)
+            fam = "IPv6" if sock.family == socket.AF_INET6 else "IPv4"
+            print(f"👂 Esperando conexiones {fam} (asyncio) en {_formatear_direccion(sock)} ...")
+
+        print(f"⚡ Motor asyncio activo (PID: {os.getpid()}, ejecutor de {MAX_HILOS_EJECUTOR} hilos)")
+        await asyncio.gather(*(servidor.serve_forever() for servidor in servidores))
+    finally:
+        for servidor in servidores:
+            servidor.close()
+        ejecutor.shutdown(wait=False, cancel_futures=True)
+
+
+def _formatear_direccion(sock):
+    try:
+        addr = sock.getsockname()
+        return f"[{addr[0]}]:{addr[1]}" if sock.family == socket.AF_INET6 else f"{addr[0]}:{addr[1]}"
+    except Exception:
+        return "<desconocido>"
+
+
+def servir_sockets(sockets_servidor, contexto_ssl: ssl.SSLContext, directorio: str):
+    """Atiende los sockets ya creados con el motor asyncio hasta Ctrl+C."""
+    _ampliar_limite_descriptores()
+    _reducir_buffer_ssl()
+    try:
+        asyncio.run(_servir(sockets_servidor, contexto_ssl, directorio))
+    except KeyboardInterrupt:
+        logging.info("👋 Servidor detenido por el usuario")
+        print("\n👋 Servidor detenido. ¡Hasta pronto!")
+
+
+def iniciar_servidor_asyncio(host=None, port=None, directorio=None):
+    # Defaults (idénticos a server/servidor.py)
+    host = host or os.getenv("SERVER_HOST", "0.0.0.0")
+    port = port or int(os.getenv("SERVER_PORT", 5005))
+    base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    directorio = directorio or os.getenv("SERVIDOR_DIR", os.path.join(os.path.dirname(base_dir), "archivos"))
+
+    crear_directorio_si_no_existe(directorio)
+
+    contexto = configurar_contexto_ssl(CERT_PATH, KEY_PATH)
+    if not contexto:
+        return
+
+    try:
+        sockets_servidor = crear_socket_servidor(host, port)
+        if not sockets_servidor:
+            logging.error("❌ No se pudieron crear sockets para escuchar conexiones")
+            return
+
+        print(f"🌍 Servidor de Archivos Seguro (asyncio) escuchando en {len(sockets_servidor)} interfaces")
+        servir_sockets(sockets_servidor, contexto, directorio)
+    except Exception as error:
+        logging.error(f"❌ Error en el servidor asyncio: {error}")
@@ -0,0 +1,282 @@
+import os
+import sys
+import json
+import time
+import queue
+import signal
+import tempfile
+import logging
+import threading
+import multiprocessing
+from multiprocessing.connection import wait
+
+# Configuración básica de sys.path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from utils.config import CERT_PATH, KEY_PATH, crear_directorio_si_no_existe
+from utils.network import crear_socket_servidor, configurar_contexto_ssl, soporta_reuse_port
+
+# Modo multiproceso (--workers N): el supervisor lanza N procesos servidor que
+# comparten el puerto. Con SO_REUSEPORT cada worker hace su propio bind y el kernel
+# reparte las conexiones; si el sistema no lo soporta, los workers heredan los
+# sockets creados por el supervisor. Los workers que mueren se reinician y sus
+# estadísticas se agregan periódicamente.
+
+# ⚙️ Configuración (variables de entorno)
+INTERVALO_ESTADISTICAS = float(os.getenv("SERVER_INTERVALO_ESTADISTICAS", 10))
+RETARDO_REINICIO_MAX = float(os.getenv("SERVER_RETARDO_REINICIO_MAX", 30))
+VIDA_MINIMA_WORKER = 5.0  # Un worker que muere antes de esto se reinicia con retardo creciente
+
+# Estado de ejecución: fuera del árbol de fuentes salvo que se indique otra ruta
+ESTADISTICAS_PATH = os.getenv(
+    "SERVER_ESTADISTICAS_PATH", os.path.join(tempfile.gettempdir(), "servidor_archivos", "estadisticas_workers.json")
+)
+
+# Contadores que no se suman al agregar
+_CLAVES_MAXIMO = ('espera_cola_max_ms',)
+_CLAVES_PROMEDIO = ('espera_cola_promedio_ms', 'descarga_mb_s_promedio', 'db_pool_espera_promedio_ms')
+_CLAVES_IGNORADAS = ('pid', 'worker', 'motor')
+
+
+def _contexto_multiproceso():
+    # fork permite heredar los sockets ya creados sin serializarlos
+    try:
+        return multiprocessing.get_context('fork')
+    except ValueError:
+        return multiprocessing.get_context()
+
+
+def _detener_por_senal(signum, frame):
+    raise KeyboardInterrupt
+
+
+def _salir_worker(*_):
+    # os._exit no ejecuta atexit: escribir antes los logs encolados
+    from baseDeDatos.db import vaciar_logs
+    vaciar_logs(timeout=2)
+    os._exit(0)
+
+
+def _reportar_estadisticas(indice, cola_estadisticas, pid_supervisor):
+    from server.admision import obtener_estadisticas
+    while True:
+        time.sleep(INTERVALO_ESTADISTICAS)
+        if os.getppid() != pid_supervisor:
+            # El supervisor murió sin poder detenernos: no quedar huérfanos escuchando
+            _salir_worker()
+        try:
+            cola_estadisticas.put_nowait((indice, obtener_estadisticas()))
+        except Exception:
+            pass  # Supervisor saturado o caído: se reintenta en el próximo ciclo
+
+
+def _estadisticas_cluster():
+    """Resumen agregado escrito por el supervisor, visible desde cualquier worker."""
+    try:
+        with open(ESTADISTICAS_PATH, 'r', encoding='utf-8') as archivo:
+            agregado = json.load(archivo).get('total', {})
+    except (OSError, ValueError):
+        return {}
+    return {f"cluster_{clave}": valor for clave, valor in agregado.items()}
+
+
+def _ejecutar_worker(indice, host, port, directorio, engine, sockets_heredados, cola_estadisticas):
+    # Ctrl+C llega a todo el grupo de procesos; el apagado lo coordina el supervisor
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, _salir_worker)
+
+    from server.admision import registrar_fuente_estadisticas
+
+    contexto = configurar_contexto_ssl(CERT_PATH, KEY_PATH)
+    if not contexto:
+        sys.exit(1)
+
+    sockets_servidor = sockets_heredados or crear_socket_servidor(host, port, reuse_port=True)
+
+    registrar_fuente_estadisticas(lambda: {'worker': indice})
+    registrar_fuente_estadisticas(_estadisticas_cluster)
+    threading.Thread(
+        target=_reportar_estadisticas, args=(indice, cola_estadisticas, os.getppid()), daemon=True, name="reporte-estadisticas"
+    ).start()
+
+    print(f"👷 Worker {indice} iniciado (PID: {os.getpid()}, motor: {engine})")
+    if engine == 'asyncio':
+        from server.servidor_asyncio import servir_sockets
+    else:
+        from server.servidor import servir_sockets
+    servir_sockets(sockets_servidor, contexto, directorio)
+
+
+class Supervisor:
+    """Lanza N workers, los reinicia si mueren y agrega sus estadísticas."""
+
+    def __init__(self, num_workers, host, port, directorio, engine='threads'):
+        self.num_workers = num_workers
+        self.host = host
+        self.port = port
+        self.directorio = directorio
+        self.engine = engine
+        self._ctx = _contexto_multiproceso()
+        self._cola_estadisticas = self._ctx.Queue(maxsize=num_workers * 16)
+        self._sockets_heredados = None
+        self._workers = {}          # indice -> Process
+        self._inicios = {}          # indice -> time.monotonic() del último arranque
+        self._retardos = {}         # indice -> retardo de reinicio actual
+        self._reinicios_pendientes = {}  # indice -> momento en que se puede reiniciar
+        self._ultimas = {}          # indice -> último dict de estadísticas
+        self.reinicios = 0
+        self._detenido = False
+
+    def preparar_sockets(self):
+        if soporta_reuse_port():
+            # Comprobar que el puerto esté libre antes de lanzar los workers; los
+            # sockets de prueba se cierran para que el kernel no les asigne conexiones
+            for sock in crear_socket_servidor(self.host, self.port, reuse_port=True):
+                sock.close()
+            print(f"🔀 SO_REUSEPORT activo: cada worker escucha en {self.host}:{self.port}")
+        else:
+            self._sockets_heredados = crear_socket_servidor(self.host, self.port)
+            print(f"🔀 SO_REUSEPORT no disponible: los workers comparten los sockets del supervisor")
+
+    def _lanzar(self, indice):
+        proceso = self._ctx.Process(
+            target=_ejecutar_worker,
+            args=(indice, self.host, self.port, self.directorio, self.engine,
+                  self._sockets_heredados, self._cola_estadisticas),
+            name=f"worker-{indice}",
+            daemon=True,
+        )
+        proceso.start()
+        self._workers[indice] = proceso
+        self._inicios[indice] = time.monotonic()
+        logging.info(f"👷 Worker {indice} lanzado (PID: {proceso.pid})")
+
+    def _atender_caida(self, indice):
+        proceso = self._workers.pop(indice)
+        self._ultimas.pop(indice, None)
+        vida = time.monotonic() - self._inicios.get(indice, 0)
+        logging.warning(f"⚠️ Worker {indice} (PID: {proceso.pid}) terminó con código {proceso.exitcode}")
+        print(f"⚠️ Worker {indice} (PID: {proceso.pid}) terminó con código {proceso.exitcode}, reiniciando...")
+
+        # Retardo creciente si el worker muere apenas arranca (evita un bucle de reinicios)
+        if vida < VIDA_MINIMA_WORKER:
+            retardo = min(self._retardos.get(indice, 0.5) * 2, RETARDO_REINICIO_MAX)
+        else:
+            retardo = 0.0
+        self._retardos[indice] = retardo or 0.5
+        self._reinicios_pendientes[indice] = time.monotonic() + retardo
+
+    def _reiniciar_pendientes(self):
+        ahora = time.monotonic()
+        for indice, momento in list(self._reinicios_pendientes.items()):
+            if momento <= ahora:
+                del self._reinicios_pendientes[indice]
+                self.reinicios += 1
+                self._lanzar(indice)
+
+    def _recolectar_estadisticas(self):
+        while True:
+            try:
+                indice, estadisticas = self._cola_estadisticas.get_nowait()
+            except queue.Empty:
+                return
+            if indice in self._workers:
+                self._ultimas[indice] = estadisticas
+
+    def estadisticas(self):
+        total = {}
+        for estadisticas in self._ultimas.values():
+            for clave, valor in estadisticas.items():
+                if clave in _CLAVES_IGNORADAS or clave.startswith('cluster_'):
+                    continue
+                if not isinstance(valor, (int, float)) or isinstance(valor, bool):
+                    continue
+                if clave in _CLAVES_MAXIMO:
+                    total[clave] = max(total.get(clave, 0), valor)
+                elif clave in _CLAVES_PROMEDIO:
+                    total[clave] = round(total.get(clave, 0) + valor / len(self._ultimas), 2)
+                else:
+                    total[clave] = total.get(clave, 0) + valor
+        total['workers_vivos'] = len(self._workers)
+        total['reinicios_workers'] = self.reinicios
+        return {
+            'total': total,
+            'workers': {
+                str(indice): {'pid': proceso.pid, **self._ultimas.get(indice, {})}
+                for indice, proceso in self._workers.items()
+            },
+        }
+
+    def _publicar_estadisticas(self):
+        agregado = self.estadisticas()
+        try:
+            os.makedirs(os.path.dirname(ESTADISTICAS_PATH), exist_ok=True)
+            temporal = f"{ESTADISTICAS_PATH}.tmp"
+            with open(temporal, 'w', encoding='utf-8') as archivo:
+                json.dump(agregado, archivo, ensure_ascii=False, default=str)
+            os.replace(temporal, ESTADISTICAS_PATH)
+        except OSError as error:
+            logging.error(f"❌ No se pudieron guardar las estadísticas de los workers: {error}")
+        total = agregado['total']
+        logging.info(
+            f"📊 Workers: {total['workers_vivos']}/{self.num_workers} vivos, "
+            f"sesiones activas: {total.get('sesiones_activas', 0)}, "
+            f"atendidas: {total.get('atendidas', 0)}, rechazadas: {total.get('rechazadas', 0)}, "
+            f"reinicios: {self.reinicios}"
+        )
+
+    def ejecutar(self):
+        signal.signal(signal.SIGTERM, _detener_por_senal)
+        self.preparar_sockets()
+        for indice in range(self.num_workers):
+            self._lanzar(indice)
+        print(f"🧭 Supervisor activo (PID: {os.getpid()}) con {self.num_workers} workers")
+
+        proxima_publicacion = time.monotonic() + INTERVALO_ESTADISTICAS
+        try:
+            while not self._detenido:
+                sentinelas = {proceso.sentinel: indice for indice, proceso in self._workers.items()}
+                espera = 1.0 if self._reinicios_pendientes else INTERVALO_ESTADISTICAS
+                for sentinela in wait(list(sentinelas), timeout=espera):
+                    self._workers[sentinelas[sentinela]].join()
+                    self._atender_caida(sentinelas[sentinela])
+
+                self._reiniciar_pendientes()
+                self._recolectar_estadisticas()
+                if time.monotonic() >= proxima_publicacion:
+                    self._publicar_estadisticas()
+                    proxima_publicacion = time.monotonic() + INTERVALO_ESTADISTICAS
+        except KeyboardInterrupt:
+            print("\n🛑 Apagando workers...")
+        finally:
+            self.detener()
+
+    def detener(self):
+        self._detenido = True
+        for proceso in self._workers.values():
+            if proceso.is_alive():
+                proceso.terminate()
+        for proceso in self._workers.values():
+            proceso.join(timeout=5)
+        for sock in self._sockets_heredados or []:
+            sock.close()
+        logging.info("👋 Supervisor detenido")
+        print("👋 Servidor detenido. ¡Hasta pronto!")
+
+
+def iniciar_supervisor(host=None, port=None, directorio=None, engine='threads', num_workers=None):
+    host = host or os.getenv("SERVER_HOST", "0.0.0.0")
+    port = port or int(os.getenv("SERVER_PORT", 5005))
+    base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    directorio = directorio or os.getenv("SERVIDOR_DIR", os.path.join(os.path.dirname(base_dir), "archivos"))
+    num_workers = num_workers or os.cpu_count() or 1
+
+    crear_directorio_si_no_existe(directorio)
+    if not configurar_contexto_ssl(CERT_PATH, KEY_PATH):
+        return
+
+    try:
+        Supervisor(num_workers, host, port, directorio, engine).ejecutar()
+    except OSError as error:
+        logging.error(f"❌ No se pudo iniciar el modo multiproceso: {error}")
+        print(f"❌ No se pudo iniciar el modo multiproceso: {error}")
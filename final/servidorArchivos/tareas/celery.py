@@ -1,9 +1,10 @@
-import hashlib
 import subprocess
 import os
 import sys
 from dotenv import load_dotenv
 from baseDeDatos.db import log_evento
+from baseDeDatos import verificaciones
+from utils.integridad import calcular_sha256, leer_hash_calculado, guardar_hash_calculado, leer_hash_esperado
 
 # 🧪 Carga las variables de entorno desde .env
 load_dotenv()
@@ -70,15 +71,9 @@ def verificar_integridad_y_virus(ruta_archivo, hash_esperado=None):
     # 🏁 Inicializar resultado
     resultado = _inicializar_resultado(ruta_archivo)
 
-    # Intentar cargar hash esperado desde archivo .hash si no se proporcionó
+    # Si no se proporcionó, usar el hash esperado registrado al subir el archivo
     if not hash_esperado:
-        try:
-            ruta_hash = f"{ruta_archivo}.hash"
-            if os.path.exists(ruta_hash):
-                with open(ruta_hash, 'r') as f:
-                    hash_esperado = f.read().strip()
-        except Exception as e:
-            resultado['mensaje'] += f"⚠️ No se pudo leer hash esperado: {e}. "
+        hash_esperado = leer_hash_esperado(ruta_archivo)
 
     # 🔍 Verificar integridad si se tiene un hash esperado
     if hash_esperado:
@@ -104,12 +99,18 @@ def _inicializar_resultado(ruta_archivo):
         'estado': ESTADO_DESCONOCIDO,
         'integridad': INTEGRIDAD_NO_VERIFICADA,
         'virus': VIRUS_NO_ESCANEADO,
-        'mensaje': ''
+        'mensaje': '',
+        'sha256': None
     }
 
 def _verificar_integridad(resultado, ruta_archivo, hash_esperado):
     try:
-        hash_actual = _calcular_hash_archivo(ruta_archivo)
+        # Reutilizar el hash calculado al recibir el archivo si este no cambió desde entonces
+        hash_actual = leer_hash_calculado(ruta_archivo)
+        if hash_actual is None:
+            hash_actual = calcular_sha256(ruta_archivo)
+            guardar_hash_calculado(ruta_archivo, hash_actual)
+        resultado['sha256'] = hash_actual
 
         if hash_actual == hash_esperado:
             resultado['integridad'] = INTEGRIDAD_VALIDA
@@ -121,11 +122,6 @@ def _verificar_integridad(resultado, ruta_archivo, hash_esperado):
         resultado['integridad'] = INTEGRIDAD_ERROR
         resultado['mensaje'] += f"❌ Error al calcular hash: {error}. "
 
-def _calcular_hash_archivo(ruta_archivo):
-    with open(ruta_archivo, 'rb') as archivo:
-        contenido = archivo.read()
-        return hashlib.sha256(contenido).hexdigest()
-
 def _verificar_virus(resultado, ruta_archivo):
     try:
         escaneo = subprocess.run(
@@ -181,6 +177,14 @@ def _registrar_evento(resultado):
             "VERIFICACION", 
             mensaje_detallado
         )
+        verificaciones.registrar(
+            resultado['ruta'],
+            resultado['estado'],
+            resultado['integridad'],
+            resultado['virus'],
+            mensaje_detallado,
+            resultado['sha256']
+        )
 
         print(f"📝 Resultado guardado en la base de datos para '{nombre_archivo}'")
     except Exception as error:
@@ -119,7 +119,22 @@ def configurar_argumentos(modo_dual=False):
     )
 
     parser.add_argument(
-        '-v', '--verbose', 
+        '-e', '--engine',
+        type=str,
+        choices=['threads', 'asyncio'],
+        default=os.getenv("SERVER_ENGINE", "threads"),
+        help='Motor de concurrencia del servidor: un hilo por cliente o event loop asyncio'
+    )
+
+    parser.add_argument(
+        '-w', '--workers',
+        type=int,
+        default=int(os.getenv("SERVER_WORKERS", 1)),
+        help='Cantidad de procesos servidor (SO_REUSEPORT); con más de 1 se activa el supervisor'
+    )
+
+    parser.add_argument(
+        '-v', '--verbose',
         action='store_true',
         help='Mostrar logs detallados'
     )
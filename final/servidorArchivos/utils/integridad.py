@@ -0,0 +1,258 @@
+import os
+import sys
+import mmap
+import time
+import hashlib
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# Configuración básica de sys.path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from baseDeDatos import metadatos, info_archivos
+
+# ⚙️ Configuración (variables de entorno)
+TAM_BUFFER_HASH = int(os.getenv("HASH_BUFFER", 1024 * 1024))           # Buffer reutilizado por hilo
+UMBRAL_MMAP_HASH = int(os.getenv("HASH_UMBRAL_MMAP", 64 * 1024 * 1024))  # Desde este tamaño se usa mmap (0: nunca)
+MAX_HILOS_HASH = int(os.getenv("HASH_MAX_HILOS", min(8, os.cpu_count() or 1)))
+SIDECARS_HASH = os.getenv("SERVER_SIDECARS_HASH", "0") == "1"  # Seguir escribiendo .hash/.sha256 (clientes viejos)
+
+_buffers = threading.local()
+
+
+def _buffer_hilo():
+    buffer = getattr(_buffers, 'buffer', None)
+    if buffer is None or len(buffer) != TAM_BUFFER_HASH:
+        buffer = _buffers.buffer = bytearray(TAM_BUFFER_HASH)
+    return buffer
+
+
+def calcular_sha256(ruta, usar_mmap=None):
+    """
+    SHA-256 de un archivo con memoria constante. Lee con readinto sobre un buffer
+    preasignado (uno por hilo) o, para archivos grandes, recorre un mmap sin copiar.
+    hashlib libera el GIL en cada update, así que varios hilos hashean en paralelo.
+    """
+    hasher = hashlib.sha256()
+    with open(ruta, 'rb') as f:
+        tamaño = os.fstat(f.fileno()).st_size
+        if usar_mmap is None:
+            usar_mmap = 0 < UMBRAL_MMAP_HASH <= tamaño
+        if usar_mmap and tamaño:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapa:
+                if hasattr(mapa, 'madvise') and hasattr(mmap, 'MADV_SEQUENTIAL'):
+                    mapa.madvise(mmap.MADV_SEQUENTIAL)
+                vista = memoryview(mapa)
+                try:
+                    for inicio in range(0, tamaño, TAM_BUFFER_HASH * 16):
+                        hasher.update(vista[inicio:inicio + TAM_BUFFER_HASH * 16])
+                finally:
+                    vista.release()
+        else:
+            vista = memoryview(_buffer_hilo())
+            while True:
+                leidos = f.readinto(vista)
+                if not leidos:
+                    break
+                hasher.update(vista[:leidos])
+    return hasher.hexdigest()
+
+
+def calcular_sha256_varios(rutas, max_hilos=None):
+    """Hashea varios archivos en paralelo. Retorna {ruta: hash o None si falló}."""
+    def _seguro(ruta):
+        try:
+            return calcular_sha256(ruta)
+        except OSError:
+            return None
+
+    rutas = list(rutas)
+    hilos = min(max_hilos or MAX_HILOS_HASH, len(rutas))
+    if hilos <= 1:
+        return {ruta: _seguro(ruta) for ruta in rutas}
+    with ThreadPoolExecutor(max_workers=hilos, thread_name_prefix="hash") as ejecutor:
+        return dict(zip(rutas, ejecutor.map(_seguro, rutas)))
+
+
+# Hash SHA-256 calculado por el servidor: se guarda en el índice de metadatos
+# (baseDeDatos/metadatos.py) con la identidad del archivo. Mientras el inode, el
+# mtime y el tamaño no cambien, el hash se reutiliza sin releer el archivo. El
+# hash esperado va en baseDeDatos/info_archivos.py.
+#
+# Antes ambos se escribían junto al archivo, en "<archivo>.sha256" (hash e
+# identidad) y "<archivo>.hash". Se siguen leyendo como respaldo para los
+# archivos que todavía no se migraron, y con SERVER_SIDECARS_HASH=1 se siguen
+# escribiendo para los clientes que los descargan.
+
+EXTENSION_HASH_CALCULADO = info_archivos.EXTENSION_HASH_CALCULADO
+EXTENSION_HASH_ESPERADO = info_archivos.EXTENSION_HASH_ESPERADO
+
+
+def _identidad(ruta):
+    estado = os.stat(ruta)
+    return estado.st_ino, estado.st_mtime_ns, estado.st_size
+
+
+def guardar_hash_calculado(ruta, hash_hex):
+    """Guarda el hash de `ruta` junto con su identidad actual."""
+    if SIDECARS_HASH:
+        inode, mtime_ns, tamaño = _identidad(ruta)
+        with open(f"{ruta}{EXTENSION_HASH_CALCULADO}", 'w') as f:
+            f.write(f"{hash_hex}\ninode={inode} mtime_ns={mtime_ns} size={tamaño}\n")
+    try:
+        metadatos.guardar_hash(ruta, hash_hex)
+    except Exception as error:
+        logging.error(f"❌ No se pudo indexar el hash de {ruta}: {error}")
+
+
+def leer_hash_calculado(ruta):
+    """Retorna el hash guardado si el archivo no cambió desde que se calculó, o None."""
+    try:
+        hash_hex = metadatos.obtener_hash(ruta)
+        if hash_hex:
+            return hash_hex
+    except Exception as error:
+        logging.error(f"❌ Error al consultar el índice de metadatos: {error}")
+
+    hash_hex = _leer_archivo_hash(ruta)
+    if hash_hex:
+        try:
+            metadatos.guardar_hash(ruta, hash_hex)
+        except Exception:
+            pass
+    return hash_hex
+
+
+def _leer_archivo_hash(ruta):
+    leido = _parsear_archivo_hash(ruta)
+    if not leido:
+        return None
+    hash_hex, guardada = leido
+    try:
+        return hash_hex if guardada == _identidad(ruta) else None
+    except OSError:
+        return None
+
+
+def _parsear_archivo_hash(ruta):
+    """
+    (hash, identidad) de "<ruta>.sha256" si tiene el formato que escribe el
+    servidor, o None (no existe, formato anterior sin identidad, u otro archivo,
+    como un checksum subido por un usuario).
+    """
+    try:
+        with open(f"{ruta}{EXTENSION_HASH_CALCULADO}", 'r') as f:
+            lineas = f.read().splitlines()
+        if len(lineas) < 2:
+            return None
+        campos = dict(campo.split("=", 1) for campo in lineas[1].split())
+        guardada = (int(campos['inode']), int(campos['mtime_ns']), int(campos['size']))
+        hash_hex = lineas[0].strip().lower()
+        if len(hash_hex) != 64 or any(c not in '0123456789abcdef' for c in hash_hex):
+            return None
+        return hash_hex, guardada
+    except (OSError, ValueError, KeyError, UnicodeDecodeError):
+        return None
+
+
+def guardar_hash_esperado(ruta, hash_hex, usuario_id=None):
+    """Registra el hash esperado de un archivo recién publicado y quién lo subió."""
+    info_archivos.registrar(ruta, hash_hex, usuario_id)
+    if SIDECARS_HASH:
+        with open(f"{ruta}{EXTENSION_HASH_ESPERADO}", 'w') as f:
+            f.write(hash_hex)
+
+
+def leer_hash_esperado(ruta):
+    """Hash esperado de `ruta` (base de metadatos o, si no se migró, su .hash), o None."""
+    try:
+        hash_hex = info_archivos.hash_esperado(ruta)
+        if hash_hex:
+            return hash_hex
+    except Exception as error:
+        logging.error(f"❌ Error al consultar los metadatos de {ruta}: {error}")
+    try:
+        with open(f"{ruta}{EXTENSION_HASH_ESPERADO}", 'r') as f:
+            hash_hex = f.read().strip().lower()
+    except (OSError, UnicodeDecodeError):
+        return None
+    return hash_hex if len(hash_hex) == 64 and all(c in '0123456789abcdef' for c in hash_hex) else None
+
+
+# --- Benchmark: python -m utils.integridad [--tamaños 1M,100M,1G,10G] [--dir /tmp] ---
+
+def _leer_todo(ruta):
+    # Método anterior: el archivo completo en memoria
+    with open(ruta, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def _parsear_tamaño(texto):
+    unidades = {'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3}
+    texto = texto.strip().upper()
+    if texto[-1] in unidades:
+        return int(float(texto[:-1]) * unidades[texto[-1]])
+    return int(texto)
+
+
+def _crear_archivo_prueba(directorio, tamaño):
+    ruta = os.path.join(directorio, f"bench_hash_{tamaño}.bin")
+    if not os.path.exists(ruta) or os.path.getsize(ruta) != tamaño:
+        bloque = os.urandom(min(tamaño, 8 * 1024 * 1024))
+        with open(ruta, 'wb') as f:
+            escritos = 0
+            while escritos < tamaño:
+                parte = bloque[:tamaño - escritos]
+                f.write(parte)
+                escritos += len(parte)
+    return ruta
+
+
+def _benchmark(tamaños, directorio, copias):
+    import resource
+
+    def _medir(funcion, *args):
+        inicio = time.perf_counter()
+        resultado = funcion(*args)
+        return time.perf_counter() - inicio, resultado
+
+    print(f"{'tamaño':>10} {'método':<16} {'segundos':>9} {'MB/s':>9}")
+    for tamaño in tamaños:
+        ruta = _crear_archivo_prueba(directorio, tamaño)
+        metodos = [
+            ("readinto", lambda: calcular_sha256(ruta, usar_mmap=False)),
+            ("mmap", lambda: calcular_sha256(ruta, usar_mmap=True)),
+        ]
+        # Leer todo a memoria con 10 GB no es viable en la mayoría de los equipos
+        if tamaño <= 2 * 1024 ** 3:
+            metodos.insert(0, ("f.read()", lambda: _leer_todo(ruta)))
+        referencia = None
+        for nombre, funcion in metodos:
+            segundos, digest = _medir(funcion)
+            referencia = referencia or digest
+            estado = "" if digest == referencia else "  ❌ hash distinto"
+            print(f"{tamaño:>10} {nombre:<16} {segundos:>9.3f} {tamaño / segundos / 1e6:>9.1f}{estado}")
+
+        # Varios archivos: secuencial vs en paralelo
+        rutas = [ruta] * copias
+        segundos_sec, _ = _medir(lambda: [calcular_sha256(r) for r in rutas])
+        segundos_par, _ = _medir(calcular_sha256_varios, rutas)
+        total = tamaño * copias
+        print(f"{tamaño:>10} {f'{copias}x secuencial':<16} {segundos_sec:>9.3f} {total / segundos_sec / 1e6:>9.1f}")
+        print(f"{tamaño:>10} {f'{copias}x paralelo':<16} {segundos_par:>9.3f} {total / segundos_par / 1e6:>9.1f}")
+
+    pico_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(f"Memoria máxima del proceso: {pico_mb:.0f} MB")
+
+
+if __name__ == "__main__":
+    import argparse
+    import tempfile
+
+    parser = argparse.ArgumentParser(description="Benchmark de hashing SHA-256")
+    parser.add_argument("--tamaños", default="1M,100M,1G", help="Lista separada por comas (ej: 1M,100M,1G,10G)")
+    parser.add_argument("--dir", default=tempfile.gettempdir(), help="Directorio para los archivos de prueba")
+    parser.add_argument("--copias", type=int, default=4, help="Archivos a hashear en la prueba en paralelo")
+    args = parser.parse_args()
+    _benchmark([_parsear_tamaño(t) for t in args.tamaños.split(",")], args.dir, args.copias)
@@ -3,7 +3,16 @@ import logging
 import ssl
 import os
 
-def crear_socket_servidor(host, port, return_socket=True, stack_disponible=None):
+def _habilitar_reuse_port(sock):
+    # Varios procesos pueden hacer bind al mismo puerto; el kernel reparte las conexiones
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+
+
+def soporta_reuse_port():
+    return hasattr(socket, "SO_REUSEPORT")
+
+
+def crear_socket_servidor(host, port, return_socket=True, stack_disponible=None, reuse_port=False):
     sockets_creados = []
     servidor_v6 = None
     servidor_v4 = None
@@ -18,6 +27,8 @@ def crear_socket_servidor(host, port, return_socket=True, stack_disponible=None)
         try:
             servidor_v6 = socket.socket(socket.AF_INET6, socket.SOCK_STREAM) #IPV6 TCP
             servidor_v6.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1) # Habilita reusar dirección
+            if reuse_port:
+                _habilitar_reuse_port(servidor_v6)
             try:
                 # Separa pilas IPv4/IPv6: evita mapear IPv4 en IPv6
                 servidor_v6.setsockopt(socket.IPPROTO_IPV6, socket.IPV6_V6ONLY, 1)
@@ -84,6 +95,8 @@ def crear_socket_servidor(host, port, return_socket=True, stack_disponible=None)
         try:
             servidor_v4 = socket.socket(socket.AF_INET, socket.SOCK_STREAM)  # IPv4 TCP
             servidor_v4.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)  # Habilita reusar dirección
+            if reuse_port:
+                _habilitar_reuse_port(servidor_v4)
 
             bind_ok = False
 
@@ -190,4 +203,6 @@ def configurar_contexto_ssl(cert_path, key_path):
         logging.error(f"❌ ERROR: No se encontraron los certificados SSL en {cert_path} o {key_path}.")
         return None  # Fallar si no existen los certificados
     contexto.load_cert_chain(certfile=cert_path, keyfile=key_path)  # Cargar certificado y clave privada
+    # kTLS (Python 3.12+ y kernel con el módulo tls): OpenSSL deja el cifrado de los registros al kernel
+    contexto.options |= getattr(ssl, 'OP_ENABLE_KTLS', 0)
     return contexto  # Retornar contexto SSL configurado
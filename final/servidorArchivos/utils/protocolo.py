@@ -0,0 +1,644 @@
+import os
+import re
+import struct
+import hashlib
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+# Protocolo v2 del canal de comandos: frames con longitud prefijada.
+#
+# El protocolo de texto original (v1) sigue siendo el predeterminado. Un cliente
+# que soporta v2 responde al prompt "👤 Usuario: " con SALUDO_V2; si el servidor
+# contesta CONFIRMACION_V2, a partir de ahí todo el tráfico va en frames:
+#
+#   cabecera (12 bytes, big endian) + payload
+#   ┌─────────┬──────┬───────┬────────────┬──────────┐
+#   │ versión │ tipo │ flags │ request_id │ longitud │
+#   │   u8    │  u8  │  u16  │    u32     │   u32    │
+#   └─────────┴──────┴───────┴────────────┴──────────┘
+#
+# Cada COMANDO lleva un request_id elegido por el cliente y se responde con un
+# RESPUESTA (o ERROR) con el mismo id, así que no hace falta adivinar dónde
+# termina una respuesta. Las transferencias (SUBIR/DESCARGAR) intercambian
+# frames DATOS con el id del comando que las inició.
+#
+# Una sesión puede tener varios comandos en vuelo a la vez: el servidor los
+# ejecuta en paralelo y responde cada uno cuando termina, así que las respuestas
+# (y los DATOS de transferencias simultáneas) pueden llegar en cualquier orden.
+
+VERSION = 2
+CABECERA = struct.Struct('!BBHII')
+MAX_PAYLOAD = 16 * 1024 * 1024  # 16 MB por frame
+
+# Tipos de mensaje
+COMANDO = 1      # cliente -> servidor: texto del comando
+RESPUESTA = 2    # servidor -> cliente: respuesta final del comando
+DATOS = 3        # ambos sentidos: mensajes y bytes de una transferencia
+ERROR = 4        # servidor -> cliente: error del protocolo o de autenticación
+AUTENTICAR = 5   # cliente -> servidor: "usuario\0contraseña"
+
+# Flags
+FLAG_FINAL = 0x0001  # DATOS vacío con este flag equivale a EOF
+
+# Negociación (sobre el protocolo de texto)
+SALUDO_V2 = "PROTOCOLO 2"
+CONFIRMACION_V2 = "✅ PROTOCOLO 2"
+
+# Prompts del protocolo de texto (ver server/servidor.py)
+PROMPT_USUARIO = "👤 Usuario: "
+PROMPT_CONTRASENA = "🔒 Contraseña: "
+PROMPT_COMANDO = "💻 Ingresar comando ('SALIR' para desconectar): "
+
+# Token de sesión que el servidor agrega a la respuesta de un login exitoso
+MARCA_TOKEN = "🎫 Token: "
+
+# Última línea de una página de "LISTAR cursor límite prefijo" cuando hay más
+MARCA_CURSOR = "🔖 Siguiente página: cursor="
+
+# "SUBIR nombre -": el SHA-256 no va en el comando sino después del contenido
+# (64 caracteres hex), así el cliente lo calcula mientras envía
+HASH_AL_FINAL = "-"
+
+
+class ErrorProtocolo(Exception):
+    """Frame mal formado o inesperado."""
+
+
+def empaquetar_frame(tipo, request_id, payload=b'', flags=0):
+    if isinstance(payload, str):
+        payload = payload.encode('utf-8')
+    return CABECERA.pack(VERSION, tipo, flags, request_id, len(payload)) + payload
+
+
+def desempaquetar_cabecera(cabecera):
+    version, tipo, flags, request_id, longitud = CABECERA.unpack(cabecera)
+    if version != VERSION:
+        raise ErrorProtocolo(f"Versión de protocolo no soportada: {version}")
+    if longitud > MAX_PAYLOAD:
+        raise ErrorProtocolo(f"Frame demasiado grande: {longitud} bytes")
+    return tipo, flags, request_id, longitud
+
+
+def recibir_exacto(conexion, tamaño):
+    partes = []
+    faltan = tamaño
+    while faltan:
+        datos = conexion.recv(min(faltan, 65536))
+        if not datos:
+            raise ConnectionError("Conexión cerrada por el otro extremo")
+        partes.append(datos)
+        faltan -= len(datos)
+    return b''.join(partes)
+
+
+def recibir_frame(conexion):
+    """Retorna (tipo, flags, request_id, payload)."""
+    tipo, flags, request_id, longitud = desempaquetar_cabecera(recibir_exacto(conexion, CABECERA.size))
+    payload = recibir_exacto(conexion, longitud) if longitud else b''
+    return tipo, flags, request_id, payload
+
+
+def enviar_frame(conexion, tipo, request_id, payload=b'', flags=0):
+    conexion.sendall(empaquetar_frame(tipo, request_id, payload, flags))
+
+
+class ConexionEnmarcada:
+    """
+    Canal de una transferencia dentro de una sesión v2. Expone sendall/recv como
+    un socket, de modo que `crear_archivo`/`descargar_archivo` (y los clientes)
+    funcionan sin cambios: cada sendall viaja como un frame DATOS y cada recv
+    devuelve bytes de un único frame, por lo que nunca mezcla dos mensajes.
+    """
+
+    def __init__(self, conexion, request_id, lector=None, escritor=None):
+        self._conexion = conexion
+        self.request_id = request_id
+        self._lector = lector or (lambda: recibir_frame(self._conexion))
+        self._escritor = escritor or (lambda frame: self._conexion.sendall(frame))
+        self._pendiente = b''
+        self._fin = False
+        self.respuesta_final = None
+
+    def sendall(self, datos):
+        self._escritor(empaquetar_frame(DATOS, self.request_id, bytes(datos)))
+
+    def recv(self, tamaño):
+        if not self._pendiente:
+            if self._fin:
+                return b''
+            tipo, flags, request_id, payload = self._lector()
+            if request_id != self.request_id:
+                raise ErrorProtocolo(f"Frame para el request {request_id} durante la transferencia {self.request_id}")
+            if tipo in (RESPUESTA, ERROR):
+                # El otro extremo terminó el comando (p. ej. un error antes de transferir)
+                self.respuesta_final = payload.decode('utf-8', errors='replace')
+                self._fin = True
+            elif tipo != DATOS:
+                raise ErrorProtocolo(f"Tipo de frame inesperado durante la transferencia: {tipo}")
+            elif flags & FLAG_FINAL and not payload:
+                self._fin = True
+                return b''
+            self._pendiente = payload
+        datos, self._pendiente = self._pendiente[:tamaño], self._pendiente[tamaño:]
+        return datos
+
+    def settimeout(self, timeout):
+        self._conexion.settimeout(timeout)
+
+    def gettimeout(self):
+        return self._conexion.gettimeout()
+
+    def getpeername(self):
+        return self._conexion.getpeername()
+
+
+class ClienteProtocolo:
+    """
+    Lado cliente de una sesión. Negocia v2 y, si el servidor no lo soporta, sigue
+    con el protocolo de texto delimitando cada respuesta por el prompt siguiente.
+
+    En v2 varios hilos pueden usar la misma sesión: cada frame recibido se deja
+    en el buzón de su request_id y lo retira el hilo que espera ese id.
+    """
+
+    def __init__(self, conexion):
+        self.conexion = conexion
+        self.version = 1
+        self._ultimo_id = 0
+        self._lock_id = threading.Lock()
+        self._lock_envio = threading.Lock()
+        self._cond = threading.Condition()
+        self._leyendo = False
+        self._buzones = {}  # request_id -> deque de frames aún no consumidos
+        self.token = None   # Token de sesión recibido al autenticarse
+
+    # --- negociación y autenticación ---
+
+    def negociar(self):
+        """Retorna True si la sesión quedó en v2."""
+        self._leer_texto_hasta(PROMPT_USUARIO)
+        self.conexion.sendall(SALUDO_V2.encode('utf-8'))
+        respuesta = self._leer_texto_hasta("\n", PROMPT_CONTRASENA)
+        if respuesta.startswith(CONFIRMACION_V2):
+            self.version = VERSION
+            return True
+
+        # Servidor sin v2: tomó el saludo como usuario; descartar ese intento
+        self.conexion.sendall(b"-")
+        self._leer_texto_hasta(PROMPT_USUARIO)
+        return False
+
+    def autenticar(self, usuario, password):
+        """Retorna (exito, mensaje)."""
+        if self.version == VERSION:
+            request_id = self._enviar(AUTENTICAR, f"{usuario}\0{password}")
+            tipo, _, texto = self.esperar_respuesta(request_id)
+            return self._resultado_autenticacion(tipo == RESPUESTA and "✅" in texto, texto)
+
+        self.conexion.sendall(usuario.encode('utf-8'))
+        self._leer_texto_hasta(PROMPT_CONTRASENA)
+        self.conexion.sendall(password.encode('utf-8'))
+        texto = self._leer_texto_hasta(PROMPT_COMANDO, PROMPT_USUARIO)
+        exito = "✅ Autenticación exitosa" in texto
+        return self._resultado_autenticacion(exito, _quitar_prompts(texto))
+
+    def autenticar_token(self, token):
+        """AUTH TOKEN con el token de un login anterior. Retorna (exito, mensaje)."""
+        comando = f"AUTH TOKEN {token}"
+        if self.version == VERSION:
+            tipo, _, texto = self.esperar_respuesta(self._enviar(COMANDO, comando))
+            return self._resultado_autenticacion(tipo == RESPUESTA and "✅" in texto, texto)
+
+        self.conexion.sendall(comando.encode('utf-8'))
+        texto = self._leer_texto_hasta(PROMPT_COMANDO, PROMPT_USUARIO, PROMPT_CONTRASENA)
+        if texto.endswith(PROMPT_CONTRASENA):
+            # Servidor sin tokens: tomó el comando como usuario; descartar ese intento
+            self.conexion.sendall(b"-")
+            texto = self._leer_texto_hasta(PROMPT_USUARIO)
+            return False, _quitar_prompts(texto)
+        exito = "✅ Autenticación exitosa" in texto
+        return self._resultado_autenticacion(exito, _quitar_prompts(texto))
+
+    def _resultado_autenticacion(self, exito, texto):
+        if exito:
+            self.token = extraer_token(texto) or self.token
+        return exito, texto
+
+    def registrar(self, usuario, password):
+        """REGISTRAR antes de autenticarse."""
+        comando = f"REGISTRAR {usuario} {password}"
+        if self.version == VERSION:
+            return self.comando(comando)
+        self.conexion.sendall(comando.encode('utf-8'))
+        return _quitar_prompts(self._leer_texto_hasta(PROMPT_USUARIO))
+
+    # --- comandos ---
+
+    def comando(self, texto):
+        """Envía un comando y retorna el texto completo de su respuesta."""
+        if self.version == VERSION:
+            request_id = self.enviar_comando(texto)
+            return self.esperar_respuesta(request_id)[2]
+
+        self.conexion.sendall(texto.encode('utf-8'))
+        if texto.strip().upper() == "SALIR":
+            return _quitar_prompts(self._leer_texto_hasta("\n"))
+        # Antes de autenticarse (p. ej. REGISTRAR) el servidor vuelve al prompt de usuario
+        return _quitar_prompts(self._leer_texto_hasta(PROMPT_COMANDO, PROMPT_USUARIO))
+
+    def pipeline(self, comandos):
+        """
+        Envía todos los comandos sin esperar y retorna sus respuestas en el mismo
+        orden. En v2 el servidor los ejecuta en paralelo; en v1 van uno por uno.
+        """
+        if self.version != VERSION:
+            return [self.comando(texto) for texto in comandos]
+        ids = [self.enviar_comando(texto) for texto in comandos]
+        return [self.esperar_respuesta(request_id)[2] for request_id in ids]
+
+    def enviar_comando(self, texto):
+        """Envía un COMANDO v2 sin esperar la respuesta; retorna su request_id."""
+        return self._enviar(COMANDO, texto)
+
+    def esperar_respuesta(self, request_id):
+        """Lee frames hasta la respuesta final de `request_id`: (tipo, flags, texto)."""
+        try:
+            while True:
+                tipo, flags, _, payload = self._recibir_para(request_id)
+                if tipo in (RESPUESTA, ERROR):
+                    return tipo, flags, payload.decode('utf-8', errors='replace')
+                # DATOS sueltos de una transferencia abandonada: se descartan
+        finally:
+            with self._cond:
+                self._buzones.pop(request_id, None)
+
+    def transferencia(self, texto):
+        """
+        Inicia SUBIR/DESCARGAR y retorna el canal sobre el que se hace el
+        intercambio (sendall/recv), idéntico en v1 y v2.
+        """
+        if self.version == VERSION:
+            request_id = self.enviar_comando(texto)
+            return ConexionEnmarcada(self.conexion, request_id,
+                                     lector=lambda: self._recibir_para(request_id),
+                                     escritor=self._escribir)
+        self.conexion.sendall(texto.encode('utf-8'))
+        return self.conexion
+
+    def finalizar_transferencia(self, canal):
+        """Retorna la respuesta final del servidor a una transferencia."""
+        if isinstance(canal, ConexionEnmarcada):
+            if canal.respuesta_final is not None:
+                with self._cond:
+                    self._buzones.pop(canal.request_id, None)
+                return canal.respuesta_final
+            return self.esperar_respuesta(canal.request_id)[2]
+        return _quitar_prompts(self._leer_texto_hasta(PROMPT_COMANDO))
+
+    def descargar(self, nombre):
+        """Descarga `nombre` completo en memoria. Retorna (contenido o None, respuesta)."""
+        canal, info = self.abrir_descarga(nombre)
+        if canal is None:
+            return None, info
+        bloques = self.leer_descarga(canal, info['bytes'])
+        partes = []
+        while True:
+            try:
+                partes.append(next(bloques))
+            except StopIteration as fin:
+                return b''.join(partes), fin.value
+            except ConnectionError as error:
+                return None, str(error)
+
+    def abrir_descarga(self, nombre, desde=None, longitud=None):
+        """
+        Inicia DESCARGAR (del byte `desde`, `longitud` bytes; negativo: los
+        últimos bytes) y confirma al servidor. Retorna (canal, info) si va a
+        enviar el archivo, con info = {'bytes', 'desde', 'total', 'mtime_ns'},
+        o (None, respuesta) si no.
+        """
+        comando = f'DESCARGAR "{nombre}"'
+        if desde is not None:
+            comando += f" {desde}" if longitud is None else f" {desde} {longitud}"
+        canal = self.transferencia(comando)
+        encabezado = canal.recv(4096).decode('utf-8', errors='replace')
+        coincidencia = re.search(r"\((\d+) bytes\)", encabezado)
+        if "Listo para enviar" not in encabezado or not coincidencia:
+            if canal is self.conexion:
+                if not encabezado.endswith(PROMPT_COMANDO):
+                    encabezado += self._leer_texto_hasta(PROMPT_COMANDO)
+                return None, _quitar_prompts(encabezado)
+            return None, self.finalizar_transferencia(canal)
+
+        canal.sendall(b"LISTO")
+        tamaño = int(coincidencia.group(1))
+        # Servidores anteriores solo informan el tamaño (y envían el archivo completo)
+        campos = dict(re.findall(r"(desde|total|mtime_ns)=(\d+)", encabezado))
+        return canal, {
+            'bytes': tamaño,
+            'desde': int(campos.get('desde', 0)),
+            'total': int(campos.get('total', tamaño)),
+            'mtime_ns': int(campos['mtime_ns']) if 'mtime_ns' in campos else None,
+        }
+
+    def leer_descarga(self, canal, tamaño, bloque=65536):
+        """
+        Generador de los bloques de una descarga abierta con abrir_descarga, a
+        medida que llegan. Al terminar confirma la recepción y cierra el comando;
+        si el servidor corta antes, lanza ConnectionError. Retorna la respuesta
+        final del servidor.
+        """
+        recibidos = 0
+        while recibidos < tamaño:
+            datos = canal.recv(min(bloque, tamaño - recibidos))
+            if not datos:
+                break
+            recibidos += len(datos)
+            yield datos
+        canal.sendall(f"✅ Recibido ({recibidos} bytes)".encode('utf-8'))
+        respuesta = self.finalizar_transferencia(canal)
+        if recibidos != tamaño:
+            raise ConnectionError(f"Descarga incompleta ({recibidos} de {tamaño} bytes): {respuesta}")
+        return respuesta
+
+    def subir(self, nombre, origen, tamaño, bloque=256 * 1024, sha256=None):
+        """
+        Sube `tamaño` bytes leídos de `origen` (cualquier objeto con read) sin
+        guardarlos ni leerlos dos veces: el SHA-256 se calcula mientras se envía
+        y el servidor lo compara antes de registrar el archivo.
+
+        Con `sha256` (ya conocido) va en el comando: si el servidor tiene ese
+        contenido lo enlaza sin pedir ningún byte, y si no, lo recibe y lo
+        verifica contra ese hash como `SUBIR nombre sha256`.
+        Retorna (exito, respuesta).
+        """
+        canal = self.transferencia(f'SUBIR "{nombre}" {sha256 or HASH_AL_FINAL}')
+        encabezado = canal.recv(4096).decode('utf-8', errors='replace')
+        if "Listo para recibir" not in encabezado:
+            respuesta = self._respuesta_transferencia(canal, encabezado)
+            return "✅" in respuesta and "❌" not in respuesta, respuesta
+
+        canal.sendall(str(tamaño).encode('utf-8'))
+        hasher = hashlib.sha256()
+        enviados = 0
+        while enviados < tamaño:
+            datos = origen.read(min(bloque, tamaño - enviados))
+            if not datos:
+                # La sesión queda a mitad de la transferencia: quien llama debe cerrarla
+                raise ConnectionError(f"El origen terminó antes de tiempo ({enviados} de {tamaño} bytes)")
+            hasher.update(datos)
+            canal.sendall(datos)
+            enviados += len(datos)
+        if not sha256:
+            canal.sendall(hasher.hexdigest().encode('ascii'))
+
+        respuesta = self._respuesta_transferencia(canal, canal.recv(4096).decode('utf-8', errors='replace'))
+        return "✅" in respuesta and "❌" not in respuesta, respuesta
+
+    def _respuesta_transferencia(self, canal, recibido):
+        """Completa la respuesta de una transferencia de la que ya se leyó `recibido`."""
+        if canal is self.conexion:
+            if not recibido.endswith(PROMPT_COMANDO):
+                recibido += self._leer_texto_hasta(PROMPT_COMANDO)
+            # Tras el mensaje de la transferencia llega la respuesta vacía del comando
+            return _quitar_prompts(recibido).replace("📄 None", "").strip()
+        final = self.finalizar_transferencia(canal)
+        return recibido if final in ("", "None", recibido) else final
+
+    def descargar_en_paralelo(self, nombres, max_hilos=4):
+        """
+        Descarga varios archivos sobre esta misma sesión. En v2 las transferencias
+        avanzan a la vez (frames DATOS intercalados); en v1 se hacen en secuencia.
+        Retorna {nombre: (contenido o None, respuesta)}.
+        """
+        if self.version != VERSION or len(nombres) < 2:
+            return {nombre: self.descargar(nombre) for nombre in nombres}
+        with ThreadPoolExecutor(max_workers=min(max_hilos, len(nombres))) as ejecutor:
+            return dict(zip(nombres, ejecutor.map(self.descargar, nombres)))
+
+    def listar_pagina(self, cursor=None, limite=None, prefijo=None, orden=None):
+        """
+        Una página de LISTAR. `orden`: nombre, tamaño o fecha, con "-" adelante
+        para descendente. Retorna ([(nombre, tamaño, fecha)], cursor de la
+        siguiente o None) o (None, respuesta) si el servidor devolvió un error.
+        """
+        # "-" deja el cursor al principio y el límite en el predeterminado del servidor
+        argumentos = [cursor or "-", str(limite) if limite else "-"]
+        if prefijo or orden:
+            argumentos.append(f'"{prefijo or ""}"')
+        if orden:
+            argumentos.append(orden)
+        respuesta = self.comando("LISTAR " + " ".join(argumentos))
+        if respuesta.startswith(("❌", "⚠️", "⛔")):
+            return None, respuesta
+        archivos, siguiente = [], None
+        for linea in respuesta.splitlines():
+            if linea.startswith(MARCA_CURSOR):
+                siguiente = linea[len(MARCA_CURSOR):].strip()
+            elif not linea.startswith("📂"):
+                # "nombre con espacios 123 2024-01-01 10:00:00": el nombre es lo que queda a la izquierda
+                nombre, tamaño, fecha, hora = linea.rsplit(" ", 3)
+                archivos.append((nombre, int(tamaño), f"{fecha} {hora}"))
+        return archivos, siguiente
+
+    def info_archivo(self, nombre):
+        """
+        Metadatos de INFO: {'sha256_esperado', 'sha256_calculado', 'usuario',
+        'creado', 'actualizado', 'verificacion'}, con None donde el servidor no
+        tiene el dato. None si el archivo no existe o el servidor no tiene INFO.
+        """
+        respuesta = self.comando(f'INFO "{nombre}"')
+        if not respuesta.startswith("🧾"):
+            return None
+        campos = re.findall(r"^\s*• (\w+): (.*)$", respuesta, re.MULTILINE)
+        return {clave: None if valor.strip() == "-" else valor.strip() for clave, valor in campos}
+
+    def abrir_subida(self, nombre, tamaño, sha256=None):
+        """
+        Abre una subida por bloques. Retorna ({'id', 'bloque', 'bloques'}, respuesta)
+        o (None, respuesta) si el servidor la rechazó o ya tenía ese contenido.
+        """
+        comando = f'SUBIDA_ABRIR "{nombre}" {tamaño}' + (f" {sha256}" if sha256 else "")
+        respuesta = self.comando(comando)
+        datos = re.search(r"id=([0-9a-f]+) bloque=(\d+) bloques=(\d+)", respuesta)
+        if not datos:
+            return None, respuesta
+        return {'id': datos.group(1), 'bloque': int(datos.group(2)), 'bloques': int(datos.group(3))}, respuesta
+
+    def subir_bloque(self, id_subida, numero, datos):
+        """Envía el bloque `numero` con su SHA-256. Retorna (exito, respuesta)."""
+        canal = self.transferencia(f"SUBIDA_BLOQUE {id_subida} {numero} {hashlib.sha256(datos).hexdigest()}")
+        encabezado = canal.recv(4096).decode('utf-8', errors='replace')
+        if "Listo para recibir" not in encabezado:
+            return False, self._respuesta_transferencia(canal, encabezado)
+        longitud = int(re.search(r"\((\d+) bytes\)", encabezado).group(1))
+        if longitud != len(datos):
+            # La sesión queda a mitad de la transferencia: quien llama debe cerrarla
+            raise ValueError(f"El bloque {numero} debe tener {longitud} bytes, no {len(datos)}")
+        vista = memoryview(datos)
+        for desde in range(0, len(datos), 256 * 1024):
+            canal.sendall(vista[desde:desde + 256 * 1024])
+        respuesta = self._respuesta_transferencia(canal, "")
+        return "✅" in respuesta and "❌" not in respuesta, respuesta
+
+    def estado_subida(self, id_subida):
+        """{'bloque', 'faltan'} de una subida abierta, o None si no existe."""
+        respuesta = self.comando(f"SUBIDA_ESTADO {id_subida}")
+        datos = re.search(r"bloque=(\d+) recibidos=\S+ faltan=(\S+)", respuesta)
+        if not datos:
+            return None
+        return {'bloque': int(datos.group(1)), 'faltan': _expandir_rangos(datos.group(2))}
+
+    def finalizar_subida(self, id_subida):
+        respuesta = self.comando(f"SUBIDA_FINALIZAR {id_subida}")
+        return "✅" in respuesta and "❌" not in respuesta, respuesta
+
+    def subir_archivo_por_bloques(self, nombre, ruta, id_subida=None, max_hilos=4):
+        """
+        Sube el archivo local `ruta` por bloques. Con `id_subida` retoma una subida
+        ya abierta y envía solo los bloques que faltan. En v2 los bloques viajan a
+        la vez sobre esta sesión (hasta `max_hilos`); en v1 van en secuencia.
+        Retorna (exito, respuesta, id_subida).
+        """
+        if id_subida is None:
+            hasher = hashlib.sha256()
+            with open(ruta, 'rb') as f:
+                for datos in iter(lambda: f.read(1024 * 1024), b''):
+                    hasher.update(datos)
+            sesion, respuesta = self.abrir_subida(nombre, os.path.getsize(ruta), hasher.hexdigest())
+            if sesion is None:
+                # Sin sesión: rechazada o el servidor ya tenía el contenido
+                return "✅" in respuesta and "❌" not in respuesta, respuesta, None
+            tam_bloque, faltan = sesion['bloque'], range(sesion['bloques'])
+            id_subida = sesion['id']
+        else:
+            estado = self.estado_subida(id_subida)
+            if estado is None:
+                return False, f"❌ La subida {id_subida} no existe o venció.", id_subida
+            tam_bloque, faltan = estado['bloque'], estado['faltan']
+
+        fd = os.open(ruta, os.O_RDONLY)
+        try:
+            def enviar(numero):
+                return self.subir_bloque(id_subida, numero, os.pread(fd, tam_bloque, numero * tam_bloque))
+
+            if self.version != VERSION or max_hilos <= 1:
+                resultados = [enviar(numero) for numero in faltan]
+            else:
+                with ThreadPoolExecutor(max_workers=max_hilos) as ejecutor:
+                    resultados = list(ejecutor.map(enviar, faltan))
+        finally:
+            os.close(fd)
+
+        fallidos = [respuesta for exito, respuesta in resultados if not exito]
+        if fallidos:
+            return False, fallidos[0], id_subida
+        exito, respuesta = self.finalizar_subida(id_subida)
+        return exito, respuesta, id_subida
+
+    def cerrar(self):
+        try:
+            if self.version == VERSION:
+                self._enviar(COMANDO, "SALIR")
+            else:
+                self.conexion.sendall(b"SALIR")
+        except OSError:
+            pass
+        finally:
+            try:
+                self.conexion.close()
+            except OSError:
+                pass
+
+    # --- utilidades ---
+
+    def _nuevo_id(self):
+        with self._lock_id:
+            self._ultimo_id = (self._ultimo_id % 0xFFFFFFFF) + 1
+            return self._ultimo_id
+
+    def _enviar(self, tipo, payload, request_id=None):
+        """Envía un frame (uno a la vez sobre el socket TLS); retorna su request_id."""
+        if request_id is None:
+            request_id = self._nuevo_id()
+            with self._cond:
+                self._buzones[request_id] = deque()
+        self._escribir(empaquetar_frame(tipo, request_id, payload))
+        return request_id
+
+    def _escribir(self, frame):
+        with self._lock_envio:
+            self.conexion.sendall(frame)
+
+    def _recibir_para(self, request_id):
+        """
+        Retorna el siguiente frame de `request_id`. Un solo hilo lee del socket a
+        la vez y reparte lo que llega en los buzones; los demás esperan el suyo.
+        """
+        while True:
+            with self._cond:
+                while True:
+                    buzon = self._buzones.get(request_id)
+                    if buzon:
+                        return buzon.popleft()
+                    if not self._leyendo:
+                        self._leyendo = True
+                        break
+                    self._cond.wait()
+            try:
+                frame = recibir_frame(self.conexion)
+            except BaseException:
+                with self._cond:
+                    self._leyendo = False
+                    self._cond.notify_all()
+                raise
+            with self._cond:
+                self._leyendo = False
+                self._cond.notify_all()
+                # id 0: error de la sesión, lo recibe quien estaba esperando
+                destino = frame[2] or request_id
+                if destino == request_id:
+                    return frame
+                if destino in self._buzones:
+                    self._buzones[destino].append(frame)
+
+    def _leer_texto_hasta(self, *marcadores):
+        """Lee del protocolo de texto hasta que el buffer termina en alguno de los marcadores."""
+        finales = [m.encode('utf-8') for m in marcadores]
+        buffer = b''
+        while not any(buffer.endswith(final) for final in finales):
+            datos = self.conexion.recv(4096)
+            if not datos:
+                raise ConnectionError("Conexión cerrada por el servidor")
+            buffer += datos
+        return buffer.decode('utf-8', errors='replace')
+
+
+def extraer_token(texto):
+    """Token de sesión incluido en la respuesta de un login, o None."""
+    for linea in texto.splitlines():
+        if linea.strip().startswith(MARCA_TOKEN):
+            return linea.strip()[len(MARCA_TOKEN):].strip() or None
+    return None
+
+
+def _expandir_rangos(texto):
+    """'0-2,5,7-8' -> [0, 1, 2, 5, 7, 8] ('-' es la lista vacía)."""
+    numeros = []
+    for parte in texto.split(","):
+        if parte in ("", "-"):
+            continue
+        inicio, _, fin = parte.partition("-")
+        numeros.extend(range(int(inicio), int(fin or inicio) + 1))
+    return numeros
+
+
+def _quitar_prompts(texto):
+    for prompt in (PROMPT_COMANDO, PROMPT_USUARIO, PROMPT_CONTRASENA):
+        if texto.endswith(prompt):
+            texto = texto[:-len(prompt)]
+    texto = texto.strip()
+    if texto.startswith("📄"):
+        texto = texto[len("📄"):].strip()
+    return texto